@@ -2,29 +2,52 @@ import asyncio
 import threading
 
 from server import run_flask
-from create_bot import (bot, dp, scheduler, create_backup, remove_menu,
-                        update_admins, check_users_status_task, save_stats)
+from create_bot import (bot, dp, db, broadcaster, catalog, scheduler, create_backup, remove_menu,
+                        update_admins, check_users_status_task, save_stats, precompute_recommendations,
+                        refresh_popular_recommendations, log_recommendation_timings)
 
 from handlers.main_panel import main_panel_router
 from handlers.admin_panel import admin_panel_router
+from handlers.main_panel.recommendation import rec_sys
+from handlers.admin_panel.broadcast import show_broadcast_progress, send_broadcast_report
 
 from db_handler.db_setup import init_db
 from db_handler.db_utils import DBUtils
-from db_handler.db_utils import Database
+from db_handler.cache_listener import CacheListener
+from middlewares.db_session import DBSessionMiddleware
 
 
 async def start_bot():
     if not scheduler.running:
         scheduler.start()
 
+    # Модель загружается в фоне уже после старта polling, до готовности рекомендации
+    # строятся по сохранённым эмбеддингам
+    rec_sys.start_warm_up()
+
+    # Рассылки, прерванные остановкой бота, продолжаются с неотправленных получателей
+    await broadcaster.resume(on_progress=show_broadcast_progress, on_done=send_broadcast_report)
+
 
 async def main():
     await init_db()  # Инициализируем БД
-    db = Database()
-    db_utils = DBUtils(db=db, bot=bot)
+    await db.connect()  # Единый пул на всё время работы бота
+    db_utils = DBUtils(db=db, bot=bot, catalog=catalog)
     await update_admins(db_utils)
     await remove_menu(bot)
+
+    # Изменения каталога и ролей, сделанные другими процессами, приходят через LISTEN/NOTIFY
+    cache_listener = CacheListener(db)
+    cache_listener.subscribe('catalog', catalog.invalidate)
+    cache_listener.subscribe('catalog', rec_sys.invalidate)
+    # Вызывается и при подключении слушателя: популярные подборки готовы сразу после старта, без модели
+    cache_listener.subscribe('catalog', lambda version: refresh_popular_recommendations(rec_sys))
+    cache_listener.subscribe('roles', lambda version: update_admins(db_utils))
+    cache_listener.start()
     
+    # Не более одного соединения из пула на апдейт, DBUtils передаётся обработчикам аргументом db_utils
+    dp.update.middleware(DBSessionMiddleware(db=db, bot=bot, catalog=catalog))
+
     # Регистрация роутеров
     dp.include_router(main_panel_router)
     dp.include_router(admin_panel_router)
@@ -55,12 +78,41 @@ async def main():
         minute=2,
         misfire_grace_time=60
     )
+
+    scheduler.add_job(
+        precompute_recommendations,
+        'cron',
+        hour=4,
+        minute=3,
+        misfire_grace_time=60,
+        args=[rec_sys]
+    )
+
+    scheduler.add_job(
+        refresh_popular_recommendations,
+        'interval',
+        hours=1,
+        misfire_grace_time=60,
+        args=[rec_sys]
+    )
+
+    scheduler.add_job(
+        log_recommendation_timings,
+        'interval',
+        hours=1,
+        misfire_grace_time=60,
+        args=[rec_sys]
+    )
     
     # Запуск бота в режиме long polling при запуске бот очищает все обновления, которые были за его моменты бездействия
     try:
         await bot.delete_webhook(drop_pending_updates=True)
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        await broadcaster.stop()
+        await cache_listener.stop()
+        rec_sys.close()
+        await db.close()
         await bot.session.close()
         
 
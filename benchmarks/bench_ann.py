@@ -0,0 +1,103 @@
+"""
+Поиск ближайших тем: точный перебор против ANN-индексов (IVF на NumPy и HNSW из hnswlib, если установлен).
+Для каждого варианта — время построения, задержка одного запроса (поиск + пересчёт косинуса по кандидатам,
+как в RecommendationSystem._cos_sim_sync) и recall@10 относительно точного перебора.
+
+Эмбеддинги синтетические, сгруппированные вокруг центров: у реальных подтем близкие формулировки
+тоже образуют кластеры, а на равномерном шуме никакой ANN-индекс не работает.
+
+Запуск:
+    python -m benchmarks.bench_ann --themes 100000 --queries 200
+"""
+import argparse
+import time
+
+import numpy as np
+
+from recommendation_system import ann
+from recommendation_system.model import CANDIDATE_THEMES, RecommendationSystem
+
+DIM = 512
+
+
+def make_embeddings(themes: int, clusters: int, seed: int = 0):
+    """Эмбеддинги тем и номер кластера каждой темы"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, DIM), dtype=np.float32)
+    labels = rng.integers(clusters, size=themes)
+    embeddings = centers[labels]
+    embeddings += 0.5 * rng.standard_normal((themes, DIM), dtype=np.float32)
+    return embeddings, labels
+
+
+def make_queries(embeddings: np.ndarray, labels: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """Профиль пользователя — среднее 12 тем из истории, просмотренных в двух кластерах (интересах)"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for _ in range(count):
+        interests = rng.choice(labels, size=2, replace=False)
+        rows = np.flatnonzero(np.isin(labels, interests))
+        queries.append(embeddings[rng.choice(rows, size=12)].mean(axis=0))
+    return np.stack(queries)
+
+
+def top_ids(rows, scores: np.ndarray, k: int) -> set:
+    top = RecommendationSystem._top_k(scores, k)
+    return set((top if rows is None else rows[top]).tolist())
+
+
+def measure(name: str, index, embeddings, norms, queries, truth, build_ms: float) -> None:
+    found = []
+    started = time.perf_counter()
+    for query in queries:
+        rows, scores = RecommendationSystem._cos_sim_sync(query, embeddings, norms, index, CANDIDATE_THEMES)
+        found.append(top_ids(rows, scores, CANDIDATE_THEMES))
+    latency = (time.perf_counter() - started) / len(queries) * 1e3
+
+    recall = np.mean([len(f & t) / CANDIDATE_THEMES for f, t in zip(found, truth)]) if truth else 1.0
+    print(f"{name:<22} построение {build_ms:9.0f} мс   запрос {latency:7.3f} мс   recall@10 {recall:.3f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--themes", type=int, default=100000)
+    parser.add_argument("--clusters", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    embeddings, labels = make_embeddings(args.themes, args.clusters)
+    norms = np.linalg.norm(embeddings, axis=1).astype(np.float32)
+    queries = make_queries(embeddings, labels, args.queries)
+
+    truth = []
+    for query in queries:
+        rows, scores = RecommendationSystem._cos_sim_sync(query, embeddings, norms)
+        truth.append(top_ids(rows, scores, CANDIDATE_THEMES))
+    measure("exact", None, embeddings, norms, queries, None, 0)
+
+    started = time.perf_counter()
+    ivf = ann.IVFIndex.build(embeddings, norms)
+    build_ms = (time.perf_counter() - started) * 1e3
+    for nprobe in (8, 16, 32, 64):
+        ivf.nprobe = min(nprobe, len(ivf.centroids))
+        measure(f"ivf nlist={len(ivf.centroids)} nprobe={ivf.nprobe}", ivf, embeddings, norms, queries, truth, build_ms)
+
+    started = time.perf_counter()
+    ann.IVFIndex.build(embeddings, norms, centroids=ivf.centroids)
+    print(f"ivf: переназначение без обучения {(time.perf_counter() - started) * 1e3:.0f} мс")
+
+    if ann.hnswlib is None:
+        print("hnswlib не установлен, HNSW пропущен")
+        return
+
+    started = time.perf_counter()
+    hnsw = ann.HNSWIndex.build(embeddings)
+    build_ms = (time.perf_counter() - started) * 1e3
+    for ef in (32, 64, 128, 256):
+        hnsw.index.set_ef(ef)
+        hnsw.ef = ef
+        measure(f"hnsw ef={ef}", hnsw, embeddings, norms, queries, truth, build_ms)
+
+
+if __name__ == "__main__":
+    main()
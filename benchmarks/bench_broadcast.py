@@ -0,0 +1,133 @@
+"""
+Рассылка через BroadcastEngine против прежнего последовательного цикла (send + sleep(0.1)).
+
+Telegram подменён сессией aiogram в памяти: каждый запрос отвечает с задержкой --latency, а больше
+--limit запросов за скользящую секунду получают 429 с retry_after, как flood control Telegram.
+Ответы разбираются самим aiogram, так что TelegramRetryAfter приходит в движок тем же путём, что и в проде.
+Задания рассылки хранятся в памяти вместо Postgres.
+Прогон с --rate выше лимита показывает адаптивное снижение скорости после flood wait.
+
+Запуск:
+    python -m benchmarks.bench_broadcast --messages 1500 --serial 100 --latency 0.08
+"""
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+
+from broadcast_system.engine import BROADCAST_CONCURRENCY, BROADCAST_RATE, BroadcastEngine
+from db_handler import queries
+
+TOKEN = '123456:' + 'A' * 35
+
+
+class FakeTelegramSession(BaseSession):
+    """Ответы Bot API из памяти с задержкой и ограничением числа запросов в секунду"""
+
+    def __init__(self, latency: float, limit: int, retry_after: int = 1):
+        super().__init__()
+        self.latency = latency
+        self.limit = limit
+        self.retry_after = retry_after
+        self.requests = deque()
+        self.rejected = 0
+
+    async def make_request(self, bot, method, timeout=None):
+        await asyncio.sleep(self.latency)
+        now = time.monotonic()
+        while self.requests and self.requests[0] <= now - 1:
+            self.requests.popleft()
+
+        if len(self.requests) >= self.limit:
+            self.rejected += 1
+            content = {'ok': False, 'error_code': 429,
+                       'description': f'Too Many Requests: retry after {self.retry_after}',
+                       'parameters': {'retry_after': self.retry_after}}
+            return self.check_response(bot, method, 429, json.dumps(content)).result
+
+        self.requests.append(now)
+        content = {'ok': True, 'result': {'message_id': 1, 'date': int(now),
+                                          'chat': {'id': method.chat_id, 'type': 'private'}, 'text': 'x'}}
+        return self.check_response(bot, method, 200, json.dumps(content)).result
+
+    async def stream_content(self, *args, **kwargs):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class FakeDB:
+    """Задания рассылки в памяти: запросы BroadcastEngine без Postgres"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.pending = {}
+
+    async def fetchval(self, query, *args):
+        if query != queries.CREATE_BROADCAST_JOB:
+            return 0
+        admin_id, content_type, content, chat_ids = args
+        job_id = len(self.jobs) + 1
+        self.jobs[job_id] = {'admin_id': admin_id, 'content_type': content_type, 'content': content,
+                             'status_message_id': None}
+        self.pending[job_id] = deque(chat_ids)
+        return job_id
+
+    async def fetchrow(self, query, job_id):
+        return self.jobs[job_id]
+
+    async def fetch(self, query, *args):
+        if query == queries.CLAIM_BROADCAST_RECIPIENTS:
+            pending = self.pending[args[0]]
+            return [{'user_id': pending.popleft()} for _ in range(min(args[1], len(pending)))]
+        return []
+
+    async def execute(self, query, *args):
+        pass
+
+
+async def serial(bot: Bot, chat_ids) -> float:
+    """Прежний цикл из handle_broadcast_confirmation"""
+    started = time.monotonic()
+    for chat_id in chat_ids:
+        try:
+            await bot.send_message(chat_id=chat_id, text='Рассылка')
+            await asyncio.sleep(0.1)
+        except Exception:
+            pass
+    return time.monotonic() - started
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=1500)
+    parser.add_argument('--serial', type=int, default=100, help='Сообщений для последовательного цикла')
+    parser.add_argument('--latency', type=float, default=0.08, help='Время ответа Bot API, с')
+    parser.add_argument('--limit', type=int, default=30, help='Запросов в секунду до 429')
+    parser.add_argument('--rate', type=float, default=40, help='Скорость второго прогона, выше лимита')
+    args = parser.parse_args()
+
+    session = FakeTelegramSession(args.latency, args.limit)
+    bot = Bot(TOKEN, session=session)
+
+    elapsed = await serial(bot, range(args.serial))
+    rate = args.serial / elapsed
+    print(f"последовательно: {rate:.1f} сообщ./с, {args.messages} сообщений заняли бы {args.messages / rate:.0f} с")
+
+    for rate in (BROADCAST_RATE, args.rate):
+        session.rejected = 0
+        engine = BroadcastEngine(bot, FakeDB(), rate=rate, concurrency=BROADCAST_CONCURRENCY)
+        job_id = await engine.create_job(0, range(args.messages), 'text', {'text': 'Рассылка'})
+        report = await engine.run(job_id)
+        print(f"движок, {rate:g}/с: {report.sent_in_run}/{args.messages} за {report.elapsed:.0f} с "
+              f"({report.rate:.1f} сообщ./с), "
+              f"429: {session.rejected}, flood waits: {report.flood_waits}, итоговая скорость {engine.bucket.rate:.1f}/с")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+"""
+Матрица совместных просмотров подтем (CooccurrenceMatrix): построение по всем логам, инкрементальное
+дочитывание новых строк, оценка кандидатов для одного пользователя и для порции ночного пересчёта, память.
+Для сравнения — наивный подсчёт пар словарём Counter на части логов.
+
+Логи синтетические: популярность подтем по закону Ципфа, у пользователя от 1 до 60 просмотров.
+БД не используется: на вход подаются те же массивы (user_id, theme_id), что возвращает GET_THEME_VIEWS_SINCE.
+
+Запуск:
+    python -m benchmarks.bench_cooccurrence --rows 2000000 --users 200000 --themes 20000
+"""
+import argparse
+import itertools
+import statistics
+import time
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from recommendation_system.cooccurrence import CooccurrenceMatrix
+from recommendation_system.model import CANDIDATE_THEMES
+
+
+def make_logs(rows: int, users: int, themes: int, seed: int = 0):
+    """Пары (user_id, theme_id) в порядке log_id"""
+    rng = np.random.default_rng(seed)
+    popularity = 1.0 / np.arange(1, themes + 1) ** 0.8
+    theme_ids = rng.choice(themes, size=rows, p=popularity / popularity.sum()) + 1
+    user_ids = rng.integers(users, size=rows) + 10 ** 9
+    return user_ids, theme_ids
+
+
+def naive_counts(user_ids: np.ndarray, theme_ids: np.ndarray) -> Counter:
+    """Подсчёт пар подтем по множествам просмотров каждого пользователя на чистом Python"""
+    seen = defaultdict(set)
+    for user_id, theme_id in zip(user_ids.tolist(), theme_ids.tolist()):
+        seen[user_id].add(theme_id)
+    pairs = Counter()
+    for themes in seen.values():
+        for x, y in itertools.product(themes, repeat=2):
+            pairs[x, y] += 1
+    return pairs
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, default=2000000)
+    parser.add_argument('--users', type=int, default=200000)
+    parser.add_argument('--themes', type=int, default=20000)
+    parser.add_argument('--increment', type=int, default=10000, help='Новых строк логов за одно дочитывание')
+    parser.add_argument('--naive-rows', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    user_ids, theme_ids = make_logs(args.rows + args.increment, args.users, args.themes)
+    base_users, base_themes = user_ids[:args.rows], theme_ids[:args.rows]
+
+    started = time.perf_counter()
+    naive_counts(base_users[:args.naive_rows], base_themes[:args.naive_rows])
+    naive_s = time.perf_counter() - started
+    print(f"наивный Counter: {args.naive_rows} строк за {naive_s:.1f} с")
+
+    matrix = CooccurrenceMatrix()
+    started = time.perf_counter()
+    matrix.update(base_users[:args.naive_rows], base_themes[:args.naive_rows], args.naive_rows)
+    print(f"разреженная матрица: {args.naive_rows} строк за {time.perf_counter() - started:.1f} с")
+
+    matrix = CooccurrenceMatrix()
+    started = time.perf_counter()
+    matrix.update(base_users, base_themes, args.rows)
+    print(f"построение: {args.rows} строк за {time.perf_counter() - started:.1f} с, "
+          f"{matrix.nnz} ненулевых пар")
+
+    started = time.perf_counter()
+    added = matrix.update(user_ids[args.rows:], theme_ids[args.rows:], args.rows + args.increment)
+    print(f"дочитывание: {args.increment} строк ({added} новых просмотров) за "
+          f"{(time.perf_counter() - started) * 1e3:.0f} мс")
+
+    counts_mb = (matrix.counts.data.nbytes + matrix.counts.indices.nbytes + matrix.counts.indptr.nbytes) / 2 ** 20
+    views_mb = (matrix.views.data.nbytes + matrix.views.indices.nbytes + matrix.views.indptr.nbytes) / 2 ** 20
+    print(f"память: совместные просмотры {counts_mb:.0f} МБ, просмотры пользователей {views_mb:.0f} МБ")
+
+    # Все подтемы каталога оцениваются для пользователя с историей по популярным подтемам
+    catalog = np.arange(1, args.themes + 1)
+    rng = np.random.default_rng(1)
+    histories = [base_themes[rng.integers(args.rows, size=rng.integers(1, 60))].tolist() for _ in range(args.queries)]
+
+    latencies = []
+    for history in histories:
+        started = time.perf_counter()
+        scores = matrix.scores([history], catalog)[0]
+        np.argpartition(-scores, CANDIDATE_THEMES)[:CANDIDATE_THEMES]
+        latencies.append((time.perf_counter() - started) * 1e3)
+    print(f"оценка одного пользователя: медиана {statistics.median(latencies):.2f} мс, "
+          f"p95 {np.percentile(latencies, 95):.2f} мс")
+
+    started = time.perf_counter()
+    matrix.scores(histories[:128], catalog)
+    print(f"оценка порции из 128 пользователей: {(time.perf_counter() - started) * 1e3:.0f} мс")
+
+
+if __name__ == "__main__":
+    main()
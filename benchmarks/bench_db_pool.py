@@ -0,0 +1,73 @@
+"""
+Замер задержки обработки одного апдейта: пул на каждый апдейт против общего пула.
+
+Запуск (нужна доступная БД из .env):
+    python -m benchmarks.bench_db_pool --updates 200 --concurrency 10
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+from db_handler.db_class import Database
+
+# Типичный запрос навигации по подборкам
+QUERY = "SELECT DISTINCT theme_name FROM themes ORDER BY theme_name"
+
+
+async def update_with_own_pool() -> None:
+    """Старое поведение: connect() / close() вокруг каждого обработчика"""
+    db = Database()
+    await db.connect()
+    try:
+        await db.fetch(QUERY)
+    finally:
+        await db.close()
+
+
+async def update_with_shared_pool(db: Database) -> None:
+    """Новое поведение: пул открыт один раз при старте бота"""
+    await db.fetch(QUERY)
+
+
+async def measure(make_update, updates: int, concurrency: int) -> List[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def one() -> None:
+        async with semaphore:
+            started = time.perf_counter()
+            await make_update()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(updates)))
+    return latencies
+
+
+def report(name: str, latencies: List[float]) -> None:
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{name:<14} mean={statistics.mean(latencies):8.2f} ms  "
+          f"p50={statistics.median(latencies):8.2f} ms  p95={p95:8.2f} ms")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    report("pool/update", await measure(update_with_own_pool, args.updates, args.concurrency))
+
+    shared = Database()
+    await shared.connect()
+    try:
+        report("shared pool", await measure(lambda: update_with_shared_pool(shared),
+                                            args.updates, args.concurrency))
+    finally:
+        await shared.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
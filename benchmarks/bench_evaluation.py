@@ -0,0 +1,276 @@
+"""
+Офлайн-оценка рекомендательной системы: качество (precision@k, recall@k, покрытие каталога) и скорость
+(p50/p95/p99 задержки recommend, пиковая память) на синтетическом каталоге или на выгрузке логов.
+
+Последние --holdout просмотров каждого пользователя скрываются от системы. precision@k — доля из k
+лучших кандидатов (RecommendationSystem._candidate_theme_ids), которые пользователь открыл потом;
+покрытие — доля подтем каталога, попавших хотя бы в одну выдачу. Для сравнения печатается та же
+оценка для самых популярных непросмотренных подтем.
+
+Синтетика: подтемы сгруппированы по направлениям, в названиях общие для направления слова;
+у пользователя 1–3 интереса, большая часть просмотров — внутри них.
+Вместо SentenceTransformer по умолчанию работает HashingEncoder — мешок слов, разложенный хешем
+по координатам: запускается без сети и за секунды. --model включает настоящую модель.
+
+БД заменена ответами из памяти, поэтому задержка — это работа процесса бота без сетевых запросов.
+Каждый запрос считается заново: кэш кандидатов отключён.
+
+Выгрузка логов (user_id можно заменить любыми согласованными номерами):
+    \\copy (SELECT user_id, theme_id FROM user_activity_logs WHERE theme_id IS NOT NULL ORDER BY log_id) TO 'logs.csv' CSV HEADER
+    \\copy (SELECT theme_id, specific_theme FROM themes) TO 'themes.csv' CSV HEADER
+
+Запуск:
+    python -m benchmarks.bench_evaluation --themes 5000 --users 2000
+    python -m benchmarks.bench_evaluation --logs logs.csv --themes-csv themes.csv --cf-weight 0.3
+"""
+import argparse
+import asyncio
+import csv
+import resource
+import tempfile
+import time
+import tracemalloc
+import zlib
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from db_handler import queries
+from recommendation_system.model import CANDIDATE_THEMES, ModelName, RecommendationSystem
+from recommendation_system.result_cache import ResultCache
+
+DIM = 256
+WORDS_PER_CLUSTER = 12
+
+
+class HashingEncoder:
+    """Заместитель модели с интерфейсом бэкенда инференса: эмбеддинг — счётчики слов по DIM корзинам"""
+
+    ready = True
+
+    async def load(self) -> None:
+        pass
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        matrix = np.zeros((len(texts), DIM), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                matrix[row, zlib.crc32(word.encode('utf-8')) % DIM] += 1
+        return matrix
+
+    async def dimension(self) -> int:
+        return DIM
+
+    def close(self) -> None:
+        pass
+
+
+def synthetic_data(themes: int, users: int, clusters: int, seed: int = 0):
+    """Подтемы {theme_id: название} и логи [(user_id, theme_id)] в порядке log_id"""
+    rng = np.random.default_rng(seed)
+    labels = rng.integers(clusters, size=themes)
+    texts = {}
+    for theme_id, label in enumerate(labels.tolist(), start=1):
+        words = rng.choice(WORDS_PER_CLUSTER, size=3, replace=False)
+        texts[theme_id] = " ".join([f"направление{label}"] + [f"слово{label}_{w}" for w in words]
+                                   + [f"общее{rng.integers(100)}"])
+
+    by_cluster = [np.flatnonzero(labels == c) + 1 for c in range(clusters)]
+    # Популярность подтем внутри направления убывает по закону Ципфа
+    weights = [1.0 / np.arange(1, len(ids) + 1) ** 0.7 for ids in by_cluster]
+
+    sessions = []
+    for user_id in range(1, users + 1):
+        interests = rng.choice(clusters, size=rng.integers(1, 4), replace=False)
+        views = []
+        for _ in range(int(rng.integers(5, 40))):
+            cluster = rng.choice(interests) if rng.random() < 0.85 else rng.integers(clusters)
+            if not len(by_cluster[cluster]):
+                continue
+            p = weights[cluster] / weights[cluster].sum()
+            views.append((user_id, int(rng.choice(by_cluster[cluster], p=p))))
+        sessions.append(views)
+
+    # Пользователи приходят вперемешку, но порядок просмотров каждого сохраняется
+    logs = []
+    positions = [0] * len(sessions)
+    active = list(range(len(sessions)))
+    while active:
+        idx = active[rng.integers(len(active))]
+        logs.append(sessions[idx][positions[idx]])
+        positions[idx] += 1
+        if positions[idx] == len(sessions[idx]):
+            active.remove(idx)
+    return texts, logs
+
+
+def load_export(logs_path: str, themes_path: str):
+    with open(themes_path, encoding='utf-8') as f:
+        texts = {int(row['theme_id']): row['specific_theme'] for row in csv.DictReader(f)}
+    with open(logs_path, encoding='utf-8') as f:
+        logs = [(int(row['user_id']), int(row['theme_id'])) for row in csv.DictReader(f)
+                if int(row['theme_id']) in texts]
+    return texts, logs
+
+
+def split(logs: List[Tuple[int, int]], holdout: int) -> Tuple[List[Tuple[int, int]], Dict[int, set]]:
+    """Скрывает последние holdout просмотров каждого пользователя; цель — подтемы из них, которых не было раньше"""
+    per_user = defaultdict(list)
+    for position, (user_id, _) in enumerate(logs):
+        per_user[user_id].append(position)
+
+    hidden, targets = set(), {}
+    for user_id, positions in per_user.items():
+        if len(positions) < holdout + 2:
+            continue
+        cut = positions[-holdout:]
+        seen = {logs[p][1] for p in positions[:-holdout]}
+        target = {logs[p][1] for p in cut} - seen
+        if target:
+            hidden.update(cut)
+            targets[user_id] = target
+
+    train = [row for position, row in enumerate(logs) if position not in hidden]
+    return train, targets
+
+
+class FakeDB:
+    """Ответы запросов рекомендательной системы по логам в памяти"""
+
+    def __init__(self, texts: Dict[int, str], logs: List[Tuple[int, int]]):
+        self.themes = [{'theme_id': theme_id, 'specific_theme': text} for theme_id, text in sorted(texts.items())]
+        self.logs = logs  # log_id — позиция в списке, начиная с 1
+        self.views = defaultdict(list)
+        for log_id, (user_id, theme_id) in enumerate(logs, start=1):
+            self.views[user_id].append((log_id, theme_id))
+        self.profiles = {}
+
+    async def fetch(self, query, *args):
+        if query == queries.GET_THEME_TEXTS:
+            return self.themes
+        if query == queries.GET_RECOMMENDATION_DETAILS:
+            return [
+                {'theme_id': theme_id, 'theme_name': 'Тема', 'specific_theme': f'Подтема {theme_id}',
+                 'expert_name': 'Эксперт', 'expert_position': 'Доцент', 'book_name': f'Книга {theme_id}.{n}',
+                 'description': 'Описание'}
+                for theme_id in sorted(args[0]) for n in range(2)
+            ]
+        raise ValueError(query)
+
+    async def fetchval(self, query, *args):
+        if query == queries.GET_LAST_LOG_ID:
+            return len(self.logs)
+        raise ValueError(query)
+
+    async def fetchrow(self, query, *args):
+        if query == queries.GET_RECOMMENDATION_CONTEXT:
+            views = self.views.get(args[0], [])
+            profile = self.profiles.get(args[0], {
+                'theme_ids': None, 'vector': None, 'vector_theme_ids': None, 'vector_key': None
+            })
+            return {
+                'last_log_id': views[-1][0] if views else None,
+                'seen_theme_ids': list({theme_id for _, theme_id in views}),
+                'history_theme_ids': [theme_id for _, theme_id in views[::-1][:12]],
+                **profile,
+                'precomputed_theme_ids': None, 'precomputed_log_id': None, 'precomputed_version': None
+            }
+        if query == queries.GET_THEME_VIEWS_SINCE:
+            rows = self.logs[args[0]:args[1]]
+            return {'user_ids': [user_id for user_id, _ in rows], 'theme_ids': [theme_id for _, theme_id in rows]}
+        raise ValueError(query)
+
+    async def execute(self, query, *args):
+        if query == queries.CREATE_USER_PROFILE:
+            user_id, theme_ids, vector, vector_key = args
+        elif query == queries.SAVE_PROFILE_VECTOR:
+            user_id, vector, theme_ids, vector_key = args
+        else:
+            raise ValueError(query)
+        self.profiles[user_id] = {'theme_ids': theme_ids, 'vector': vector,
+                                  'vector_theme_ids': theme_ids, 'vector_key': vector_key}
+
+
+def quality(recommended: Dict[int, List[int]], targets: Dict[int, set], k: int, catalog: int) -> str:
+    precision = np.mean([len(set(ids[:k]) & targets[user_id]) / k for user_id, ids in recommended.items()])
+    recall = np.mean([len(set(ids[:k]) & targets[user_id]) / len(targets[user_id])
+                      for user_id, ids in recommended.items()])
+    coverage = len({theme_id for ids in recommended.values() for theme_id in ids[:k]}) / catalog
+    return f"precision@{k} {precision:.3f}   recall@{k} {recall:.3f}   покрытие {coverage:.1%}"
+
+
+def popular_baseline(db: FakeDB, users: List[int]) -> Dict[int, List[int]]:
+    """Самые просматриваемые подтемы, которых пользователь ещё не видел"""
+    ranking = [theme_id for theme_id, _ in Counter(theme_id for _, theme_id in db.logs).most_common()]
+    result = {}
+    for user_id in users:
+        seen = {theme_id for _, theme_id in db.views[user_id]}
+        result[user_id] = [theme_id for theme_id in ranking[:len(seen) + CANDIDATE_THEMES]
+                           if theme_id not in seen][:CANDIDATE_THEMES]
+    return result
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--themes', type=int, default=5000)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--clusters', type=int, default=50)
+    parser.add_argument('--logs', help='CSV user_id,theme_id в порядке log_id вместо синтетики')
+    parser.add_argument('--themes-csv', help='CSV theme_id,specific_theme для --logs')
+    parser.add_argument('--holdout', type=int, default=3)
+    parser.add_argument('--k', type=int, default=5, choices=range(1, CANDIDATE_THEMES + 1), metavar='K')
+    parser.add_argument('--ann', default='exact', help='auto, hnsw, ivf или exact')
+    parser.add_argument('--cf-weight', type=float, default=0.0)
+    parser.add_argument('--model', action='store_true', help=f'Настоящая модель {ModelName} вместо HashingEncoder')
+    args = parser.parse_args()
+
+    if args.logs:
+        texts, logs = load_export(args.logs, args.themes_csv)
+    else:
+        texts, logs = synthetic_data(args.themes, args.users, args.clusters)
+    train, targets = split(logs, args.holdout)
+    users = sorted(targets)
+    print(f"Каталог {len(texts)} подтем, {len(logs)} просмотров, оцениваются {len(users)} пользователей")
+
+    db = FakeDB(texts, train)
+    with tempfile.TemporaryDirectory() as directory:
+        rec_sys = RecommendationSystem(db=db, embeddings_dir=directory, ann_index=args.ann,
+                                       ann_min_themes=0, cf_weight=args.cf_weight)
+        if not args.model:
+            rec_sys.inference.close()
+            rec_sys.inference = HashingEncoder()
+        rec_sys.result_cache = ResultCache(maxsize=0)
+
+        started = time.perf_counter()
+        await rec_sys.warm_up()
+        print(f"Подготовка (эмбеддинги, индекс, совместные просмотры): {time.perf_counter() - started:.1f} с")
+
+        latencies = []
+        for user_id in users:
+            started = time.perf_counter()
+            await rec_sys.recommend(user_id)
+            latencies.append((time.perf_counter() - started) * 1e3)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        print(f"recommend: p50 {p50:.2f} мс   p95 {p95:.2f} мс   p99 {p99:.2f} мс")
+
+        recommended = {user_id: await rec_sys._candidate_theme_ids(user_id) for user_id in users}
+        print(f"система:     {quality(recommended, targets, args.k, len(texts))}")
+        print(f"популярные:  {quality(popular_baseline(db, users), targets, args.k, len(texts))}")
+
+        tracemalloc.start()
+        peak = 0
+        for user_id in users[:100]:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            await rec_sys.recommend(user_id)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+        tracemalloc.stop()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"память: пик на запрос {peak / 2 ** 20:.2f} МиБ, пик RSS процесса {rss:.0f} МиБ")
+
+        rec_sys.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
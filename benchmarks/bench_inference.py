@@ -0,0 +1,81 @@
+"""
+Задержка event loop, пока модель кодирует темы: прежний вызов через executor по умолчанию
+(torch на всех ядрах) против выделенного потока и отдельного процесса.
+
+Параллельно с кодированием корутина-«обработчик» просыпается каждые 5 мс; её опоздание —
+это задержка, которую получили бы все остальные апдейты бота.
+
+Запуск:
+    python -m benchmarks.bench_inference --texts 2000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from functools import partial
+
+import torch
+
+from recommendation_system import inference
+from recommendation_system.model import ModelName
+
+TICK = 0.005
+
+
+async def ticker(lags: list, stop: asyncio.Event) -> None:
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - started - TICK) * 1e3)
+
+
+async def measure(name: str, encode, texts) -> None:
+    lags = []
+    stop = asyncio.Event()
+    task = asyncio.create_task(ticker(lags, stop))
+
+    started = time.perf_counter()
+    await encode(texts)
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    await task
+    lags.sort()
+    print(f"{name:<18} кодирование {elapsed:7.2f} с   задержка loop: p50 {statistics.median(lags):6.2f} мс   "
+          f"p99 {lags[int(len(lags) * 0.99) - 1]:6.2f} мс   max {lags[-1]:7.2f} мс")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=inference.INFERENCE_THREADS)
+    args = parser.parse_args()
+
+    texts = [f"Подтема номер {i}: история и философия науки" for i in range(args.texts)]
+
+    # Прежний путь: модель в процессе бота, executor по умолчанию, torch на всех ядрах
+    default_threads = torch.get_num_threads()
+    thread = inference.ThreadBackend(ModelName, threads=args.threads)
+    await thread.load()
+    torch.set_num_threads(default_threads)
+
+    async def legacy(batch):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(inference.encode, thread.model, batch))
+
+    await legacy(texts[:16])  # Прогрев
+    await measure("default executor", legacy, texts)
+
+    torch.set_num_threads(args.threads)
+    await thread.encode(texts[:16])
+    await measure("thread backend", thread.encode, texts)
+    thread.close()
+
+    process = inference.ProcessBackend(ModelName, threads=args.threads)
+    await process.encode(texts[:16])  # Запуск процесса и загрузка модели
+    await measure("process backend", process.encode, texts)
+    process.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""
+Матрица эмбеддингов подтем в float32 и в float16 (EMBEDDINGS_FLOAT16): память матрицы, время поиска
+ближайших подтем точным перебором и через IVF-индекс, пересечение 10 лучших кандидатов с float32.
+
+Эмбеддинги синтетические (кластеры на единичной сфере, размерность модели), БД и модель не используются.
+
+Запуск:
+    python -m benchmarks.bench_memory --themes 100000 --queries 200
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from recommendation_system.ann import build_index
+from recommendation_system.model import CANDIDATE_THEMES, RecommendationSystem
+
+
+def make_embeddings(themes: int, dim: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((256, dim)).astype(np.float32)
+    embeddings = centers[rng.integers(256, size=themes)] + 0.5 * rng.standard_normal((themes, dim)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def measure(embeddings: np.ndarray, norms: np.ndarray, index, queries: np.ndarray):
+    """Медиана и p95 задержки поиска в мс и найденные кандидаты для каждого запроса"""
+    latencies, results = [], []
+    for query in queries:
+        started = time.perf_counter()
+        rows, scores = RecommendationSystem._cos_sim_sync(query, embeddings, norms, index, CANDIDATE_THEMES)
+        top = RecommendationSystem._top_k(scores, 10)
+        latencies.append((time.perf_counter() - started) * 1e3)
+        results.append(set((top if rows is None else rows[top]).tolist()))
+    return statistics.median(latencies), np.percentile(latencies, 95), results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--themes', type=int, default=100000)
+    parser.add_argument('--dim', type=int, default=768)
+    parser.add_argument('--queries', type=int, default=200)
+    args = parser.parse_args()
+
+    embeddings = make_embeddings(args.themes, args.dim)
+    norms = np.maximum(np.linalg.norm(embeddings, axis=1), 1e-12).astype(np.float32)
+    queries = embeddings[np.random.default_rng(1).integers(args.themes, size=args.queries)]
+
+    # Индекс строится по float32 в обоих режимах, как в _load_theme_embeddings
+    index = build_index('ivf', embeddings, norms, 0)
+    compact = embeddings.astype(np.float16)
+    print(f"матрица: float32 {embeddings.nbytes / 2 ** 20:.0f} МБ, float16 {compact.nbytes / 2 ** 20:.0f} МБ, "
+          f"IVF-индекс {index.nbytes / 2 ** 20:.0f} МБ")
+
+    for name, search_index in (('перебор', None), ('IVF', index)):
+        p50, p95, expected = measure(embeddings, norms, search_index, queries)
+        print(f"{name} float32: медиана {p50:.1f} мс, p95 {p95:.1f} мс")
+        p50, p95, found = measure(compact, norms, search_index, queries)
+        overlap = np.mean([len(e & f) / max(len(e), 1) for e, f in zip(expected, found)])
+        print(f"{name} float16: медиана {p50:.1f} мс, p95 {p95:.1f} мс, совпадение top-10 {overlap:.3f}")
+
+
+if __name__ == "__main__":
+    main()
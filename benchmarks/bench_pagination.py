@@ -0,0 +1,87 @@
+"""
+Построение страницы клавиатуры подтем на каталоге из 10k подтем:
+прежний код (поиск индекса через list.index для каждой кнопки) против общего модуля пагинации.
+
+Запуск (БД не нужна, каталог синтетический):
+    python -m benchmarks.bench_pagination --subthemes 10000 --requests 2000
+"""
+import argparse
+import random
+import time
+from typing import Sequence
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from db_handler.catalog import CatalogSnapshot
+from handlers.main_panel.lists import subthemes_keyboard
+
+
+def make_catalog(subthemes: int) -> CatalogSnapshot:
+    rows = [
+        {'theme_id': i + 1, 'theme_name': 'Тема', 'specific_theme': f'Подтема {i:05d}'}
+        for i in range(subthemes)
+    ]
+    return CatalogSnapshot(1, rows, [])
+
+
+def legacy_page(subthemes, theme_id: int, page: int) -> InlineKeyboardMarkup:
+    """Прежний display_subthemes: кнопки с callback_data по позиции в списке"""
+    items_per_page = 5
+    total_pages = (len(subthemes) + items_per_page - 1) // items_per_page
+    start_idx = page * items_per_page
+    current_subthemes = subthemes[start_idx:min(start_idx + items_per_page, len(subthemes))]
+
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text=f"📋{subtheme}",
+                              callback_data=f"subtheme_{subthemes.index(subtheme)}_{theme_id}")]
+        for subtheme in current_subthemes
+    ])
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton(text="◄ Назад", callback_data=f"subthemes_{theme_id}_{page - 1}"))
+    if page < total_pages - 1:
+        nav_buttons.append(InlineKeyboardButton(text="Вперёд ►", callback_data=f"subthemes_{theme_id}_{page + 1}"))
+    if nav_buttons:
+        keyboard.inline_keyboard.append(nav_buttons)
+    keyboard.inline_keyboard.append(
+        [InlineKeyboardButton(text=f"📄Страница {page + 1} из {total_pages}", callback_data=f"page_{page}")]
+    )
+    keyboard.inline_keyboard.append(
+        [InlineKeyboardButton(text="◄ Вернуться к темам", callback_data="get_themes")]
+    )
+    return keyboard
+
+
+def measure(name: str, render, pages: Sequence[int]) -> None:
+    started = time.perf_counter()
+    for page in pages:
+        render(page)
+    elapsed = (time.perf_counter() - started) / len(pages) * 1e6
+    print(f"{name:<22} {elapsed:10.1f} мкс/страница")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--subthemes", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    catalog = make_catalog(args.subthemes)
+    subthemes = catalog.subthemes['Тема']
+    total = (len(subthemes) + 4) // 5
+
+    # Пользователи чаще листают первые страницы: распределение с тяжёлой головой
+    random.seed(0)
+    pages = [min(int(random.paretovariate(1.2)) - 1, total - 1) for _ in range(args.requests)]
+
+    # Прежний обработчик при каждом клике заново получал и сортировал список подтем
+    measure("legacy (sort + index)", lambda page: legacy_page(sorted(subthemes), 0, page), pages)
+    measure("legacy (index only)", lambda page: legacy_page(subthemes, 0, page), pages)
+    measure("legacy, last page", lambda page: legacy_page(subthemes, 0, total - 1), pages[:200])
+
+    # Первый проход по всем страницам строит их, дальше страницы берутся из кэша снимка
+    measure("pagination, cold", lambda page: subthemes_keyboard(catalog, 'Тема', page), range(total))
+    measure("pagination, memoized", lambda page: subthemes_keyboard(catalog, 'Тема', page), pages)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Микробенчмарк разбора/планирования: разовые запросы против реестра подготовленных statement'ов.
+
+Запуск (нужна доступная БД из .env с загруженными подборками):
+    python -m benchmarks.bench_prepared --iterations 2000
+"""
+import argparse
+import asyncio
+import time
+
+import asyncpg
+from decouple import config
+
+from db_handler import queries
+from db_handler.db_class import prepare_statements
+
+# (запрос, аргументы) — горячий путь навигации по подборкам
+WORKLOAD = [
+    (queries.GET_AVAILABLE_THEMES, ()),
+    (queries.GET_SUBTHEMES, ("Математика",)),
+    (queries.GET_EXPERT_RECOMMENDATIONS, ("Алгебра",)),
+    (queries.GET_THEME_ID, ("Математика", "Алгебра")),
+    (queries.IS_SUBSCRIBED_NEWSLETTER, (1,)),
+]
+
+
+async def connect(**kwargs) -> asyncpg.Connection:
+    return await asyncpg.connect(
+        user=config("PG_USER"),
+        password=config("PG_PASSWORD"),
+        database=config("PG_DB"),
+        host=config('PG_HOST'),
+        port=config("PG_PORT"),
+        **kwargs
+    )
+
+
+async def run_workload(conn: asyncpg.Connection, iterations: int) -> float:
+    started = time.perf_counter()
+    for _ in range(iterations):
+        for query, args in WORKLOAD:
+            await conn.fetch(query, *args)
+    return (time.perf_counter() - started) / (iterations * len(WORKLOAD)) * 1e6
+
+
+async def first_call(warm_up: bool) -> float:
+    """Задержка первого прохода по запросам на свежем соединении, мкс на запрос"""
+    conn = await connect()
+    try:
+        if warm_up:
+            await prepare_statements(conn)
+        return await run_workload(conn, 1)
+    finally:
+        await conn.close()
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    # statement_cache_size=0: каждый вызов заново разбирает и планирует запрос
+    ad_hoc = await connect(statement_cache_size=0)
+    registry = await connect()
+    await prepare_statements(registry)
+    try:
+        print(f"ad-hoc       {await run_workload(ad_hoc, args.iterations):8.1f} мкс/запрос")
+        print(f"registry     {await run_workload(registry, args.iterations):8.1f} мкс/запрос")
+    finally:
+        await ad_hoc.close()
+        await registry.close()
+
+    print(f"first call, no warm-up   {await first_call(False):8.1f} мкс/запрос")
+    print(f"first call, init warm-up {await first_call(True):8.1f} мкс/запрос")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""
+int8 динамическая квантизация против fp32 на текущем каталоге тем: скорость кодирования,
+пиковый RSS процесса и согласие эмбеддингов (косинус между fp32 и int8 для каждой темы,
+пересечение 10 ближайших тем).
+
+Каждый режим запускается в отдельном процессе, чтобы RSS не смешивался. Тексты тем берутся из БД
+(переменные окружения бота); без БД или с --synthetic N используются синтетические подтемы.
+
+Запуск:
+    python -m benchmarks.bench_quantization --runs 3
+"""
+import argparse
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from recommendation_system import inference
+from recommendation_system.model import ModelName
+
+
+async def catalog_texts() -> list:
+    from create_bot import db
+    from db_handler import queries
+
+    await db.connect()
+    try:
+        rows = await db.fetch(queries.GET_THEME_TEXTS)
+    finally:
+        await db.close()
+    return [row['specific_theme'] for row in rows]
+
+
+def child(quantize: bool, texts_path: str, output_path: str, runs: int, threads: int) -> None:
+    with open(texts_path, encoding='utf-8') as f:
+        texts = f.read().split('\n')
+
+    model = inference.load_model(ModelName, threads, quantize)
+    inference.encode(model, texts[:16])  # Прогрев
+
+    elapsed = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        embeddings = inference.encode(model, texts)
+        elapsed.append(time.perf_counter() - started)
+
+    np.save(output_path, embeddings)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # Linux: КиБ
+    print(f"{len(texts) / min(elapsed)} {rss}")
+
+
+def neighbours(embeddings: np.ndarray, k: int = 10) -> np.ndarray:
+    unit = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    scores = unit @ unit.T
+    np.fill_diagonal(scores, -np.inf)
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=inference.INFERENCE_THREADS)
+    parser.add_argument("--synthetic", type=int, default=0, help="Число синтетических подтем вместо каталога из БД")
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "TEXTS", "OUTPUT"))
+    args = parser.parse_args()
+
+    if args.child:
+        mode, texts_path, output_path = args.child
+        child(mode == 'int8', texts_path, output_path, args.runs, args.threads)
+        return
+
+    texts = []
+    if not args.synthetic:
+        try:
+            texts = asyncio.run(catalog_texts())
+        except Exception as exc:
+            print(f"Каталог из БД недоступен ({exc}), используются синтетические подтемы")
+    if not texts:
+        texts = [f"Подтема {i}: {topic}" for i, topic in enumerate(
+            ["история науки", "квантовая физика", "теория чисел", "русская литература", "экономика"] *
+            (max(args.synthetic, 500) // 5)
+        )]
+    texts = [text.replace('\n', ' ') for text in texts]
+    print(f"Тем: {len(texts)}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        texts_path = os.path.join(directory, "texts.txt")
+        with open(texts_path, 'w', encoding='utf-8') as f:
+            f.write('\n'.join(texts))
+
+        embeddings = {}
+        for mode in ("fp32", "int8"):
+            output_path = os.path.join(directory, f"{mode}.npy")
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_quantization", "--runs", str(args.runs),
+                 "--threads", str(args.threads), "--child", mode, texts_path, output_path],
+                check=True, capture_output=True, text=True
+            ).stdout.split()
+            throughput, rss = float(output[-2]), float(output[-1])
+            embeddings[mode] = np.load(output_path)
+            print(f"{mode}  {throughput:8.1f} тем/с   пиковый RSS {rss:8.1f} МиБ")
+
+    fp32, int8 = embeddings["fp32"], embeddings["int8"]
+    cosine = np.sum(fp32 * int8, axis=1) / (np.linalg.norm(fp32, axis=1) * np.linalg.norm(int8, axis=1))
+    print(f"косинус fp32/int8: среднее {cosine.mean():.4f}   минимум {cosine.min():.4f}")
+
+    if len(texts) > 10:
+        overlap = [len(set(a) & set(b)) / 10 for a, b in zip(neighbours(fp32), neighbours(int8))]
+        print(f"пересечение 10 ближайших тем: {np.mean(overlap):.3f}")
+
+
+if __name__ == "__main__":
+    main()
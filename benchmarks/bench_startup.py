@@ -0,0 +1,61 @@
+"""
+Время от запуска процесса до готовности принимать апдейты: прежняя схема (torch, sentence_transformers
+и модель загружаются при импорте обработчиков) против ленивой (модель грузится фоновой задачей
+после старта polling). Каждый вариант запускается в отдельном интерпретаторе, чтобы импорт был холодным.
+
+Нужны переменные окружения бота (.env), БД не используется.
+
+Запуск:
+    python -m benchmarks.bench_startup --runs 3
+"""
+import argparse
+import asyncio
+import statistics
+import subprocess
+import sys
+import time
+
+
+def child(mode: str) -> None:
+    started = time.perf_counter()
+
+    from handlers.main_panel.recommendation import rec_sys
+    if mode == 'eager':
+        # Прежний конструктор RecommendationSystem загружал модель синхронно
+        asyncio.run(rec_sys.inference.load())
+    first_update = time.perf_counter() - started
+
+    async def warm_up():
+        rec_sys.inference.ready or await rec_sys.inference.load()
+
+    asyncio.run(warm_up())
+    ready = time.perf_counter() - started
+    rec_sys.close()
+    print(f"{first_update} {ready}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", choices=("eager", "lazy"))
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child)
+        return
+
+    for mode in ("eager", "lazy"):
+        first_updates, readies = [], []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_startup", "--child", mode],
+                check=True, capture_output=True, text=True
+            ).stdout.split()
+            first_updates.append(float(output[-2]))
+            readies.append(float(output[-1]))
+        print(f"{mode:<6} до первого апдейта {statistics.median(first_updates):6.2f} с   "
+              f"модель готова через {statistics.median(readies):6.2f} с")
+
+
+if __name__ == "__main__":
+    main()
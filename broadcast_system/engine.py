@@ -0,0 +1,316 @@
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Iterable, Optional, Set
+
+from aiogram import Bot
+from aiogram.exceptions import (TelegramAPIError, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter,
+                                TelegramServerError)
+from decouple import config
+
+from broadcast_system.token_bucket import TokenBucket
+from db_handler import queries
+
+BROADCAST_RATE = config('BROADCAST_RATE', default=25, cast=float)  # Messages per second, below Telegram's ~30
+BROADCAST_CONCURRENCY = config('BROADCAST_CONCURRENCY', default=8, cast=int)  # Requests in flight at once
+BROADCAST_MAX_RETRIES = 3  # Network and server errors; flood waits are always retried
+BROADCAST_BATCH = 20  # Recipients a worker claims at once; their statuses are saved together
+BROADCAST_PROGRESS_INTERVAL = config('BROADCAST_PROGRESS_INTERVAL', default=5, cast=float)  # Seconds between progress updates
+# Seconds after which a claimed batch whose statuses were not saved is considered lost with its process
+BROADCAST_CLAIM_LEASE = config('BROADCAST_CLAIM_LEASE', default=600, cast=float)
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BroadcastReport:
+    job_id: int = 0
+    admin_id: int = 0
+    status_message_id: Optional[int] = None  # Admin's message that shows the progress
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0  # Recipients who blocked the bot, marked as blocked in users
+    retries: int = 0
+    flood_waits: int = 0
+    elapsed: float = 0.0  # Seconds since this process started or resumed the job
+    sent_in_run: int = 0
+    cancelled: bool = False
+
+    @property
+    def rate(self) -> float:
+        """Messages sent per second."""
+        return self.sent_in_run / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def pending(self) -> int:
+        return self.total - self.sent - self.failed - self.blocked
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds until the remaining recipients are sent at the current rate."""
+        return self.pending / self.rate if self.rate else None
+
+
+class BroadcastEngine:
+    """
+    Sends broadcast jobs stored in broadcast_jobs / broadcast_recipients in the background.
+
+    `concurrency` workers claim batches of pending recipients (FOR UPDATE SKIP LOCKED), send through one
+    TokenBucket, so the bot stays under Telegram's global limit however slow individual requests are,
+    and store each batch's statuses. A TelegramRetryAfter pauses every worker for the requested time and
+    halves the rate; a TelegramForbiddenError marks the user as blocked; other API errors (chat not found)
+    fail the recipient without a retry.
+
+    Several processes can run the same job: each claim is stamped with claimed_at, and a batch is taken
+    from its worker only when it stays unsaved for longer than claim_lease, i.e. its process is gone.
+    Jobs left running by a stopped process are resumed by resume(). Recipients of the batches that were
+    in flight are sent again once their lease expires, so a restart can deliver a message twice to at most
+    concurrency * batch_size users. A batch must be sent within claim_lease, flood waits included.
+    A job is finished when none of its recipients is pending or claimed by another process.
+
+    While a job runs, on_progress receives its report every progress_interval seconds. A progress update
+    takes a token from the bucket like a message, which at one update per interval is a negligible part of it.
+    """
+
+    def __init__(
+            self,
+            bot: Bot,
+            db,
+            rate: float = BROADCAST_RATE,
+            concurrency: int = BROADCAST_CONCURRENCY,
+            max_retries: int = BROADCAST_MAX_RETRIES,
+            batch_size: int = BROADCAST_BATCH,
+            progress_interval: float = BROADCAST_PROGRESS_INTERVAL,
+            claim_lease: float = BROADCAST_CLAIM_LEASE
+    ):
+        self.bot = bot
+        self.db = db
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.batch_size = batch_size
+        self.progress_interval = progress_interval
+        self.claim_lease = claim_lease
+        # The limit is per bot: concurrent broadcasts share the bucket
+        self.bucket = TokenBucket(rate)
+        self._tasks: Set[asyncio.Task] = set()
+        self._cancelled: Set[int] = set()
+
+    async def create_job(
+            self,
+            admin_id: int,
+            chat_ids: Iterable[int],
+            content_type: str,
+            content_data: dict,
+            db=None
+    ) -> int:
+        """
+        Stores a broadcast and its recipients, returns the job_id.
+
+        :param content_type: 'text' (content_data['text']) or 'photo' (content_data['photo_id'] and ['caption'])
+        :param db: session of the calling handler (db_utils.db): a handler holding its session connection
+            must not wait for a second one from the pool
+        """
+        return await (db or self.db).fetchval(
+            queries.CREATE_BROADCAST_JOB, admin_id, content_type, json.dumps(content_data), list(chat_ids)
+        )
+
+    async def set_status_message(self, job_id: int, message_id: int, db=None) -> None:
+        """Remembers the admin's message that shows the job's progress, also for a resumed job."""
+        await (db or self.db).execute(queries.SET_BROADCAST_STATUS_MESSAGE, job_id, message_id)
+
+    async def _send(self, chat_id: int, content_type: str, content_data: dict) -> None:
+        if content_type == 'photo':
+            await self.bot.send_photo(
+                chat_id=chat_id,
+                photo=content_data['photo_id'],
+                caption=content_data['caption'] if content_data['caption'] else None
+            )
+        else:
+            await self.bot.send_message(chat_id=chat_id, text=content_data['text'])
+
+    async def _deliver(self, chat_id: int, content_type: str, content_data: dict, report: BroadcastReport) -> str:
+        """Sends to one chat, retrying flood waits and transient errors. Returns the recipient's status."""
+        attempt = 0
+        while True:
+            await self.bucket.acquire()
+            try:
+                await self._send(chat_id, content_type, content_data)
+            except TelegramRetryAfter as exc:
+                report.flood_waits += 1
+                # Requests already in flight get flood waits too: the rate is lowered once per pause
+                if not self.bucket.paused:
+                    self.bucket.slow_down()
+                    logger.warning(f"Flood wait of {exc.retry_after} s, rate lowered to {self.bucket.rate:.1f}/s")
+                self.bucket.pause(exc.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as exc:
+                if attempt >= self.max_retries:
+                    logger.error(f"Broadcast to {chat_id} failed after {attempt} retries: {exc}")
+                    return 'failed'
+                await asyncio.sleep(2 ** attempt)
+                attempt += 1
+            except TelegramForbiddenError as exc:
+                logger.info(f"Broadcast to {chat_id} failed, the bot is blocked: {exc}")
+                return 'blocked'
+            except TelegramAPIError as exc:
+                logger.info(f"Broadcast to {chat_id} failed: {exc}")
+                return 'failed'
+            except Exception as exc:
+                logger.error(f"Broadcast to {chat_id} failed: {exc}")
+                return 'failed'
+            else:
+                self.bucket.speed_up(self.bucket.max_rate / 1000)
+                return 'sent'
+            report.retries += 1
+
+    async def _update_counts(self, report: BroadcastReport) -> None:
+        rows = await self.db.fetch(queries.GET_BROADCAST_COUNTS, report.job_id)
+        counts = {row['status']: row['count'] for row in rows}
+        report.sent, report.failed, report.blocked = counts.get('sent', 0), counts.get('failed', 0), counts.get('blocked', 0)
+        report.total = sum(counts.values())
+
+    async def _report_progress(self, report: BroadcastReport, started: float, on_progress) -> None:
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            report.elapsed = time.monotonic() - started
+            await self.bucket.acquire()
+            try:
+                await on_progress(report)
+            except Exception as exc:
+                logger.warning(f"Broadcast {report.job_id} progress update failed: {exc}")
+
+    async def _run_workers(self, worker: Callable[[], Awaitable]) -> None:
+        """Runs `concurrency` workers; when one fails the others are cancelled and the error is raised."""
+        tasks = [asyncio.ensure_future(worker()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Cancelled workers save the statuses of their batches, the rest of the job stays pending
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+    async def run(
+            self,
+            job_id: int,
+            on_progress: Optional[Callable[[BroadcastReport], Awaitable]] = None
+    ) -> BroadcastReport:
+        """
+        Sends the job to its pending recipients and returns the report over all of them.
+        An error of a worker is raised once the other workers stopped; the job stays running for resume().
+        """
+        job = await self.db.fetchrow(queries.GET_BROADCAST_JOB, job_id)
+        content_type, content_data = job['content_type'], json.loads(job['content'])
+        report = BroadcastReport(job_id=job_id, admin_id=job['admin_id'], status_message_id=job['status_message_id'])
+        # Recipients sent before a restart are counted from the start
+        await self._update_counts(report)
+        started = time.monotonic()
+
+        async def worker():
+            while job_id not in self._cancelled:
+                rows = await self.db.fetch(queries.CLAIM_BROADCAST_RECIPIENTS, job_id, self.batch_size)
+                if not rows:
+                    return
+
+                chat_ids = [row['user_id'] for row in rows]
+                statuses = []
+                try:
+                    for chat_id in chat_ids:
+                        if job_id in self._cancelled:
+                            break
+                        status = await self._deliver(chat_id, content_type, content_data, report)
+                        # Statuses sent, failed and blocked are counters of the report
+                        setattr(report, status, getattr(report, status) + 1)
+                        report.sent_in_run += status == 'sent'
+                        statuses.append(status)
+                finally:
+                    # Recipients left after a cancel, a failed worker or stop() stay pending
+                    statuses += ['pending'] * (len(chat_ids) - len(statuses))
+                    await self.db.execute(queries.SAVE_BROADCAST_RESULTS, job_id, chat_ids, statuses)
+
+        progress = None
+        if on_progress is not None:
+            progress = asyncio.create_task(self._report_progress(report, started, on_progress))
+        try:
+            while True:
+                await self._run_workers(worker)
+                if job_id in self._cancelled or not await self.db.fetchval(queries.GET_CLAIMED_BROADCAST_COUNT, job_id):
+                    break
+                # Batches of other processes: wait until they are saved or their lease expires
+                await asyncio.sleep(self.progress_interval)
+                await self.db.execute(queries.RELEASE_BROADCAST_CLAIMS, self.claim_lease)
+        finally:
+            if progress is not None:
+                progress.cancel()
+            report.cancelled = job_id in self._cancelled
+            self._cancelled.discard(job_id)
+
+        if await self.db.execute(queries.FINISH_BROADCAST_JOB, job_id, 'done') == "UPDATE 0":
+            # Workers stopped because the job was cancelled by another process
+            job = await self.db.fetchrow(queries.GET_BROADCAST_JOB, job_id)
+            report.cancelled = job['status'] == 'cancelled'
+        await self._update_counts(report)
+        report.elapsed = time.monotonic() - started
+        logger.info(f"Broadcast {job_id} {'cancelled' if report.cancelled else 'finished'}: "
+                    f"{report.sent}/{report.total} sent, {report.blocked} blocked, "
+                    f"{report.sent_in_run} in {report.elapsed:.1f} s ({report.rate:.1f}/s), "
+                    f"{report.flood_waits} flood waits, {report.retries} retries")
+        return report
+
+    async def cancel(self, job_id: int) -> bool:
+        """
+        Stops the job after the messages in flight; its unsent recipients stay pending and it is not resumed.
+        Returns False if the job is not running.
+        """
+        result = await self.db.execute(queries.FINISH_BROADCAST_JOB, job_id, 'cancelled')
+        if result == "UPDATE 0":
+            return False
+        # Workers of this process stop at the next recipient, run() clears the mark;
+        # workers of other processes get no more recipients at their next claim
+        self._cancelled.add(job_id)
+        return True
+
+    def start(
+            self,
+            job_id: int,
+            on_progress: Optional[Callable[[BroadcastReport], Awaitable]] = None,
+            on_done: Optional[Callable[[BroadcastReport], Awaitable]] = None
+    ) -> asyncio.Task:
+        """Runs the job in a background task; on_done receives the final report."""
+        task = asyncio.create_task(self._run_and_report(job_id, on_progress, on_done))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def resume(
+            self,
+            on_progress: Optional[Callable[[BroadcastReport], Awaitable]] = None,
+            on_done: Optional[Callable[[BroadcastReport], Awaitable]] = None
+    ) -> int:
+        """Restarts the jobs a stopped process left running. Returns their number."""
+        await self.db.execute(queries.RELEASE_BROADCAST_CLAIMS, self.claim_lease)
+        rows = await self.db.fetch(queries.GET_RUNNING_BROADCAST_JOBS)
+        for row in rows:
+            logger.info(f"Resuming broadcast {row['job_id']}")
+            self.start(row['job_id'], on_progress, on_done)
+        return len(rows)
+
+    async def _run_and_report(self, job_id: int, on_progress, on_done) -> None:
+        try:
+            report = await self.run(job_id, on_progress)
+            if on_done is not None:
+                await on_done(report)
+        except Exception as exc:
+            logger.error(f"Broadcast {job_id} failed: {exc}")
+
+    async def stop(self) -> None:
+        """
+        Cancels running broadcasts. Batches in flight are saved; the jobs stay running and are resumed after a restart.
+        """
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from typing import Optional
+
+
+class TokenBucket:
+    """
+    Send rate limit shared by all broadcast workers of the bot.
+
+    Tokens refill at `rate` per second up to `capacity`; acquire() waits for one, callers are served in order.
+    After a flood wait the bucket is paused for every caller and the rate is halved; successful sends
+    raise it back towards max_rate in small steps (additive increase, multiplicative decrease).
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0, min_rate: float = 1.0):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.min_rate = min(min_rate, rate)
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def acquire(self) -> None:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    @property
+    def paused(self) -> bool:
+        return time.monotonic() < self._paused_until
+
+    def pause(self, seconds: float) -> None:
+        """No token is given out for the next `seconds`, e.g. the retry_after of a flood wait."""
+        now = time.monotonic()
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0
+        self._updated = self._paused_until
+
+    def slow_down(self, factor: float = 0.5) -> None:
+        self.rate = max(self.min_rate, self.rate * factor)
+
+    def speed_up(self, step: float) -> None:
+        self.rate = min(self.max_rate, self.rate + step)
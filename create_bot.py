@@ -12,6 +12,10 @@ import os
 import csv
 from aiogram.types import MenuButtonDefault
 
+from db_handler.db_class import Database
+from db_handler.catalog import CatalogCache
+from broadcast_system.engine import BroadcastEngine
+
 scheduler = AsyncIOScheduler(timezone='Europe/Moscow')
 
 DB_CONFIG = {
@@ -62,6 +66,13 @@ bot = Bot(token=config("TOKEN"),
           default=DefaultBotProperties(parse_mode=ParseMode.HTML))
 dp = Dispatcher(storage=MemoryStorage())
 
+# Единый на процесс пул соединений: открывается в aiogram_run.main и закрывается при остановке бота
+db = Database()
+# Каталог подборок в памяти: сбрасывается методами DBUtils, изменяющими подборки
+catalog = CatalogCache()
+# Рассылки идут в фоне с общим на бота ограничением скорости отправки, задания хранятся в БД
+broadcaster = BroadcastEngine(bot, db)
+
 try:
     admins = [int(admin_id) for admin_id in config('ADMINS').split(',')]
 except (ValueError, KeyError) as e:
@@ -76,11 +87,9 @@ async def remove_menu(bot):
 
 async def update_admins(db_utils):
     """Обновляет список администраторов из базы данных."""
-    global admins
     try:
-        await db_utils.db.connect()
-        admins = await db_utils.get_admin_ids()
-        await db_utils.db.close()
+        # Обновляем список на месте: фильтры роутеров держат ссылку на него
+        admins[:] = await db_utils.get_admin_ids()
         logger.info(f"Список администраторов обновлён: {admins}")
     except Exception as e:
         logger.error(f"Ошибка при обновлении списка администраторов: {e}")
@@ -91,9 +100,7 @@ async def save_stats(db_utils):
     logger.info("Запуск задачи по расписанию: сохранение статистики")
 
     try:
-        await db_utils.db.connect()
         stats = await db_utils.get_statistic()
-        await db_utils.db.close()
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         stats_row = {
             "timestamp": timestamp,
@@ -128,3 +135,30 @@ async def save_stats(db_utils):
 
     except Exception as exc:
         logger.error(f"Ошибка получения статистики: {exc}")
+
+
+async def precompute_recommendations(rec_sys):
+    """Пересчитывает рекомендации всех активных пользователей в precomputed_recommendations"""
+    logger.info("Запуск задачи по расписанию: пересчёт рекомендаций")
+
+    try:
+        count = await rec_sys.precompute()
+        logger.info(f"Рекомендации пересчитаны для {count} пользователей")
+    except Exception as exc:
+        logger.error(f"Ошибка пересчёта рекомендаций: {exc}")
+
+
+async def refresh_popular_recommendations(rec_sys):
+    """Обновляет популярные подборки для пользователей без истории просмотров"""
+    try:
+        count = await rec_sys.refresh_popular()
+        logger.info(f"Популярные подборки обновлены: {count} подтем")
+    except Exception as exc:
+        logger.error(f"Ошибка обновления популярных подборок: {exc}")
+
+
+async def log_recommendation_timings(rec_sys):
+    """Пишет в лог задержки этапов рекомендаций (мс) по последним запросам"""
+    for phase, stats in rec_sys.timings.summary().items():
+        logger.info(f"Рекомендации, этап {phase}: {stats['count']} запросов, p50 {stats['p50']:.1f}, "
+                    f"p95 {stats['p95']:.1f}, p99 {stats['p99']:.1f}")
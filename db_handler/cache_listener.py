@@ -0,0 +1,148 @@
+import asyncio
+import inspect
+import logging
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from asyncpg import Connection
+
+from .db_class import Database
+from . import queries
+
+logger = logging.getLogger(__name__)
+
+
+class CacheListener:
+    """
+    Фоновая задача LISTEN на соединении из общего пула. Получает уведомления об изменении
+    каталога и ролей, сделанных любым процессом (другим воркером бота или web-сервисом),
+    и сбрасывает локальные кэши этого процесса.
+
+    Attributes:
+        db (Database): Общий на процесс пул
+        reconnect_delay (float): Пауза перед переподключением после обрыва, сек
+        heartbeat (float): Период проверки соединения, сек
+        versions (Dict[str, int]): Последние известные версии кэшей
+    """
+
+    def __init__(
+            self,
+            db: Database,
+            reconnect_delay: float = 5.0,
+            heartbeat: float = 60.0
+    ) -> None:
+
+        self.db = db
+        self.reconnect_delay = reconnect_delay
+        self.heartbeat = heartbeat
+        self.versions: Dict[str, int] = {}
+        self._callbacks: Dict[str, List[Callable[[int], Any]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Set[asyncio.Future] = set()
+
+    def subscribe(
+            self,
+            name: str,
+            callback: Callable[[int], Any]
+    ) -> None:
+        """
+        Подписка на изменение версии кэша
+
+        :param name: Имя кэша в cache_versions ('catalog', 'roles')
+        :param callback: Функция или корутина, принимающая новую версию
+        """
+
+        self._callbacks.setdefault(name, []).append(callback)
+
+    def start(self) -> None:
+        """Запуск фоновой задачи"""
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановка фоновой задачи, соединение возвращается в пул"""
+
+        if self._task is None:
+            return
+
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._listen()
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:
+                logger.error(f"Соединение для LISTEN {queries.CACHE_CHANNEL} потеряно: {exc}")
+
+            await asyncio.sleep(self.reconnect_delay)
+
+    async def _listen(self) -> None:
+        lost = asyncio.Event()
+
+        def on_termination(conn: Connection) -> None:
+            lost.set()
+
+        async with self.db.pool.acquire() as conn:
+            conn.add_termination_listener(on_termination)
+            await conn.add_listener(queries.CACHE_CHANNEL, self._on_notify)
+            logger.info(f"Слушаем канал {queries.CACHE_CHANNEL}")
+            try:
+                while not lost.is_set():
+                    # Сверка версий: догоняет уведомления, пропущенные пока слушатель был отключён,
+                    # и заодно проверяет, что соединение живо
+                    for row in await conn.fetch(queries.GET_CACHE_VERSIONS):
+                        self._apply(row['name'], row['version'])
+                    try:
+                        await asyncio.wait_for(lost.wait(), timeout=self.heartbeat)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                conn.remove_termination_listener(on_termination)
+                if not conn.is_closed():
+                    await conn.remove_listener(queries.CACHE_CHANNEL, self._on_notify)
+
+        raise ConnectionError("соединение закрыто сервером")
+
+    def _on_notify(
+            self,
+            conn: Connection,
+            pid: int,
+            channel: str,
+            payload: str
+    ) -> None:
+
+        try:
+            name, version = payload.rsplit(':', 1)
+            self._apply(name, int(version))
+        except ValueError:
+            logger.warning(f"Некорректное уведомление в канале {channel}: {payload}")
+
+    def _apply(
+            self,
+            name: str,
+            version: int
+    ) -> None:
+        """Вызывает подписчиков, если версия кэша выросла"""
+
+        if version <= self.versions.get(name, -1):
+            return
+
+        self.versions[name] = version
+        logger.info(f"Кэш '{name}' устарел, новая версия {version}")
+
+        for callback in self._callbacks.get(name, []):
+            try:
+                result = callback(version)
+                if inspect.isawaitable(result):
+                    future = asyncio.ensure_future(result)
+                    self._pending.add(future)
+                    future.add_done_callback(self._pending.discard)
+            except Exception as exc:
+                logger.error(f"Ошибка сброса кэша '{name}': {exc}")
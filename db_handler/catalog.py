@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from .db_class import Database
+from . import queries
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок каталога подборок: темы → подтемы → эксперты → книги.
+
+    Attributes:
+        version (int): Версия каталога, из которой построен снимок
+        themes (List[str]): Названия общих тем в порядке сортировки БД
+        subthemes (Dict[str, List[str]]): Подтемы каждой общей темы
+        recommendations (Dict[str, Dict[int, Dict]]): Рекомендации экспертов по названию подтемы
+        theme_ids (Dict[Tuple[str, str], int]): ID темы по паре (тема, подтема)
+        theme_by_id (Dict[int, Tuple[str, str]]): Пара (тема, подтема) по ID темы
+        theme_keys (Dict[str, int]): ID первой подтемы общей темы, которым общая тема представлена в callback_data
+        experts (List[int]): ID экспертов в порядке сортировки по имени
+        expert_by_id (Dict[int, Tuple[str, str]]): Имя и должность эксперта по ID
+    """
+
+    def __init__(
+            self,
+            version: int,
+            theme_rows: List,
+            recommendation_rows: List,
+            expert_rows: List = ()
+    ) -> None:
+
+        self.version = version
+        self.themes: List[str] = []
+        self.subthemes: Dict[str, List[str]] = {}
+        self.recommendations: Dict[str, Dict[int, Dict]] = {}
+        self.theme_ids: Dict[Tuple[str, str], int] = {}
+        self.theme_by_id: Dict[int, Tuple[str, str]] = {}
+        self.theme_keys: Dict[str, int] = {}
+        self.experts: List[int] = []
+        self.expert_by_id: Dict[int, Tuple[str, str]] = {}
+
+        # Строки уже отсортированы по (theme_name, specific_theme), порядок совпадает с прежними запросами
+        for row in theme_rows:
+            theme_name = row['theme_name']
+            if theme_name not in self.subthemes:
+                self.themes.append(theme_name)
+                self.subthemes[theme_name] = []
+                self.theme_keys[theme_name] = row['theme_id']
+            self.subthemes[theme_name].append(row['specific_theme'])
+            self.theme_ids[(theme_name, row['specific_theme'])] = row['theme_id']
+            self.theme_by_id[row['theme_id']] = (theme_name, row['specific_theme'])
+
+        for row in recommendation_rows:
+            selections = self.recommendations.setdefault(row['specific_theme'], {})
+            expert = selections.setdefault(row['expert_id'], {
+                'name': row['expert_name'],
+                'position': row['expert_position'],
+                'books': []
+            })
+            expert['books'].append((row['book_name'], row['description']))
+
+        for row in expert_rows:
+            self.experts.append(row['expert_id'])
+            self.expert_by_id[row['expert_id']] = (row['expert_name'], row['expert_position'])
+
+    @classmethod
+    async def load(
+            cls,
+            db: Database,
+            version: int
+    ) -> "CatalogSnapshot":
+        """
+        Загрузка каталога тремя запросами вместо запроса на каждый клик
+
+        :param db: БД (пул или сессия)
+        :param version: Версия, которой будет помечен снимок
+        """
+
+        async with db.acquire() as conn:
+            theme_rows = await conn.fetch(queries.GET_CATALOG_THEMES)
+            recommendation_rows = await conn.fetch(queries.GET_CATALOG_RECOMMENDATIONS)
+            expert_rows = await conn.fetch(queries.GET_CATALOG_EXPERTS)
+
+        return cls(version, theme_rows, recommendation_rows, expert_rows)
+
+
+class CatalogCache:
+    """
+    Кэш каталога в памяти процесса. Читатели получают целый снимок, поэтому никогда
+    не видят каталог наполовину обновлённым; изменение данных лишь сбрасывает ссылку на снимок.
+
+    Attributes:
+        version (int): Текущая версия каталога, увеличивается при каждой инвалидации
+    """
+
+    def __init__(self) -> None:
+        self.version: int = 0
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def get(self, db: Database) -> CatalogSnapshot:
+        """
+        Текущий снимок каталога. При промахе загружается один раз, даже если
+        за ним пришли несколько обработчиков одновременно.
+
+        :param db: БД, через которую загружать каталог при промахе
+        """
+
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._snapshot is not None:
+                return self._snapshot
+
+            version = self.version
+            snapshot = await CatalogSnapshot.load(db, version)
+
+            # Каталог изменился во время загрузки: отдаём снимок этому запросу, но не кэшируем
+            if version == self.version:
+                self._snapshot = snapshot
+                logger.info(f"Каталог загружен в кэш (версия {version}, тем: {len(snapshot.theme_ids)})")
+
+            return snapshot
+
+    def invalidate(self, version: Optional[int] = None) -> None:
+        """
+        Сброс кэша после изменения каталога. Следующее обращение загрузит его заново
+
+        :param version: Версия каталога из БД (cache_versions). Уже учтённые версии игнорируются,
+            поэтому собственное уведомление процесса не сбрасывает кэш повторно
+        """
+
+        if version is not None and version <= self.version:
+            return
+
+        self.version = version if version is not None else self.version + 1
+        self._snapshot = None
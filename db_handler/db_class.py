@@ -1,37 +1,133 @@
-from typing import List, Optional
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
 
 from decouple import config
 
 import asyncpg
 from asyncpg.pool import Pool
-from asyncpg import Record
+from asyncpg import Record, Connection
+
+from db_handler.queries import PREPARED_STATEMENTS
+
+logger = logging.getLogger(__name__)
+
+
+async def prepare_statements(conn: Connection) -> None:
+    """
+    Хук пула (init): вызывается один раз для каждого нового соединения.
+
+    Подготавливает запросы из реестра PREPARED_STATEMENTS и кладёт их в кэш statement'ов соединения,
+    поэтому fetch/execute с этими текстами сразу выполняются по готовому handle, без разбора и планирования.
+    Пул создаётся с max_cached_statement_lifetime=0: редкие запросы (админка, ночной пересчёт, рассылки)
+    остаются в кэше, сколько бы ни простаивали, а statement_cache_size с запасом не даёт их вытеснить.
+    """
+
+    for query in PREPARED_STATEMENTS:
+        try:
+            # Тот же путь, которым asyncpg кэширует запрос при первом fetch(); публичный prepare() кэш не заполняет.
+            # Приватный вызов проверяется тестом TestPreparedStatementCache на каждой версии asyncpg
+            await conn._get_statement(query, None)
+        except asyncpg.PostgresError as exc:
+            logger.warning(f"Не удалось подготовить запрос, он будет подготовлен при первом вызове: {exc}")
 
 
 class Database:
     """
-    Обертка Pool из библиотеки
+    Обертка Pool из библиотеки. Один экземпляр на процесс: пул создаётся при старте бота
+    и закрывается только при его остановке.
 
     Attributes:
         pool (Pool): Класс Pool из asyncpg для взаимодействия с БД
+        conn (Connection): Соединение, закреплённое за сессией (см. session()), иначе None
+        acquire_wait (float): Сколько сессия ждала соединение из пула, сек; None, если не брала его
     """
 
     def __init__(self) -> None:
         self.pool: Optional[Pool] = None
+        self.conn: Optional[Connection] = None
+        self._refs: int = 0
+        self._lock: Optional[asyncio.Lock] = None
+        self._in_session: bool = False
+        self.acquire_wait: Optional[float] = None
 
     async def connect(self) -> None:
         """
-        Метод для подсоединения к БД
+        Метод для подсоединения к БД.
+
+        Идемпотентен: пул создаётся только при первом вызове, последующие вызовы
+        лишь увеличивают счётчик ссылок на уже открытый пул.
         """
 
-        self.pool = await asyncpg.create_pool(
-            user=config("PG_USER"),
-            password=config("PG_PASSWORD"),
-            database=config("PG_DB"),
-            host=config('PG_HOST'),
-            port=config("PG_PORT"),
-            min_size=1,
-            max_size=30
-        )
+        # Lock создаётся внутри работающего event loop (в Python 3.9 он привязывается к loop при создании)
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            if self._refs == 0:
+                self.pool = await asyncpg.create_pool(
+                    user=config("PG_USER"),
+                    password=config("PG_PASSWORD"),
+                    database=config("PG_DB"),
+                    host=config('PG_HOST'),
+                    port=config("PG_PORT"),
+                    min_size=1,
+                    max_size=30,
+                    init=prepare_statements,
+                    # Запас сверх реестра, чтобы разовые запросы не вытесняли подготовленные
+                    statement_cache_size=len(PREPARED_STATEMENTS) + 100,
+                    # Без срока жизни: по умолчанию запрос, не вызывавшийся 300 с, удаляется из кэша и готовится заново
+                    max_cached_statement_lifetime=0
+                )
+            self._refs += 1
+
+    @asynccontextmanager
+    async def session(self) -> AsyncIterator["Database"]:
+        """
+        Закрепляет за обработкой апдейта не более одного соединения из пула.
+        Соединение берётся при первом запросе, поэтому апдейты, обслуженные из кэша,
+        не обращаются к пулу вовсе.
+
+        :return: Экземпляр Database, все запросы которого идут через это соединение
+        """
+
+        if self.pool is None:
+            raise RuntimeError("База данных не подключена. Вызовите сначала connect()")
+
+        session = Database()
+        session.pool = self.pool
+        session._in_session = True
+        try:
+            yield session
+        finally:
+            if session.conn is not None:
+                await self.pool.release(session.conn)
+                session.conn = None
+
+    def acquire(self):
+        """
+        Соединение для запроса: закреплённое за сессией или свободное из пула
+        """
+
+        if self._in_session:
+            return self._session_connection()
+
+        if self.pool is None:
+            raise RuntimeError("База данных не подключена. Вызовите сначала connect()")
+
+        return self.pool.acquire()
+
+    @asynccontextmanager
+    async def _session_connection(self) -> AsyncIterator[Connection]:
+        """Отдаёт соединение сессии, при первом обращении беря его из пула"""
+
+        if self.conn is None:
+            started = time.perf_counter()
+            self.conn = await self.pool.acquire()
+            self.acquire_wait = time.perf_counter() - started
+        yield self.conn
 
     async def execute(
             self,
@@ -39,10 +135,7 @@ class Database:
             *args
     ) -> str:
 
-        if self.pool is None:
-            raise RuntimeError("База данных не подключена. Вызовите сначала connect()")
-
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             return await conn.execute(query, *args)
 
     async def fetch(
@@ -51,10 +144,7 @@ class Database:
             *args
     ) -> List[Record]:
 
-        if self.pool is None:
-            raise RuntimeError("База данных не подключена. Вызовите сначала connect()")
-
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             return await conn.fetch(query, *args)
 
     async def fetchval(
@@ -62,10 +152,7 @@ class Database:
             query: str,
             *args
     ) -> Optional[any]:
-        if self.pool is None:
-            raise RuntimeError("База данных не подключена. Вызовите сначала connect()")
-
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             return await conn.fetchval(query, *args)
 
     async def fetchrow(
@@ -74,14 +161,22 @@ class Database:
             *args
     ) -> Optional[Record]:
 
-        if self.pool is None:
-            raise RuntimeError("База данных не подключена. Вызовите сначала connect()")
-
-        async with self.pool.acquire() as conn:
+        async with self.acquire() as conn:
             return await conn.fetchrow(query, *args)
 
     async def close(self) -> None:
-        """Закрытие БД"""
+        """
+        Закрытие БД. Пул закрывается только когда его отпустил последний владелец,
+        поэтому лишний close() не обрывает запросы других обработчиков.
+        """
+
+        # Сессия не владеет пулом: соединение вернёт в пул session()
+        if self.pool is None or self._in_session:
+            return
+
+        self._refs = max(self._refs - 1, 0)
+        if self._refs == 0:
+            pool, self.pool = self.pool, None
+            # Закрытый пул не остаётся в атрибуте: acquire() сообщит «не подключена», connect() создаст новый
+            await pool.close()
 
-        if self.pool is not None:
-            await self.pool.close()
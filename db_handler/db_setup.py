@@ -123,11 +123,66 @@ async def init_db():
                 FOREIGN KEY(user_id) REFERENCES users (user_id) ON DELETE CASCADE,
                 FOREIGN KEY(theme_id) REFERENCES themes (theme_id) ON DELETE SET NULL
             );
+
+            -- Профиль для рекомендаций: последние просмотренные подтемы (новые первыми) и средний --
+            -- эмбеддинг этих подтем в float16; vector_key — модель и версия каталога, по которым он посчитан --
+            CREATE TABLE IF NOT EXISTS user_profiles (
+                user_id BIGINT PRIMARY KEY,
+                theme_ids INT[] NOT NULL DEFAULT '{}',
+                vector BYTEA DEFAULT NULL,
+                vector_theme_ids INT[] DEFAULT NULL,
+                vector_key VARCHAR(200) DEFAULT NULL,
+
+                FOREIGN KEY(user_id) REFERENCES users (user_id) ON DELETE CASCADE
+            );
+
+            -- Кандидаты рекомендаций, посчитанные ночной задачей; годны, пока last_log_id пользователя --
+            -- и версия каталога не изменились --
+            CREATE TABLE IF NOT EXISTS precomputed_recommendations (
+                user_id BIGINT PRIMARY KEY,
+                theme_ids INT[] NOT NULL,
+                last_log_id INT,
+                catalog_version BIGINT NOT NULL,
+                computed_at TIMESTAMP DEFAULT NOW(),
+
+                FOREIGN KEY(user_id) REFERENCES users (user_id) ON DELETE CASCADE
+            );
+
+            -- Рассылки: содержимое (text или photo_id и caption) и состояние running, done или cancelled --
+            CREATE TABLE IF NOT EXISTS broadcast_jobs (
+                job_id SERIAL PRIMARY KEY,
+                admin_id BIGINT NOT NULL,
+                content_type VARCHAR(10) NOT NULL,
+                content JSONB NOT NULL,
+                status VARCHAR(10) NOT NULL DEFAULT 'running',
+                status_message_id BIGINT DEFAULT NULL,  -- Сообщение администратора с ходом рассылки --
+                created_at TIMESTAMP DEFAULT NOW(),
+                finished_at TIMESTAMP DEFAULT NULL
+            );
+
+            -- Получатели рассылки: pending, sending (взят воркером), sent, failed или blocked (бот заблокирован) --
+            CREATE TABLE IF NOT EXISTS broadcast_recipients (
+                job_id INT NOT NULL,
+                user_id BIGINT NOT NULL,
+                status VARCHAR(10) NOT NULL DEFAULT 'pending',
+                claimed_at TIMESTAMP DEFAULT NULL,
+
+                PRIMARY KEY (job_id, user_id),
+                FOREIGN KEY(job_id) REFERENCES broadcast_jobs (job_id) ON DELETE CASCADE
+            );
+
+            -- Версии кэшируемых ботом данных ('catalog', 'roles'), см. CacheListener --
+            CREATE TABLE IF NOT EXISTS cache_versions (
+                name VARCHAR(20) PRIMARY KEY,
+                version BIGINT NOT NULL DEFAULT 0
+            );
             
             CREATE INDEX IF NOT EXISTS idx_user_activity_logs_user_id_request_time ON user_activity_logs (user_id, request_time);
             CREATE INDEX IF NOT EXISTS idx_user_activity_logs_request_type ON user_activity_logs (request_type);
             CREATE INDEX IF NOT EXISTS idx_user_activity_logs_recent_activity ON user_activity_logs (request_time, user_id);
+            CREATE INDEX IF NOT EXISTS idx_user_activity_logs_user_theme_log ON user_activity_logs (user_id, log_id) WHERE theme_id IS NOT NULL;
             CREATE INDEX IF NOT EXISTS idx_users_status ON users (status);
+            CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_unsent ON broadcast_recipients (job_id, user_id) WHERE status IN ('pending', 'sending');
         """)
 
         admins_ids = [int(admin_id) for admin_id in config('ADMINS').split(',')]
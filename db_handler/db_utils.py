@@ -11,6 +11,8 @@ from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, Teleg
 from aiogram.enums import ChatMemberStatus
 import asyncio
 from .db_class import Database
+from .catalog import CatalogCache, CatalogSnapshot
+from . import queries
 
 
 logging.basicConfig(level=logging.INFO)
@@ -33,18 +35,41 @@ class DBUtils:
     Attributes:
         db (Database): Класс нашей БД
         bot (Bot): Телеграмм бот
+        catalog (CatalogCache): Кэш каталога подборок; если не задан, каталог читается из БД
     """
     def __init__(
             self,
             db: Optional[Database],
-            bot: Bot
+            bot: Bot,
+            catalog: Optional[CatalogCache] = None
     ) -> None:
 
         self.db: Database = db
         self.bot: Bot = bot
+        self.catalog: Optional[CatalogCache] = catalog
+
+    @staticmethod
+    async def _bump_cache_version(
+            conn: asyncpg.Connection,
+            name: str
+    ) -> int:
+        """
+        Увеличивает версию кэша внутри текущей транзакции и уведомляет другие процессы (NOTIFY)
+
+        :param name: Имя кэша в cache_versions ('catalog', 'roles')
+        :return: Новая версия
+        """
+
+        return await conn.fetchval(queries.BUMP_CACHE_VERSION, name)
+
+    def _invalidate_catalog(self, version: int) -> None:
+        """Сброс кэша каталога после зафиксированного изменения подборок"""
+
+        if self.catalog is not None:
+            self.catalog.invalidate(version)
 
     async def get_admin_ids(self):
-        rows = await self.db.fetch("SELECT user_id FROM users WHERE role = 'admin'")
+        rows = await self.db.fetch(queries.GET_ADMIN_IDS)
         return [row['user_id'] for row in rows]
 
     async def register_user(
@@ -62,14 +87,7 @@ class DBUtils:
 
         try:
             result = await self.db.fetchrow(
-                """
-                    INSERT INTO users (user_id, username, registration_date, role) 
-                    VALUES 
-                        ($1, $2, NOW() AT TIME ZONE 'Europe/Moscow', 'user')
-                        ON CONFLICT (user_id)
-                        DO UPDATE SET username = EXCLUDED.username
-                        RETURNING (xmax = 0) AS is_new
-                """,
+                queries.REGISTER_USER,
                 user_id,
                 username
             )
@@ -104,10 +122,7 @@ class DBUtils:
                 return False
 
             await self.db.execute(
-                """
-                INSERT INTO user_activity_logs (user_id, request_type, theme_id) 
-                VALUES ($1, $2, $3)
-                """,
+                queries.LOG_USER_ACTIVITY,
                 user_id,
                 activity_type,
                 theme_id
@@ -119,18 +134,26 @@ class DBUtils:
             logger.error(f"Ошибка логирования активности: {exc}")
             return False
 
+    async def get_catalog(self) -> CatalogSnapshot:
+        """
+        Снимок каталога подборок: из кэша, а если кэш не подключён — загруженный из БД
+
+        :return: CatalogSnapshot, только для чтения
+        """
+
+        if self.catalog is not None:
+            return await self.catalog.get(self.db)
+
+        return await CatalogSnapshot.load(self.db, version=0)
+
     async def get_available_themes(self) -> List[str]:
         """Получение списка уникальных названий тем"""
 
         try:
-            result = await self.db.fetch(
-                """
-                SELECT DISTINCT 
-                    theme_name 
-                FROM themes 
-                ORDER BY theme_name
-                """
-            )
+            if self.catalog is not None:
+                return (await self.catalog.get(self.db)).themes
+
+            result = await self.db.fetch(queries.GET_AVAILABLE_THEMES)
             return [row['theme_name'] for row in result]  # Извлекаем только названия
 
         except Exception as exc:
@@ -144,14 +167,11 @@ class DBUtils:
         """Получаем список подтем для кнопок"""
 
         try:
+            if self.catalog is not None:
+                return (await self.catalog.get(self.db)).subthemes.get(theme_name, [])
+
             result = await self.db.fetch(
-                """
-                SELECT 
-                    specific_theme 
-                FROM themes 
-                WHERE theme_name = $1 
-                ORDER BY specific_theme
-                """,
+                queries.GET_SUBTHEMES,
                 theme_name
             )
             return [row['specific_theme'] for row in result]
@@ -170,21 +190,11 @@ class DBUtils:
         :return selections: Возвращает словарь ID автора - (имя автора, должность, список книг и описаний)
         """
         try:
+            if self.catalog is not None:
+                return (await self.catalog.get(self.db)).recommendations.get(subtheme_name)
+
             recommendations = await self.db.fetch(
-                """
-                SELECT
-                    e.expert_id,
-                    e.expert_name, 
-                    e.expert_position, 
-                    b.book_name,  
-                    er.description
-                FROM
-                    experts_recommendations er
-                    JOIN books b ON er.book_id = b.book_id
-                    JOIN experts e ON er.expert_id = e.expert_id
-                    JOIN themes t ON er.theme_id = t.theme_id
-                WHERE t.specific_theme = $1
-                """,
+                queries.GET_EXPERT_RECOMMENDATIONS,
                 subtheme_name
             )
             
@@ -219,14 +229,7 @@ class DBUtils:
         """
         try:
             result = await self.db.fetchrow(
-                """
-                SELECT 
-                    request_time 
-                FROM user_activity_logs 
-                WHERE user_id = $1 
-                ORDER BY request_time DESC 
-                LIMIT 1
-                """,
+                queries.GET_LAST_ACTIVITY,
                 user_id
             )
 
@@ -364,14 +367,11 @@ class DBUtils:
         :return: ID темы или None, если не найдено
         """
         try:
+            if self.catalog is not None:
+                return (await self.catalog.get(self.db)).theme_ids.get((theme_name, subtheme_name))
+
             result = await self.db.fetchrow(
-                """
-                SELECT 
-                    theme_id 
-                FROM themes 
-                WHERE theme_name = $1 
-                    AND specific_theme = $2
-                """,
+                queries.GET_THEME_ID,
                 theme_name,
                 subtheme_name
             )
@@ -417,7 +417,7 @@ class DBUtils:
                 'books': {}
             }
 
-            async with self.db.pool.acquire() as conn:
+            async with self.db.acquire() as conn:
                 async with conn.transaction():
                     for _, row in grouped.iterrows():
                         expert_key = (row['expert_name'].strip(), row['expert_position'].strip())
@@ -487,6 +487,8 @@ class DBUtils:
                                 cache['books'][book_name],
                                 description.strip()
                             )
+                    version = await self._bump_cache_version(conn, 'catalog')
+            self._invalidate_catalog(version)
             return True
         except Exception as e:
             logger.error(f"Ошибка загрузки данных: {e}")
@@ -500,7 +502,7 @@ class DBUtils:
         :return: True при успешном удалении, False при ошибке или если книга не найдена
         """
         try:
-            async with self.db.pool.acquire() as conn:
+            async with self.db.acquire() as conn:
                 async with conn.transaction():
                     await conn.execute(
                         """
@@ -527,11 +529,14 @@ class DBUtils:
                         )
                         """
                     )
-                    if result == "DELETE 0":
-                        logger.warning(f"Книга '{book_name}' не найдена")
-                        return False
-                    logger.info(f"Книга '{book_name}' успешно удалена")
-                    return True
+                    version = await self._bump_cache_version(conn, 'catalog')
+            # Сбрасываем кэш только после коммита, иначе он успеет перечитать старые данные
+            self._invalidate_catalog(version)
+            if result == "DELETE 0":
+                logger.warning(f"Книга '{book_name}' не найдена")
+                return False
+            logger.info(f"Книга '{book_name}' успешно удалена")
+            return True
         except Exception as exc:
             logger.error(f"Ошибка при удалении книги '{book_name}': {exc}")
             return False
@@ -545,7 +550,7 @@ class DBUtils:
         :return: True при успешном удалении, False при ошибке или если подборка не найдена
         """
         try:
-            async with self.db.pool.acquire() as conn:
+            async with self.db.acquire() as conn:
                 async with conn.transaction():
                     await conn.execute(
                         """
@@ -564,11 +569,13 @@ class DBUtils:
                         """,
                         theme_name, subtheme_name
                     )
-                    if result == "DELETE 0":
-                        logger.warning(f"Подборка '{theme_name}/{subtheme_name}' не найдена")
-                        return False
-                    logger.info(f"Подборка '{theme_name}/{subtheme_name}' успешно удалена")
-                    return True
+                    version = await self._bump_cache_version(conn, 'catalog')
+            self._invalidate_catalog(version)
+            if result == "DELETE 0":
+                logger.warning(f"Подборка '{theme_name}/{subtheme_name}' не найдена")
+                return False
+            logger.info(f"Подборка '{theme_name}/{subtheme_name}' успешно удалена")
+            return True
         except Exception as exc:
             logger.error(f"Ошибка при удалении подборки '{theme_name}/{subtheme_name}': {exc}")
             return False
@@ -582,7 +589,7 @@ class DBUtils:
         :return: True при успешном удалении, False при ошибке или если эксперт не найден
         """
         try:
-            async with self.db.pool.acquire() as conn:
+            async with self.db.acquire() as conn:
                 async with conn.transaction():
                     await conn.execute(
                         """
@@ -609,11 +616,13 @@ class DBUtils:
                     )
                     """
                 )
-                    if result == "DELETE 0":
-                        logger.warning(f"Эксперт '{expert_name}, {expert_position}' не найден")
-                        return False
-                    logger.info(f"Эксперт '{expert_name}, {expert_position}' успешно удален")
-                    return True
+                    version = await self._bump_cache_version(conn, 'catalog')
+            self._invalidate_catalog(version)
+            if result == "DELETE 0":
+                logger.warning(f"Эксперт '{expert_name}, {expert_position}' не найден")
+                return False
+            logger.info(f"Эксперт '{expert_name}, {expert_position}' успешно удален")
+            return True
         except Exception as exc:
             logger.error(f"Ошибка при удалении эксперта '{expert_name}, {expert_position}': {exc}")
             return False
@@ -625,20 +634,7 @@ class DBUtils:
         :return: Список ID пользователей, у которых последняя активность 'subscribe'
         """
         try:
-            result = await self.db.fetch(
-                """
-                SELECT DISTINCT user_id
-                FROM (
-                    SELECT 
-                        user_id,
-                        request_type,
-                        ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY request_time DESC) AS rn
-                    FROM user_activity_logs
-                    WHERE request_type IN ('subscribe', 'unsubscribe')
-                ) AS sub
-                WHERE rn = 1 AND request_type = 'subscribe'
-                """
-            )
+            result = await self.db.fetch(queries.GET_SUBSCRIBED_USERS)
             return [row['user_id'] for row in result]
         except Exception as exc:
             logger.error(f"Ошибка при получении списка подписанных пользователей: {exc}")
@@ -650,14 +646,7 @@ class DBUtils:
         """
 
         try:
-            result = await self.db.fetch(
-                """
-                SELECT 
-                    expert_name, expert_position
-                FROM experts
-                ORDER BY expert_name
-                """
-            )
+            result = await self.db.fetch(queries.GET_AVAILABLE_EXPERTS)
             return [[row['expert_name'], row['expert_position']] for row in result]
 
         except Exception as exc:
@@ -674,14 +663,7 @@ class DBUtils:
         """
         try:
             result = await self.db.fetchrow(
-                """
-                SELECT 
-                    request_type 
-                FROM user_activity_logs 
-                WHERE user_id = $1 AND request_type IN ('subscribe', 'unsubscribe') 
-                ORDER BY request_time DESC 
-                LIMIT 1
-                """,
+                queries.IS_SUBSCRIBED_NEWSLETTER,
                 user_id
             )
 
@@ -699,16 +681,15 @@ class DBUtils:
             user_id: int
     ) -> None:
         """
-        Обновляет статус пользователя
+        Назначает пользователя администратором. Остальные процессы узнают об этом через NOTIFY
         """
-        await self.db.execute(
-            """
-            UPDATE users
-            SET role='admin'
-            WHERE user_id=$1
-            """,
-            user_id
-        )
+        async with self.db.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    queries.ASSIGN_ADMIN_ROLE,
+                    user_id
+                )
+                await self._bump_cache_version(conn, 'roles')
 
     async def is_user_channel_member(self, user_id: int) -> bool:
         """
@@ -739,16 +720,10 @@ class DBUtils:
         
     async def update_user_status(self, user_id: int, status: str):
         """Обновляет статус пользователя"""
-        query = """
-            UPDATE users
-            SET status = $1
-            WHERE user_id = $2
-        """
-        await self.db.execute(query, status, user_id)
+        await self.db.execute(queries.UPDATE_USER_STATUS, status, user_id)
         
     async def check_users_status(self):
         logger.info("Запуск проверки статуса пользователей...")
-        await self.db.connect()
         try:
             users = await self.get_all_users()
             logger.info(f"Проверка статуса для {len(users)} пользователей")
@@ -766,10 +741,8 @@ class DBUtils:
                     # await self.log_user_activity(user_id, activity_type='chat_unavailable', theme_id=None)
                 await asyncio.sleep(0.1)
         finally:
-            await self.db.close()
             logger.info("Проверка и обновление статуса пользователей завершена.")
 
     async def get_all_users(self):
         """Получает список всех пользователей для проверки."""
-        query = "SELECT user_id FROM users"
-        return await self.db.fetch(query)
+        return await self.db.fetch(queries.GET_ALL_USERS)
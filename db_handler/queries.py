@@ -0,0 +1,424 @@
+"""
+Тексты часто выполняемых запросов.
+
+Запросы из PREPARED_STATEMENTS подготавливаются один раз на каждое соединение пула
+(см. Database.connect), после чего выполняются по готовому handle без повторного разбора и планирования.
+"""
+
+GET_ADMIN_IDS = "SELECT user_id FROM users WHERE role = 'admin'"
+
+REGISTER_USER = """
+    INSERT INTO users (user_id, username, registration_date, role)
+    VALUES
+        ($1, $2, NOW() AT TIME ZONE 'Europe/Moscow', 'user')
+        ON CONFLICT (user_id)
+        DO UPDATE SET username = EXCLUDED.username
+        RETURNING (xmax = 0) AS is_new
+"""
+
+# Просмотр подтемы добавляется в начало кольцевого буфера профиля (последние 12 подтем).
+# Новый профиль заполняется историей просмотров, записанной до его появления
+LOG_USER_ACTIVITY = """
+    WITH logged AS (
+        INSERT INTO user_activity_logs (user_id, request_type, theme_id)
+        VALUES ($1, $2, $3)
+        RETURNING user_id, theme_id
+    )
+    INSERT INTO user_profiles (user_id, theme_ids)
+    SELECT
+        user_id,
+        (ARRAY[theme_id] || ARRAY(
+            SELECT ual.theme_id FROM user_activity_logs ual
+            WHERE ual.user_id = $1 AND ual.theme_id IS NOT NULL
+            ORDER BY ual.log_id DESC
+            LIMIT 11
+        ))[1:12]
+    FROM logged
+    WHERE theme_id IS NOT NULL
+    ON CONFLICT (user_id) DO UPDATE
+    SET theme_ids = (ARRAY[EXCLUDED.theme_ids[1]] || user_profiles.theme_ids)[1:12]
+"""
+
+GET_AVAILABLE_THEMES = """
+    SELECT DISTINCT
+        theme_name
+    FROM themes
+    ORDER BY theme_name
+"""
+
+GET_SUBTHEMES = """
+    SELECT
+        specific_theme
+    FROM themes
+    WHERE theme_name = $1
+    ORDER BY specific_theme
+"""
+
+GET_EXPERT_RECOMMENDATIONS = """
+    SELECT
+        e.expert_id,
+        e.expert_name,
+        e.expert_position,
+        b.book_name,
+        er.description
+    FROM
+        experts_recommendations er
+        JOIN books b ON er.book_id = b.book_id
+        JOIN experts e ON er.expert_id = e.expert_id
+        JOIN themes t ON er.theme_id = t.theme_id
+    WHERE t.specific_theme = $1
+"""
+
+GET_LAST_ACTIVITY = """
+    SELECT
+        request_time
+    FROM user_activity_logs
+    WHERE user_id = $1
+    ORDER BY request_time DESC
+    LIMIT 1
+"""
+
+GET_THEME_ID = """
+    SELECT
+        theme_id
+    FROM themes
+    WHERE theme_name = $1
+        AND specific_theme = $2
+"""
+
+# Подписчики без заблокировавших бота: им рассылка не отправляется
+GET_SUBSCRIBED_USERS = """
+    SELECT DISTINCT sub.user_id
+    FROM (
+        SELECT
+            user_id,
+            request_type,
+            ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY request_time DESC) AS rn
+        FROM user_activity_logs
+        WHERE request_type IN ('subscribe', 'unsubscribe')
+    ) AS sub
+    JOIN users u ON u.user_id = sub.user_id
+    WHERE sub.rn = 1 AND sub.request_type = 'subscribe' AND u.status <> 'blocked'
+"""
+
+GET_AVAILABLE_EXPERTS = """
+    SELECT
+        expert_name, expert_position
+    FROM experts
+    ORDER BY expert_name
+"""
+
+IS_SUBSCRIBED_NEWSLETTER = """
+    SELECT
+        request_type
+    FROM user_activity_logs
+    WHERE user_id = $1 AND request_type IN ('subscribe', 'unsubscribe')
+    ORDER BY request_time DESC
+    LIMIT 1
+"""
+
+ASSIGN_ADMIN_ROLE = """
+    UPDATE users
+    SET role='admin'
+    WHERE user_id=$1
+"""
+
+UPDATE_USER_STATUS = """
+    UPDATE users
+    SET status = $1
+    WHERE user_id = $2
+"""
+
+GET_ALL_USERS = "SELECT user_id FROM users"
+
+# Версии кэшей. Увеличиваются в транзакции изменения, NOTIFY доставляется слушателям после коммита
+CACHE_CHANNEL = "cache_invalidation"
+
+BUMP_CACHE_VERSION = f"""
+    WITH bumped AS (
+        INSERT INTO cache_versions (name, version)
+        VALUES ($1, 1)
+        ON CONFLICT (name) DO UPDATE SET version = cache_versions.version + 1
+        RETURNING name, version
+    )
+    SELECT
+        version,
+        pg_notify('{CACHE_CHANNEL}', name || ':' || version)
+    FROM bumped
+"""
+
+GET_CACHE_VERSIONS = "SELECT name, version FROM cache_versions"
+
+# Загрузка каталога целиком для CatalogCache
+GET_CATALOG_THEMES = """
+    SELECT
+        theme_id,
+        theme_name,
+        specific_theme
+    FROM themes
+    ORDER BY theme_name, specific_theme
+"""
+
+GET_CATALOG_RECOMMENDATIONS = """
+    SELECT
+        t.specific_theme,
+        e.expert_id,
+        e.expert_name,
+        e.expert_position,
+        b.book_name,
+        er.description
+    FROM
+        experts_recommendations er
+        JOIN books b ON er.book_id = b.book_id
+        JOIN experts e ON er.expert_id = e.expert_id
+        JOIN themes t ON er.theme_id = t.theme_id
+    ORDER BY er.rec_id
+"""
+
+GET_CATALOG_EXPERTS = """
+    SELECT
+        expert_id,
+        expert_name,
+        expert_position
+    FROM experts
+    ORDER BY expert_name
+"""
+
+# Запросы рекомендательной системы
+GET_THEME_TEXTS = "SELECT theme_id, specific_theme FROM themes ORDER BY theme_id"
+
+# Всё, что нужно рекомендациям до поиска, одним запросом: последний просмотр подтемы (пока он не меняется,
+# кандидаты те же), просмотренные подтемы, профиль, последние 12 подтем из логов (только если профиля ещё нет)
+# и кандидаты ночного пересчёта
+GET_RECOMMENDATION_CONTEXT = """
+    WITH views AS (
+        SELECT log_id, theme_id FROM user_activity_logs
+        WHERE user_id = $1 AND theme_id IS NOT NULL
+    )
+    SELECT
+        (SELECT MAX(log_id) FROM views) AS last_log_id,
+        ARRAY(SELECT DISTINCT theme_id FROM views) AS seen_theme_ids,
+        CASE WHEN p.user_id IS NULL THEN ARRAY(
+            SELECT v.theme_id FROM views v
+            JOIN themes t ON t.theme_id = v.theme_id
+            ORDER BY v.log_id DESC
+            LIMIT 12
+        ) END AS history_theme_ids,
+        p.theme_ids,
+        p.vector,
+        p.vector_theme_ids,
+        p.vector_key,
+        pr.theme_ids AS precomputed_theme_ids,
+        pr.last_log_id AS precomputed_log_id,
+        pr.catalog_version AS precomputed_version
+    FROM (VALUES ($1::bigint)) u (user_id)
+    LEFT JOIN user_profiles p ON p.user_id = u.user_id
+    LEFT JOIN precomputed_recommendations pr ON pr.user_id = u.user_id
+"""
+
+# Вектор сохраняется, только если буфер не изменился, пока он считался
+SAVE_PROFILE_VECTOR = """
+    UPDATE user_profiles
+    SET vector = $2, vector_theme_ids = $3, vector_key = $4
+    WHERE user_id = $1 AND theme_ids = $3
+"""
+
+CREATE_USER_PROFILE = """
+    INSERT INTO user_profiles (user_id, theme_ids, vector, vector_theme_ids, vector_key)
+    VALUES ($1, $2, $3, $2, $4)
+    ON CONFLICT (user_id) DO NOTHING
+"""
+
+# Профили активных пользователей порциями по user_id (keyset-пагинация) для ночного пересчёта рекомендаций
+GET_ACTIVE_PROFILES_CHUNK = """
+    SELECT
+        p.user_id,
+        p.theme_ids,
+        (SELECT MAX(l.log_id) FROM user_activity_logs l
+         WHERE l.user_id = p.user_id AND l.theme_id IS NOT NULL) AS last_log_id,
+        ARRAY(SELECT DISTINCT l.theme_id FROM user_activity_logs l
+              WHERE l.user_id = p.user_id AND l.theme_id IS NOT NULL) AS seen_theme_ids
+    FROM user_profiles p
+    JOIN users u ON u.user_id = p.user_id
+    WHERE u.status = 'active' AND p.user_id > $1
+    ORDER BY p.user_id
+    LIMIT $2
+"""
+
+SAVE_PRECOMPUTED_RECOMMENDATIONS = """
+    INSERT INTO precomputed_recommendations (user_id, theme_ids, last_log_id, catalog_version, computed_at)
+    VALUES ($1, $2, $3, $4, NOW())
+    ON CONFLICT (user_id) DO UPDATE
+    SET theme_ids = EXCLUDED.theme_ids,
+        last_log_id = EXCLUDED.last_log_id,
+        catalog_version = EXCLUDED.catalog_version,
+        computed_at = EXCLUDED.computed_at
+"""
+
+GET_LAST_LOG_ID = """
+    SELECT COALESCE(MAX(log_id), 0) FROM user_activity_logs
+"""
+
+# Просмотры подтем из логов в диапазоне log_id: пары (пользователь, подтема) без повторов двумя массивами
+GET_THEME_VIEWS_SINCE = """
+    SELECT
+        COALESCE(array_agg(user_id), '{}') AS user_ids,
+        COALESCE(array_agg(theme_id), '{}') AS theme_ids
+    FROM (
+        SELECT DISTINCT user_id, theme_id FROM user_activity_logs
+        WHERE log_id > $1 AND log_id <= $2 AND theme_id IS NOT NULL
+    ) views
+"""
+
+# Популярность подтем по просмотрам подборок за окно в $2 дней: вклад просмотра убывает вдвое каждые $1 секунд
+GET_POPULAR_THEMES = """
+    SELECT ual.theme_id
+    FROM user_activity_logs ual
+    JOIN themes t ON t.theme_id = ual.theme_id
+    WHERE ual.request_type = 'get_expert_recommendation'
+      AND ual.request_time > NOW() - $2::float8 * INTERVAL '1 day'
+    GROUP BY ual.theme_id
+    ORDER BY SUM(POWER(0.5, EXTRACT(EPOCH FROM NOW() - ual.request_time)::float8 / $1::float8)) DESC
+    LIMIT $3
+"""
+
+GET_RECOMMENDATION_DETAILS = """
+    SELECT
+        t.theme_id,
+        t.theme_name,
+        t.specific_theme,
+        e.expert_name,
+        e.expert_position,
+        b.book_name,
+        er.description
+    FROM themes t
+    JOIN experts_recommendations er ON t.theme_id = er.theme_id
+    JOIN experts e ON er.expert_id = e.expert_id
+    JOIN books b ON er.book_id = b.book_id
+    WHERE t.theme_id = ANY($1::int[])
+    ORDER BY t.theme_id
+"""
+
+# Рассылки. Задание создаётся одним запросом вместе со списком получателей
+CREATE_BROADCAST_JOB = """
+    WITH job AS (
+        INSERT INTO broadcast_jobs (admin_id, content_type, content)
+        VALUES ($1, $2, $3::jsonb)
+        RETURNING job_id
+    ), recipients AS (
+        INSERT INTO broadcast_recipients (job_id, user_id)
+        SELECT job.job_id, recipient FROM job, unnest($4::bigint[]) AS recipient
+        ON CONFLICT DO NOTHING
+    )
+    SELECT job_id FROM job
+"""
+
+GET_BROADCAST_JOB = """
+    SELECT job_id, admin_id, content_type, content, status, status_message_id
+    FROM broadcast_jobs
+    WHERE job_id = $1
+"""
+
+SET_BROADCAST_STATUS_MESSAGE = "UPDATE broadcast_jobs SET status_message_id = $2 WHERE job_id = $1"
+
+GET_RUNNING_BROADCAST_JOBS = "SELECT job_id FROM broadcast_jobs WHERE status = 'running' ORDER BY job_id"
+
+# Получатели, взятые воркером, который дольше срока аренды ($1, секунды) не сохранил итоги,
+# то есть воркером остановленного процесса, снова ждут отправки. Порции живых воркеров не трогаются
+RELEASE_BROADCAST_CLAIMS = """
+    UPDATE broadcast_recipients r
+    SET status = 'pending', claimed_at = NULL
+    FROM broadcast_jobs j
+    WHERE j.job_id = r.job_id AND j.status = 'running' AND r.status = 'sending'
+      AND r.claimed_at < NOW() - make_interval(secs => $1)
+"""
+
+# Порция получателей для воркера; строки, уже взятые другими воркерами, пропускаются.
+# У остановленного задания (в том числе другим процессом) порций нет.
+# MATERIALIZED: подзапрос в FROM планировщик может перевыполнять для каждой строки r,
+# и каждый повтор с SKIP LOCKED брал бы следующую порцию
+CLAIM_BROADCAST_RECIPIENTS = """
+    WITH claimed AS MATERIALIZED (
+        SELECT br.user_id
+        FROM broadcast_recipients br
+        JOIN broadcast_jobs j ON j.job_id = br.job_id
+        WHERE br.job_id = $1 AND j.status = 'running' AND br.status = 'pending'
+        ORDER BY br.user_id
+        LIMIT $2
+        FOR UPDATE OF br SKIP LOCKED
+    )
+    UPDATE broadcast_recipients r
+    SET status = 'sending', claimed_at = NOW()
+    FROM claimed
+    WHERE r.job_id = $1 AND r.user_id = claimed.user_id
+    RETURNING r.user_id
+"""
+
+# Получатели, взятые воркерами других процессов, пока задание не остановлено
+GET_CLAIMED_BROADCAST_COUNT = """
+    SELECT COUNT(*)
+    FROM broadcast_recipients r
+    JOIN broadcast_jobs j ON j.job_id = r.job_id
+    WHERE r.job_id = $1 AND j.status = 'running' AND r.status = 'sending'
+"""
+
+# Итоги порции: статусы получателей; заблокировавшие бота помечаются в users
+SAVE_BROADCAST_RESULTS = """
+    WITH results AS (
+        UPDATE broadcast_recipients r
+        SET status = v.status
+        FROM unnest($2::bigint[], $3::varchar[]) AS v(user_id, status)
+        WHERE r.job_id = $1 AND r.user_id = v.user_id
+        RETURNING r.user_id, r.status
+    )
+    UPDATE users
+    SET status = 'blocked'
+    WHERE user_id IN (SELECT user_id FROM results WHERE status = 'blocked')
+"""
+
+GET_BROADCAST_COUNTS = """
+    SELECT status, COUNT(*) AS count
+    FROM broadcast_recipients
+    WHERE job_id = $1
+    GROUP BY status
+"""
+
+FINISH_BROADCAST_JOB = """
+    UPDATE broadcast_jobs
+    SET status = $2, finished_at = NOW()
+    WHERE job_id = $1 AND status = 'running'
+"""
+
+PREPARED_STATEMENTS = (
+    GET_ADMIN_IDS,
+    REGISTER_USER,
+    LOG_USER_ACTIVITY,
+    GET_AVAILABLE_THEMES,
+    GET_SUBTHEMES,
+    GET_EXPERT_RECOMMENDATIONS,
+    GET_LAST_ACTIVITY,
+    GET_THEME_ID,
+    GET_SUBSCRIBED_USERS,
+    GET_AVAILABLE_EXPERTS,
+    IS_SUBSCRIBED_NEWSLETTER,
+    ASSIGN_ADMIN_ROLE,
+    UPDATE_USER_STATUS,
+    GET_ALL_USERS,
+    BUMP_CACHE_VERSION,
+    GET_CACHE_VERSIONS,
+    GET_CATALOG_THEMES,
+    GET_CATALOG_RECOMMENDATIONS,
+    GET_CATALOG_EXPERTS,
+    GET_THEME_TEXTS,
+    GET_RECOMMENDATION_CONTEXT,
+    SAVE_PROFILE_VECTOR,
+    CREATE_USER_PROFILE,
+    GET_ACTIVE_PROFILES_CHUNK,
+    SAVE_PRECOMPUTED_RECOMMENDATIONS,
+    GET_LAST_LOG_ID,
+    GET_THEME_VIEWS_SINCE,
+    GET_POPULAR_THEMES,
+    GET_RECOMMENDATION_DETAILS,
+    CLAIM_BROADCAST_RECIPIENTS,
+    SAVE_BROADCAST_RESULTS,
+)
@@ -3,13 +3,11 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from keyboards.all_keyboards import main_kb
 from db_handler.db_utils import DBUtils
-from db_handler.db_class import Database
 import create_bot
 from create_bot import bot
 from handlers.admin_panel.states import AdminActions
 
 admin_router = Router()
-db_utils = DBUtils(db=Database(), bot=bot)
 
 
 @admin_router.callback_query(F.data == "admin_add_admin")
@@ -38,7 +36,7 @@ async def cancel_add_admin(callback: CallbackQuery, state: FSMContext):
 
 
 @admin_router.message(AdminActions.waiting_new_admin_id, F.text)
-async def process_admin_id(message: Message, state: FSMContext):
+async def process_admin_id(message: Message, state: FSMContext, db_utils: DBUtils):
     data = await state.get_data()
     chat_id = data.get("prompt_chat_id")
     msg_id = data.get("prompt_msg_id")
@@ -62,9 +60,7 @@ async def process_admin_id(message: Message, state: FSMContext):
             return
 
         if new_admin_id not in create_bot.admins:
-            await db_utils.db.connect()
             await db_utils.assign_admin_role(new_admin_id)
-            await db_utils.db.close()
             create_bot.admins.append(new_admin_id)
             await message.answer(f"✅Пользователь {user.full_name} (@{user.username}) добавлен в администраторы",
                                  reply_markup=main_kb(user_id))
@@ -77,6 +73,3 @@ async def process_admin_id(message: Message, state: FSMContext):
     except ValueError:
         await message.answer("❌Неверный формат ID. Введите числовой идентификатор",
                              reply_markup=main_kb(user_id))
-
-    finally:
-        await db_utils.db.close()
@@ -1,16 +1,75 @@
-import asyncio
 from aiogram import F, Router
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.fsm.context import FSMContext
 from keyboards.all_keyboards import main_kb, admin_panel_kb
+from keyboards.callback_data import AdminCancelBroadcastCallback
 from db_handler.db_utils import DBUtils
-from db_handler.db_class import Database
 import create_bot
-from create_bot import bot
+from create_bot import bot, broadcaster
+from broadcast_system.engine import BroadcastReport
 from handlers.admin_panel.states import AdminActions
 
 admin_router = Router()
-db_utils = DBUtils(db=Database(), bot=bot)
+
+
+def broadcast_progress_keyboard(job_id: int) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="⛔ Остановить рассылку",
+                              callback_data=AdminCancelBroadcastCallback(job_id=job_id).pack())]
+    ])
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours} ч {minutes:02d} мин"
+    if minutes:
+        return f"{minutes} мин {seconds:02d} с"
+    return f"{seconds} с"
+
+
+async def show_broadcast_progress(report: BroadcastReport):
+    """Обновляет сообщение администратора с ходом рассылки. Вызывается движком не чаще BROADCAST_PROGRESS_INTERVAL"""
+    if report.status_message_id is None:
+        return
+
+    await bot.edit_message_text(
+        chat_id=report.admin_id,
+        message_id=report.status_message_id,
+        text=(
+            f"📤Рассылка идёт: {report.total - report.pending} из {report.total}\n"
+            f"Успешно отправлено: {report.sent}\n"
+            f"Не удалось отправить: {report.failed}\n"
+            f"Заблокировали бота: {report.blocked}\n"
+            f"Скорость: {report.rate:.1f} сообщ./с\n"
+            f"Осталось: {format_duration(report.eta) if report.eta is not None else 'оценивается'}"
+        ),
+        reply_markup=broadcast_progress_keyboard(report.job_id)
+    )
+
+
+async def send_broadcast_report(report: BroadcastReport):
+    """Показывает администратору, запустившему рассылку, её итоги вместо сообщения с ходом рассылки"""
+    text = (
+        f"📬Рассылка {'остановлена' if report.cancelled else 'завершена'}:\n"
+        f"Всего получателей: {report.total}\n"
+        f"Успешно отправлено: {report.sent}\n"
+        f"Не удалось отправить: {report.failed}\n"
+        f"Заблокировали бота: {report.blocked}\n"
+        + (f"Не отправлено после остановки: {report.pending}\n" if report.cancelled else "")
+        + f"Время: {format_duration(report.elapsed)} ({report.rate:.1f} сообщ./с)"
+    )
+
+    if report.status_message_id is not None:
+        try:
+            await bot.edit_message_text(chat_id=report.admin_id, message_id=report.status_message_id, text=text)
+            return
+        except TelegramBadRequest:
+            pass  # Сообщение удалено: итоги приходят новым сообщением
+
+    await bot.send_message(chat_id=report.admin_id, text=text, reply_markup=main_kb(report.admin_id))
 
 
 @admin_router.callback_query(F.data == "admin_broadcast")
@@ -26,15 +85,13 @@ async def start_broadcast(callback: CallbackQuery, state: FSMContext):
     F.from_user.id.in_(create_bot.admins),
     F.content_type.in_({'text', 'photo'})
 )
-async def process_broadcast_message(message: Message, state: FSMContext):
-    await db_utils.db.connect()
+async def process_broadcast_message(message: Message, state: FSMContext, db_utils: DBUtils):
     try:
         subscribers = await db_utils.get_subscribed_users()
 
         if not subscribers:
             await message.answer("❌Нет активных подписчиков для рассылки", reply_markup=admin_panel_kb())
             await state.clear()
-            await db_utils.db.close()
             return
 
         content_data = {}
@@ -84,50 +141,29 @@ async def process_broadcast_message(message: Message, state: FSMContext):
         await message.answer(f"⚠️Ошибка при подготовке рассылки: {str(e)}", reply_markup=admin_panel_kb())
         await state.clear()
 
-    finally:
-        await db_utils.db.close()
-
 
 @admin_router.callback_query(
     AdminActions.waiting_broadcast_confirmation,
     F.data.in_(["confirm_broadcast", "cancel_broadcast"])
 )
-async def handle_broadcast_confirmation(callback: CallbackQuery, state: FSMContext):
-    await db_utils.db.connect()
+async def handle_broadcast_confirmation(callback: CallbackQuery, state: FSMContext, db_utils: DBUtils):
     try:
         await callback.message.delete()
         data = await state.get_data()
 
         if callback.data == "confirm_broadcast":
             subscribers = await db_utils.get_subscribed_users()
-            success_count = 0
-
-            for user_id in subscribers:
-                try:
-                    if data['content_type'] == 'photo':
-                        await bot.send_photo(
-                            chat_id=user_id,
-                            photo=data['content_data']['photo_id'],
-                            caption=data['content_data']['caption'] if data['content_data']['caption'] else None
-                        )
-                    else:
-                        await bot.send_message(
-                            chat_id=user_id,
-                            text=data['content_data']['text']
-                        )
-                    success_count += 1
-                    await asyncio.sleep(0.1)
-                except Exception as e:
-                    print(f"Ошибка отправки пользователю {user_id}: {str(e)}")
-
-            report = (
-                f"📬Рассылка завершена:\n"
-                f"Всего получателей: {data['subscribers_count']}\n"
-                f"Успешно отправлено: {success_count}\n"
-                f"Не удалось отправить: {data['subscribers_count'] - success_count}"
+            admin_id = callback.from_user.id
+
+            # Рассылка хранится в БД и идёт в фоне: после перезапуска бота она продолжится
+            job_id = await broadcaster.create_job(admin_id, subscribers, data['content_type'], data['content_data'],
+                                                  db=db_utils.db)
+            status_message = await callback.message.answer(
+                f"📤Рассылка запущена: {len(subscribers)} получателей.",
+                reply_markup=broadcast_progress_keyboard(job_id)
             )
-
-            await callback.message.answer(report, reply_markup=main_kb(callback.from_user.id))
+            await broadcaster.set_status_message(job_id, status_message.message_id, db=db_utils.db)
+            broadcaster.start(job_id, on_progress=show_broadcast_progress, on_done=send_broadcast_report)
 
         else:
             await callback.message.answer("❌Рассылка отменена", reply_markup=main_kb(callback.from_user.id))
@@ -139,4 +175,16 @@ async def handle_broadcast_confirmation(callback: CallbackQuery, state: FSMConte
     finally:
         await state.clear()
         await callback.answer()
-        await db_utils.db.close()
+
+
+@admin_router.callback_query(
+    AdminCancelBroadcastCallback.filter(),
+    F.from_user.id.in_(create_bot.admins)
+)
+async def cancel_running_broadcast(callback: CallbackQuery, callback_data: AdminCancelBroadcastCallback):
+    # Уже отправленные сообщения остаются, итоги покажет send_broadcast_report
+    if await broadcaster.cancel(callback_data.job_id):
+        await callback.answer("Рассылка останавливается")
+    else:
+        await callback.message.edit_reply_markup(reply_markup=None)
+        await callback.answer("Рассылка уже завершена")
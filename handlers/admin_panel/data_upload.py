@@ -6,13 +6,11 @@ from aiogram.fsm.context import FSMContext
 from aiogram.utils.chat_action import ChatActionSender
 from keyboards.all_keyboards import main_kb
 from db_handler.db_utils import DBUtils
-from db_handler.db_class import Database
 import create_bot
 from create_bot import bot
 from handlers.admin_panel.states import AdminActions
 
 admin_router = Router()
-db_utils = DBUtils(db=Database(), bot=bot)
 
 DATA_DIR = "db_handler/input_data"
 
@@ -35,14 +33,12 @@ async def start_upload_data(callback: CallbackQuery, state: FSMContext):
 
 
 @admin_router.message(AdminActions.waiting_for_file, F.document, F.from_user.id.in_(create_bot.admins))
-async def process_uploaded_file(message: Message, state: FSMContext):
-    await db_utils.db.connect()
+async def process_uploaded_file(message: Message, state: FSMContext, db_utils: DBUtils):
     document = message.document
     if not document.file_name.endswith(('.xlsx', '.xls')):
         await message.answer("❌Пожалуйста, отправьте файл в формате Excel (.xlsx или .xls).",
                              reply_markup=main_kb(message.from_user.id))
         await state.clear()
-        await db_utils.db.close()
         return
 
     if not os.path.exists(DATA_DIR):
@@ -72,7 +68,6 @@ async def process_uploaded_file(message: Message, state: FSMContext):
     finally:
         if os.path.exists(DATA_DIR):
             shutil.rmtree(DATA_DIR)
-        await db_utils.db.close()
 
 
 @admin_router.message(AdminActions.waiting_for_file)
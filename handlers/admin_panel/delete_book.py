@@ -3,13 +3,10 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.fsm.context import FSMContext
 from keyboards.all_keyboards import main_kb, admin_panel_kb
 from db_handler.db_utils import DBUtils
-from db_handler.db_class import Database
 import create_bot
-from create_bot import bot
 from handlers.admin_panel.states import AdminActions
 
 admin_router = Router()
-db_utils = DBUtils(db=Database(), bot=bot)
 
 
 @admin_router.callback_query(F.data == "admin_delete_book")
@@ -48,8 +45,7 @@ async def process_book_name(message: Message, state: FSMContext):
     AdminActions.waiting_book_delete_confirmation,
     F.data.in_(["confirm_delete", "cancel_delete"])
 )
-async def handle_delete_confirmation(callback: CallbackQuery, state: FSMContext):
-    await db_utils.db.connect()
+async def handle_delete_confirmation(callback: CallbackQuery, state: FSMContext, db_utils: DBUtils):
     try:
         data = await state.get_data()
 
@@ -82,4 +78,3 @@ async def handle_delete_confirmation(callback: CallbackQuery, state: FSMContext)
     finally:
         await state.clear()
         await callback.answer()
-        await db_utils.db.close()
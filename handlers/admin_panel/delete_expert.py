@@ -1,79 +1,73 @@
+from typing import Optional
+
 from aiogram import F, Router
+from aiogram.filters import or_f
+from aiogram.filters.callback_data import CallbackData
 from aiogram.types import CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from keyboards.all_keyboards import main_kb
+from keyboards.callback_data import AdminExpertsPageCallback, AdminDeleteExpertCallback
+from keyboards.pagination import build_page, cached_page
+from db_handler.catalog import CatalogSnapshot
 from db_handler.db_utils import DBUtils
-from db_handler.db_class import Database
 import create_bot
-from create_bot import bot
 from handlers.admin_panel.states import AdminActions
 
 admin_router = Router()
-db_utils = DBUtils(db=Database(), bot=bot)
+
+
+def admin_experts_keyboard(catalog: CatalogSnapshot, page: int):
+    def button(expert_id: int) -> InlineKeyboardButton:
+        expert_name, expert_position = catalog.expert_by_id[expert_id]
+        return InlineKeyboardButton(text=f"👤{expert_name} — {expert_position[0].lower() + expert_position[1:]}",
+                                    callback_data=AdminDeleteExpertCallback(expert_id=expert_id).pack())
+
+    return cached_page(catalog, ("admin_experts", page), lambda: build_page(
+        catalog.experts,
+        page,
+        button=button,
+        page_callback=lambda number: AdminExpertsPageCallback(page=number).pack(),
+        footer=[[InlineKeyboardButton(text="◄ Назад в админ-панель", callback_data="admin_back_to_panel")]]
+    ))
 
 
 @admin_router.callback_query(
-    F.data.in_(['admin_select_expert']) | F.data.regexp(r'^(admin_experts_page|admin_delete_expert)_')
+    or_f(
+        F.data == "admin_select_expert",
+        AdminExpertsPageCallback.filter(),
+        AdminDeleteExpertCallback.filter()
+    )
 )
-async def process_expert_selection(callback: CallbackQuery, state: FSMContext):
-    await db_utils.db.connect()
+async def process_expert_selection(callback: CallbackQuery, state: FSMContext, db_utils: DBUtils,
+                                   callback_data: Optional[CallbackData] = None):
     user_id = callback.from_user.id
 
     if user_id not in create_bot.admins:
         await callback.message.answer("У вас нет доступа к админ-панели.", reply_markup=main_kb(user_id))
         await callback.answer()
-        await db_utils.db.close()
         return
 
-    action = callback.data
+    catalog = await db_utils.get_catalog()
+    if not catalog.experts:
+        await callback.message.answer("⚠️*Эксперты отсутствуют.*", reply_markup=main_kb(user_id),
+                                      parse_mode="Markdown")
+        await callback.answer()
+        return
 
-    if action == "admin_select_expert" or action.startswith("admin_experts_page_"):
-        if action == "admin_select_expert":
-            page = 0
-        else:
-            page = int(action.split("_")[-1])
-        items_per_page = 5
-
-        experts = await db_utils.get_available_experts()
-        if not experts:
-            await callback.message.answer("⚠️*Эксперты отсутствуют.*", reply_markup=main_kb(user_id),
-                                          parse_mode="Markdown")
-            await callback.answer()
-            await db_utils.db.close()
-            return
-
-        total_pages = (len(experts) + items_per_page - 1) // items_per_page
-        start_idx = page * items_per_page
-        end_idx = min(start_idx + items_per_page, len(experts))
-        current_experts = experts[start_idx:end_idx]
-
-        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-            [InlineKeyboardButton(text=f"👤{expert[0]} — {expert[1][0].lower() + expert[1][1:]}",
-                                  callback_data=f"admin_delete_expert_{current_experts.index(expert) + start_idx}")]
-            for expert in current_experts
-        ])
+    # Эксперт удалён, пока сообщение было открыто: возвращаемся к списку
+    if isinstance(callback_data, AdminDeleteExpertCallback) and callback_data.expert_id not in catalog.expert_by_id:
+        callback_data = None
 
-        nav_buttons = []
-        if page > 0:
-            nav_buttons.append(InlineKeyboardButton(text="◄ Назад", callback_data=f"admin_experts_page_{page - 1}"))
-        if page < total_pages - 1:
-            nav_buttons.append(InlineKeyboardButton(text="Вперёд ►", callback_data=f"admin_experts_page_{page + 1}"))
-        if nav_buttons:
-            keyboard.inline_keyboard.append(nav_buttons)
-        keyboard.inline_keyboard.append(
-            [InlineKeyboardButton(text=f"📄Страница {page + 1} из {total_pages}", callback_data=f"admin_page_{page}")]
-        )
-        keyboard.inline_keyboard.append(
-            [InlineKeyboardButton(text="◄ Назад в админ-панель", callback_data="admin_back_to_panel")]
-        )
+    if not isinstance(callback_data, AdminDeleteExpertCallback):
+        page = callback_data.page if callback_data is not None else 0
+        keyboard = admin_experts_keyboard(catalog, page) or admin_experts_keyboard(catalog, 0)
 
         await callback.message.edit_text("**Выберите эксперта для удаления** 👤\n*Доступные эксперты:*",
                                          reply_markup=keyboard, parse_mode="Markdown")
 
-    elif action.startswith("admin_delete_expert_"):
-        expert_id = int(action[len("admin_delete_expert_"):])
-        experts = await db_utils.get_available_experts()
-        expert_name, expert_position = experts[expert_id]
+    else:
+        expert_id = callback_data.expert_id
+        expert_name, expert_position = catalog.expert_by_id[expert_id]
 
         await state.update_data(
             expert_id=expert_id,
@@ -93,15 +87,13 @@ async def process_expert_selection(callback: CallbackQuery, state: FSMContext):
         await state.set_state(AdminActions.waiting_expert_delete_confirmation)
 
     await callback.answer()
-    await db_utils.db.close()
 
 
 @admin_router.callback_query(
     AdminActions.waiting_expert_delete_confirmation,
     F.data.in_(["confirm_expert_delete", "cancel_expert_delete"])
 )
-async def handle_expert_deletion(callback: CallbackQuery, state: FSMContext):
-    await db_utils.db.connect()
+async def handle_expert_deletion(callback: CallbackQuery, state: FSMContext, db_utils: DBUtils):
     data = await state.get_data()
 
     if callback.data == "confirm_expert_delete":
@@ -127,4 +119,3 @@ async def handle_expert_deletion(callback: CallbackQuery, state: FSMContext):
 
     await state.clear()
     await callback.answer()
-    await db_utils.db.close()
@@ -3,19 +3,13 @@ from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton
 from keyboards.all_keyboards import main_kb
 
-from db_handler.db_class import Database
 from db_handler.db_utils import DBUtils
-from create_bot import bot
 
 router = Router()
 
-db = Database()
-db_utils = DBUtils(db=db, bot=bot)
-
 
 # Обработчик кнопки "Подписка"
-async def handle_broadcast(message: Message):
-    await db_utils.db.connect()
+async def handle_broadcast(message: Message, db_utils: DBUtils):
     user_id = message.from_user.id
     is_sub = await db_utils.is_subscribed_newsletter(user_id)
 
@@ -37,7 +31,6 @@ async def handle_broadcast(message: Message):
              f"{'подписки на рассылку' if not is_sub else 'отписки от рассылки'}:",
         reply_markup=keyboard
     )
-    await db_utils.db.close()
 
 
 @router.callback_query(F.data.in_(["cancel_subscription", "cancel_unsubscription"]))
@@ -53,8 +46,7 @@ async def process_subscription_callback(callback: CallbackQuery):
 
 # Обработчик инлайн-кнопок подписки/отписки
 @router.callback_query(F.data.in_(["subscribe", "unsubscribe"]))
-async def process_subscription_callback(callback: CallbackQuery):
-    await db_utils.db.connect()
+async def process_subscription_callback(callback: CallbackQuery, db_utils: DBUtils):
     user_id = callback.from_user.id
     action = callback.data
 
@@ -77,4 +69,3 @@ async def process_subscription_callback(callback: CallbackQuery):
 
     await callback.message.answer(response_text, reply_markup=main_kb(user_id))
     await callback.answer()
-    await db_utils.db.close()
@@ -1,92 +1,106 @@
+import re
+
 from aiogram import Router, F
 from aiogram.types import CallbackQuery
 
 from keyboards.all_keyboards import main_kb
-from db_handler.db_class import Database
+from keyboards.callback_data import CALLBACK_VERSION, ThemesPageCallback, ThemeCallback, ExpertCallback, NoopCallback
 from db_handler.db_utils import DBUtils
 
 from handlers.main_panel.lists import display_themes
 from handlers.main_panel.lists import display_subthemes
 from handlers.main_panel.lists import display_expert
-from create_bot import bot
+from handlers.main_panel.lists import catalog_changed
 
 router = Router()
 
-db = Database()
-db_utils = DBUtils(db=db, bot=bot)
+
+async def back_to_main(callback: CallbackQuery, db_utils: DBUtils):
+    await callback.message.delete()
+    await callback.message.answer(
+        '**Выберите действие в меню ниже:**',
+        reply_markup=main_kb(callback.from_user.id),
+        parse_mode="Markdown"
+    )
+    await callback.answer()
+
+
+async def get_themes(callback: CallbackQuery, db_utils: DBUtils):
+    await display_themes(page=0, callback=callback, db_utils=db_utils)
+
+
+async def themes_page(data: ThemesPageCallback, callback: CallbackQuery, db_utils: DBUtils):
+    await display_themes(page=data.page, callback=callback, db_utils=db_utils)
+
+
+async def theme(data: ThemeCallback, callback: CallbackQuery, db_utils: DBUtils):
+    await display_subthemes(theme_id=data.theme_id, page=data.page, callback=callback, db_utils=db_utils)
+
+
+async def expert(data: ExpertCallback, callback: CallbackQuery, db_utils: DBUtils):
+    await display_expert(theme_id=data.theme_id,
+                         expert_id=data.expert_id,
+                         callback=callback,
+                         db_utils=db_utils,
+                         book_page=data.book_page,
+                         subthemes_page=data.subthemes_page)
+
+
+async def noop(data: NoopCallback, callback: CallbackQuery, db_utils: DBUtils):
+    await callback.answer()
+
+
+# Кнопки без параметров
+COMMANDS = {
+    'back_to_main': back_to_main,
+    'get_themes': get_themes,
+}
+
+# Префикс callback_data -> (фабрика для распаковки, обработчик)
+ROUTES = {
+    factory.__prefix__: (factory, handler)
+    for factory, handler in (
+        (ThemesPageCallback, themes_page),
+        (ThemeCallback, theme),
+        (ExpertCallback, expert),
+        (NoopCallback, noop),
+    )
+}
+
+# Формат кнопок до перехода на ID: такие кнопки остаются в старых сообщениях
+LEGACY_PATTERN = r'^(themes_page|theme|subthemes|subtheme|expert|page|books)_'
+
+# Кнопки фабрик CallbackData прошлых версий формата (t1:, e1: ...)
+VERSIONED_PATTERN = re.compile(r'^[a-z]+(\d+):')
+
+
+def is_old_version(data: str) -> bool:
+    match = VERSIONED_PATTERN.match(data)
+    return match is not None and int(match.group(1)) != CALLBACK_VERSION
 
 
 @router.callback_query(
-    F.data.in_(['get_themes', 'back_to_main']) |
-    F.data.regexp(r'^(themes_page|theme|subthemes|subtheme|expert|page|books)_')
+    F.data.in_(tuple(COMMANDS)) |
+    F.data.func(lambda data: data.split(':', 1)[0] in ROUTES) |
+    F.data.regexp(LEGACY_PATTERN) |
+    F.data.func(is_old_version)
 )
-async def process_callback_expert_rec(callback: CallbackQuery):
-    data = callback.data
-    user_id = callback.from_user.id
-    await db_utils.db.connect()
-
-    if data == "back_to_main":
-        await callback.message.delete()
-        await callback.message.answer(
-            '**Выберите действие в меню ниже:**',
-            reply_markup=main_kb(user_id),
-            parse_mode="Markdown"
-        )
-        await callback.answer()
-    elif data == "get_themes":
-        await display_themes(page=0, callback=callback)
-    elif data.startswith("themes_page_"):
-        _, _, page = data.split("_")
-        if page.isdigit():
-            await display_themes(page=int(page), callback=callback)
-        else:
-            await callback.answer("⚠️ Некорректный номер страницы.")
-    elif data.startswith("theme_"):
-        _, theme_id = data.split("_")
-        if theme_id.isdigit():
-            await display_subthemes(theme_id=int(theme_id), page=0, callback=callback)
-        else:
-            await callback.answer("⚠️ Некорректный идентификатор темы.")
-    elif data.startswith("subthemes_"):
-        _, theme_id, page = data.split("_")
-        if theme_id.isdigit() and page.isdigit():
-            await display_subthemes(theme_id=int(theme_id), page=int(page), callback=callback)
-        else:
-            await callback.answer("⚠️ Некорректные параметры.")
-    elif data.startswith("subtheme_"):
-        _, subtheme_id, theme_id = data.split("_")
-        if subtheme_id.isdigit() and theme_id.isdigit():
-            await display_expert(subtheme_id=int(subtheme_id),
-                                 theme_id=int(theme_id),
-                                 expert_index=0,
-                                 callback=callback)
-        else:
-            await callback.answer("⚠️ Некорректный идентификатор подтемы.")
-    elif data.startswith("expert_"):
-        # expert_{subtheme_id}_{action}_{theme_id}_{index}
-        parts = data.split("_")
-        if len(parts) == 5 and parts[1].isdigit() and parts[4].isdigit():
-            _, sub_id, action, theme_id, idx = parts
-            idx = int(idx) + (1 if action == "next" else -1)
-            await display_expert(
-                subtheme_id=int(sub_id),
-                theme_id=int(theme_id),
-                expert_index=idx,
-                callback=callback
-            )
-        else:
-            await callback.answer("⚠️ Некорректные данные для эксперта.")
-    elif data.startswith("books_"):
-        # books_{subtheme_id}_{theme_id}_{expert_index}_{book_page}
-        _, sub_id, theme_id, expert_idx, book_page = data.split("_")
-        await display_expert(
-            subtheme_id=int(sub_id),
-            theme_id=int(theme_id),
-            expert_index=int(expert_idx),
-            callback=callback,
-            book_page=int(book_page)
-        )
-    else:
-        await callback.answer()
-
-    await db_utils.db.close()
+async def process_callback_expert_rec(callback: CallbackQuery, db_utils: DBUtils):
+    command = COMMANDS.get(callback.data)
+    if command is not None:
+        await command(callback, db_utils)
+        return
+
+    route = ROUTES.get(callback.data.split(':', 1)[0])
+    if route is None:
+        await catalog_changed(callback, db_utils)
+        return
+
+    factory, handler = route
+    try:
+        data = factory.unpack(callback.data)
+    except (TypeError, ValueError):
+        await catalog_changed(callback, db_utils)
+        return
+
+    await handler(data, callback, db_utils)
@@ -1,6 +1,8 @@
 from aiogram import Router, F
 from aiogram.types import Message
 
+from db_handler.db_utils import DBUtils
+
 from handlers.main_panel.recommendation import handle_recommendation
 from handlers.main_panel.lists import handle_list
 from handlers.main_panel.broadcast import handle_broadcast
@@ -9,15 +11,15 @@ router = Router()
 
 
 @router.message(F.text == "📝Получить рекомендации")
-async def cmd_recommend(message: Message):
-    await handle_recommendation(message)
+async def cmd_recommend(message: Message, db_utils: DBUtils):
+    await handle_recommendation(message, db_utils)
 
 
 @router.message(F.text == "📚Просмотреть подборки от экспертов")
-async def cmd_expert_list(message: Message):
-    await handle_list(message)
+async def cmd_expert_list(message: Message, db_utils: DBUtils):
+    await handle_list(message, db_utils)
 
 
 @router.message(F.text == "🔔 Подписаться на рассылку")
-async def cmd_letters(message: Message):
-    await handle_broadcast(message)
+async def cmd_letters(message: Message, db_utils: DBUtils):
+    await handle_broadcast(message, db_utils)
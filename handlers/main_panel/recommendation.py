@@ -1,39 +1,54 @@
 from aiogram.types import Message
 from db_handler.db_utils import DBUtils
-from recommendation_system.model import RecommendationSystem
-from db_handler.db_class import Database
+from recommendation_system.model import RecommendationSystem, RecommendationsNotReady
 from keyboards.all_keyboards import main_kb
-from create_bot import bot
+from create_bot import db
 
-db = Database()
-db_utils = DBUtils(db=db, bot=bot)
 rec_sys = RecommendationSystem(db=db)
 
 
-async def handle_recommendation(message: Message):
+async def handle_recommendation(message: Message, db_utils: DBUtils):
     user_id = message.from_user.id
-    await db_utils.db.connect()
     await db_utils.log_user_activity(user_id, activity_type='get_recommendation', theme_id=None)
 
     try:
-        recommendations = await rec_sys.recommend(user_id)
+        # Запросы идут через соединение апдейта: второе из пула при занятом пуле ждало бы вечно
+        recommendations = await rec_sys.recommend(user_id, db=db_utils.db)
+        header = "**Рекомендации на основе ваших запросов:**\n\n"
+
+        # Без истории просмотров — популярные подборки, посчитанные заранее
+        if recommendations is None:
+            recommendations = rec_sys.recommend_popular()
+            header = "**Вы ещё не смотрели подборки экспертов. Популярное у других читателей:**\n\n"
+
+            if not recommendations:
+                await message.answer('Если вы еще не посмотрели __ни одной__ подборки от экспертов, то рекомендации '
+                                     '__не будут работать__.',
+                                     reply_markup=main_kb(user_id),
+                                     parse_mode="Markdown")
+                return
 
         if not recommendations:
-            await message.answer('Если вы еще не посмотрели __ни одной__ подборки от экспертов, то рекомендации '
-                                 '__не будут работать__.',
-                                 reply_markup=main_kb(user_id),
-                                 parse_mode="Markdown")
+            await message.answer('Вы уже посмотрели все подборки, которые можно порекомендовать.',
+                                 reply_markup=main_kb(user_id))
+            return
+
+    except RecommendationsNotReady:
+        # Модель ещё загружается: популярные подборки не требуют ни её, ни БД
+        recommendations = rec_sys.recommend_popular()
+        header = "**⏳Персональные рекомендации ещё готовятся. Пока — популярное у других читателей:**\n\n"
+
+        if not recommendations:
+            await message.answer('⏳Рекомендательная система ещё загружается, попробуйте через минуту.',
+                                 reply_markup=main_kb(user_id))
             return
 
     except Exception as _:
         await message.answer('__Ошибка получения рекомендации!__\n',
                              reply_markup=main_kb(user_id))
-        await db_utils.db.close()
         return
 
-    await db_utils.db.close()
-
-    response = "**Рекомендации на основе ваших запросов:**\n\n"
+    response = header
     book_count = 0
     for theme in recommendations:
         response += f"📚*{theme['theme_name']} — {theme['specific_theme']}*\n\n"
@@ -3,19 +3,13 @@ from aiogram.filters import CommandStart
 from aiogram.types import Message
 
 from keyboards.all_keyboards import subscribe_channels_kb, main_kb
-from db_handler.db_class import Database
 from db_handler.db_utils import DBUtils
-from create_bot import bot
 
 router = Router()
 
-db = Database()
-db_utils = DBUtils(db=db, bot=bot)
-
 
 @router.message(CommandStart())
-async def cmd_start(message: Message):
-    await db_utils.db.connect()
+async def cmd_start(message: Message, db_utils: DBUtils):
     user_id = message.from_user.id
     username = message.from_user.username or message.from_user.full_name
 
@@ -32,9 +26,7 @@ async def cmd_start(message: Message):
             reply_markup=subscribe_channels_kb(),
             parse_mode="Markdown"
         )
-        await db_utils.db.close()
         return
 
     await message.answer('**🎉Добро пожаловать!**\nВыберите действие в меню ниже:',
                          reply_markup=main_kb(message.from_user.id), parse_mode="Markdown")
-    await db_utils.db.close()
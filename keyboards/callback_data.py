@@ -0,0 +1,73 @@
+from aiogram.filters.callback_data import CallbackData
+
+# Версия формата callback_data. При несовместимом изменении полей увеличиваем её:
+# кнопки из старых сообщений перестанут распознаваться и будут обработаны как устаревшие
+CALLBACK_VERSION = 2
+
+
+class ThemesPageCallback(CallbackData, prefix=f"t{CALLBACK_VERSION}"):
+    """Страница списка общих тем"""
+
+    page: int = 0
+
+
+class ThemeCallback(CallbackData, prefix=f"s{CALLBACK_VERSION}"):
+    """
+    Страница подтем общей темы. Общая тема задаётся theme_id любой своей подтемы
+    """
+
+    theme_id: int
+    page: int = 0
+
+
+class ExpertCallback(CallbackData, prefix=f"e{CALLBACK_VERSION}"):
+    """
+    Рекомендации эксперта по подтеме. expert_id = 0 — первый эксперт подборки,
+    subthemes_page — страница подтем, на которую ведёт кнопка «назад»
+    """
+
+    theme_id: int
+    expert_id: int = 0
+    book_page: int = 0
+    subthemes_page: int = 0
+
+
+class NoopCallback(CallbackData, prefix=f"n{CALLBACK_VERSION}"):
+    """Кнопка без действия (номер страницы)"""
+
+
+class AdminThemesPageCallback(CallbackData, prefix=f"at{CALLBACK_VERSION}"):
+    """Админ-панель: страница списка общих тем для удаления подборки"""
+
+    page: int = 0
+
+
+class AdminThemeCallback(CallbackData, prefix=f"as{CALLBACK_VERSION}"):
+    """Админ-панель: страница подтем общей темы, заданной theme_id любой своей подтемы"""
+
+    theme_id: int
+    page: int = 0
+
+
+class AdminDeleteSubthemeCallback(CallbackData, prefix=f"ad{CALLBACK_VERSION}"):
+    """Админ-панель: удаление подборки (подтемы)"""
+
+    theme_id: int
+
+
+class AdminExpertsPageCallback(CallbackData, prefix=f"ae{CALLBACK_VERSION}"):
+    """Админ-панель: страница списка экспертов"""
+
+    page: int = 0
+
+
+class AdminDeleteExpertCallback(CallbackData, prefix=f"ax{CALLBACK_VERSION}"):
+    """Админ-панель: удаление эксперта"""
+
+    expert_id: int
+
+
+class AdminCancelBroadcastCallback(CallbackData, prefix=f"ab{CALLBACK_VERSION}"):
+    """Админ-панель: остановка идущей рассылки"""
+
+    job_id: int
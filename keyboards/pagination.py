@@ -0,0 +1,119 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, Optional, Sequence
+from weakref import WeakKeyDictionary
+
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from keyboards.callback_data import NoopCallback
+
+ITEMS_PER_PAGE = 5
+
+# Отрисованные страницы на каждый снимок каталога: при смене версии старый снимок
+# удаляется сборщиком мусора вместе со своими страницами
+_pages: "WeakKeyDictionary[Any, PageCache]" = WeakKeyDictionary()
+
+
+class PageCache:
+    """
+    LRU отрисованных страниц клавиатуры
+
+    Attributes:
+        maxsize (int): Максимальное число хранимых страниц
+        hits (int): Число попаданий
+        misses (int): Число промахов
+    """
+
+    def __init__(self, maxsize: int = 512) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._pages: "OrderedDict[Hashable, Optional[InlineKeyboardMarkup]]" = OrderedDict()
+
+    def get(
+            self,
+            key: Hashable,
+            build: Callable[[], Optional[InlineKeyboardMarkup]]
+    ) -> Optional[InlineKeyboardMarkup]:
+
+        if key in self._pages:
+            self.hits += 1
+            self._pages.move_to_end(key)
+            return self._pages[key]
+
+        self.misses += 1
+        page = build()
+        self._pages[key] = page
+        if len(self._pages) > self.maxsize:
+            self._pages.popitem(last=False)
+        return page
+
+
+def total_pages(
+        count: int,
+        per_page: int = ITEMS_PER_PAGE
+) -> int:
+
+    return (count + per_page - 1) // per_page
+
+
+def build_page(
+        items: Sequence,
+        page: int,
+        button: Callable[[Any], InlineKeyboardButton],
+        page_callback: Callable[[int], str],
+        footer: List[List[InlineKeyboardButton]],
+        per_page: int = ITEMS_PER_PAGE
+) -> Optional[InlineKeyboardMarkup]:
+    """
+    Страница инлайн-клавиатуры: кнопки элементов, навигация, номер страницы и нижние кнопки.
+    Кнопки строятся только для элементов текущей страницы.
+
+    :param items: Заранее упорядоченный список элементов
+    :param page: Номер страницы с нуля
+    :param button: Кнопка для элемента
+    :param page_callback: callback_data перехода на страницу с данным номером
+    :param footer: Ряды кнопок под навигацией
+    :return: Клавиатура или None, если такой страницы нет
+    """
+
+    pages = total_pages(len(items), per_page)
+    if page < 0 or page >= pages:
+        return None
+
+    start_idx = page * per_page
+    keyboard = [[button(item)] for item in items[start_idx:start_idx + per_page]]
+
+    nav_buttons = []
+    if page > 0:
+        nav_buttons.append(InlineKeyboardButton(text="◄ Назад", callback_data=page_callback(page - 1)))
+    if page < pages - 1:
+        nav_buttons.append(InlineKeyboardButton(text="Вперёд ►", callback_data=page_callback(page + 1)))
+    if nav_buttons:
+        keyboard.append(nav_buttons)
+
+    keyboard.append(
+        [InlineKeyboardButton(text=f"📄Страница {page + 1} из {pages}", callback_data=NoopCallback().pack())]
+    )
+    keyboard.extend(footer)
+
+    return InlineKeyboardMarkup(inline_keyboard=keyboard)
+
+
+def cached_page(
+        catalog: Any,
+        key: Hashable,
+        build: Callable[[], Optional[InlineKeyboardMarkup]]
+) -> Optional[InlineKeyboardMarkup]:
+    """
+    Страница из кэша снимка каталога; строится при первом обращении.
+    Результат общий для всех пользователей, изменять его нельзя.
+
+    :param catalog: Снимок каталога, по которому построена страница
+    :param key: Ключ страницы (список и номер страницы)
+    :param build: Построение страницы при промахе
+    """
+
+    cache = _pages.get(catalog)
+    if cache is None:
+        cache = _pages[catalog] = PageCache()
+    return cache.get(key, build)
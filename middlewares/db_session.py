@@ -0,0 +1,87 @@
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.types import TelegramObject
+
+from db_handler.catalog import CatalogCache
+from db_handler.db_class import Database
+from db_handler.db_utils import DBUtils
+
+logger = logging.getLogger(__name__)
+
+
+class DBSessionMiddleware(BaseMiddleware):
+    """
+    Закрепляет за каждым апдейтом не более одного соединения из общего пула и передаёт
+    обработчикам привязанный к нему DBUtils (аргумент db_utils). Соединение берётся при первом
+    запросе к БД: навигация по каталогу из кэша пул не трогает.
+
+    Всё, что обработчик вызывает, ходит в БД через db_utils.db (рекомендации, создание рассылки):
+    апдейт, уже держащий соединение, не должен ждать второе — когда соединения пула разобраны
+    апдейтами, такое ожидание не закончится никогда.
+
+    Attributes:
+        db (Database): Общий на процесс пул
+        bot (Bot): Телеграмм бот
+        catalog (CatalogCache): Общий кэш каталога подборок
+        slow_acquire_ms (float): Порог ожидания соединения, после которого пишем предупреждение в лог
+        updates (int): Число апдейтов, которым понадобилось соединение
+        acquire_wait_total (float): Суммарное ожидание соединения, сек
+        acquire_wait_max (float): Максимальное ожидание соединения, сек
+    """
+
+    def __init__(
+            self,
+            db: Database,
+            bot: Bot,
+            catalog: Optional[CatalogCache] = None,
+            slow_acquire_ms: float = 100.0
+    ) -> None:
+
+        self.db = db
+        self.bot = bot
+        self.catalog = catalog
+        self.slow_acquire_ms = slow_acquire_ms
+        self.updates = 0
+        self.acquire_wait_total = 0.0
+        self.acquire_wait_max = 0.0
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any]
+    ) -> Any:
+
+        async with self.db.session() as session:
+            data['db_utils'] = DBUtils(db=session, bot=self.bot, catalog=self.catalog)
+            try:
+                return await handler(event, data)
+            finally:
+                if session.acquire_wait is not None:
+                    self._account(session.acquire_wait)
+
+    def _account(self, wait: float) -> None:
+        """Учёт времени ожидания соединения из пула"""
+
+        self.updates += 1
+        self.acquire_wait_total += wait
+        self.acquire_wait_max = max(self.acquire_wait_max, wait)
+
+        if wait * 1000 >= self.slow_acquire_ms:
+            logger.warning(f"Долгое ожидание соединения из пула: {wait * 1000:.1f} мс")
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Статистика ожидания соединений
+
+        :return: Число апдейтов, среднее и максимальное ожидание в миллисекундах
+        """
+
+        avg = self.acquire_wait_total / self.updates if self.updates else 0.0
+        return {
+            "updates": self.updates,
+            "acquire_wait_avg_ms": round(avg * 1000, 3),
+            "acquire_wait_max_ms": round(self.acquire_wait_max * 1000, 3)
+        }
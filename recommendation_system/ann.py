@@ -0,0 +1,169 @@
+import logging
+from typing import Optional
+
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:  # Optional dependency: IVF on NumPy is used instead
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+CHUNK_ROWS = 8192  # Rows scored at once while assigning themes to lists, bounds temporary memory
+
+
+class IVFIndex:
+    """
+    Inverted file index on NumPy.
+
+    Themes are split into `nlist` clusters by spherical k-means; a query scans only the rows of
+    the `nprobe` clusters whose centroids are closest to it. Rows of every cluster are stored
+    contiguously in `order`, cluster `c` occupying `order[offsets[c]:offsets[c + 1]]`.
+    """
+
+    kind = 'ivf'
+
+    def __init__(self, centroids: np.ndarray, order: np.ndarray, offsets: np.ndarray, nprobe: int):
+        self.centroids = centroids
+        self.order = order
+        self.offsets = offsets
+        self.nprobe = min(nprobe, len(centroids))
+
+    @property
+    def nbytes(self) -> int:
+        return self.centroids.nbytes + self.order.nbytes + self.offsets.nbytes
+
+    @classmethod
+    def build(
+            cls,
+            embeddings: np.ndarray,
+            norms: np.ndarray,
+            nlist: Optional[int] = None,
+            nprobe: Optional[int] = None,
+            centroids: Optional[np.ndarray] = None,
+            iterations: int = 10,
+            sample: int = 50000,
+            seed: int = 0
+    ) -> 'IVFIndex':
+        """
+        Build the index. Passing `centroids` of a previous index skips training and only
+        reassigns rows, which is enough after small catalog changes.
+        """
+        n = len(embeddings)
+        if centroids is None or centroids.shape[1] != embeddings.shape[1]:
+            nlist = nlist or max(1, int(4 * np.sqrt(n)))
+            centroids = cls._train(embeddings, norms, nlist, iterations, sample, seed)
+
+        nprobe = nprobe or max(1, len(centroids) // 64)
+        assignment = cls._assign(embeddings, centroids)
+        order = np.argsort(assignment, kind='stable').astype(np.int64)
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignment, minlength=len(centroids)), out=offsets[1:])
+        return cls(centroids, order, offsets, nprobe)
+
+    @staticmethod
+    def _train(
+            embeddings: np.ndarray,
+            norms: np.ndarray,
+            nlist: int,
+            iterations: int,
+            sample: int,
+            seed: int
+    ) -> np.ndarray:
+        """Spherical k-means on a sample of unit rows."""
+        rng = np.random.default_rng(seed)
+        rows = np.sort(rng.choice(len(embeddings), size=min(sample, len(embeddings)), replace=False))
+        points = embeddings[rows] / norms[rows, None]
+        nlist = min(nlist, len(points))
+        centroids = points[rng.choice(len(points), size=nlist, replace=False)].copy()
+
+        for _ in range(iterations):
+            assignment = np.argmax(points @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, points)
+            lengths = np.linalg.norm(sums, axis=1)
+            # An empty cluster keeps its previous centroid
+            filled = lengths > 0
+            centroids[filled] = sums[filled] / lengths[filled, None]
+
+        return centroids
+
+    @staticmethod
+    def _assign(embeddings: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """Closest centroid of every row; the row norm does not change the argmax."""
+        assignment = np.empty(len(embeddings), dtype=np.int64)
+        for start in range(0, len(embeddings), CHUNK_ROWS):
+            chunk = embeddings[start:start + CHUNK_ROWS]
+            assignment[start:start + CHUNK_ROWS] = np.argmax(chunk @ centroids.T, axis=1)
+        return assignment
+
+    def search(self, query: np.ndarray, k: int) -> np.ndarray:
+        """Rows of the clusters closest to the unit query vector, a superset of the approximate top-k."""
+        scores = self.centroids @ query
+        probe = np.argpartition(-scores, self.nprobe - 1)[:self.nprobe]
+        return np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in probe])
+
+
+class HNSWIndex:
+    """Graph index from hnswlib, used when the library is installed."""
+
+    kind = 'hnsw'
+
+    def __init__(self, index, size: int, ef: int):
+        self.index = index
+        self.size = size
+        self.ef = ef
+
+    @property
+    def nbytes(self) -> int:
+        """Estimate: float32 vectors and level-0 links, hnswlib does not report its memory."""
+        return self.size * (self.index.dim * 4 + self.index.M * 2 * 4)
+
+    @classmethod
+    def build(cls, embeddings: np.ndarray, m: int = 16, ef_construction: int = 200, ef: int = 128) -> 'HNSWIndex':
+        index = hnswlib.Index(space='cosine', dim=embeddings.shape[1])
+        index.init_index(max_elements=len(embeddings), ef_construction=ef_construction, M=m)
+        for start in range(0, len(embeddings), CHUNK_ROWS):
+            chunk = np.asarray(embeddings[start:start + CHUNK_ROWS])
+            index.add_items(chunk, np.arange(start, start + len(chunk)))
+        index.set_ef(ef)
+        return cls(index, len(embeddings), ef)
+
+    def search(self, query: np.ndarray, k: int) -> np.ndarray:
+        """Approximate k nearest rows to the query."""
+        k = min(k, self.size)
+        if k > self.ef:
+            self.index.set_ef(k)
+            self.ef = k
+        labels, _ = self.index.knn_query(query, k=k)
+        return labels[0].astype(np.int64)
+
+
+def build_index(
+        kind: str,
+        embeddings: np.ndarray,
+        norms: np.ndarray,
+        min_rows: int,
+        previous=None
+):
+    """
+    ANN index for the theme embeddings, or None when exact search should be used.
+
+    :param kind: 'auto' (HNSW if hnswlib is installed, IVF otherwise), 'hnsw', 'ivf' or 'exact'
+    :param min_rows: Smaller catalogs are searched exactly: a full scan is fast and has perfect recall
+    :param previous: Index for the previous catalog version; IVF reuses its centroids
+    """
+    if kind == 'exact' or len(embeddings) < min_rows:
+        return None
+
+    if kind == 'auto':
+        kind = 'hnsw' if hnswlib is not None else 'ivf'
+
+    if kind == 'hnsw':
+        if hnswlib is not None:
+            return HNSWIndex.build(embeddings)
+        logger.warning("hnswlib is not installed, falling back to the IVF index")
+
+    centroids = previous.centroids if isinstance(previous, IVFIndex) else None
+    return IVFIndex.build(embeddings, norms, centroids=centroids)
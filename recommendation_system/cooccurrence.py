@@ -0,0 +1,98 @@
+from typing import Dict, Sequence
+
+import numpy as np
+import scipy.sparse as sp
+
+
+class CooccurrenceMatrix:
+    """
+    Theme x theme co-occurrence counts from user_activity_logs: C[x, y] is the number of users
+    who viewed both x and y, C[x, x] the number of users who viewed x. Rows and columns are theme_ids.
+
+    C = V.T @ V for the binary users x themes view matrix V. New log rows only add entries to V,
+    so an update costs dV.T @ V + V.T @ dV + dV.T @ dV for the new views dV instead of a rebuild.
+    """
+
+    def __init__(self):
+        self.last_log_id = 0
+        self.views = sp.csr_matrix((0, 0), dtype=np.float32)
+        self.counts = sp.csr_matrix((0, 0), dtype=np.float32)
+        self._inv_sqrt = np.empty(0, dtype=np.float32)
+        self._users: Dict[int, int] = {}
+
+    @property
+    def nnz(self) -> int:
+        return self.counts.nnz
+
+    def update(self, user_ids: Sequence[int], theme_ids: Sequence[int], last_log_id: int) -> int:
+        """
+        Add the views logged up to last_log_id. Pairs may repeat and may already be counted:
+        every user is counted once per theme. Returns the number of new (user, theme) pairs.
+        """
+        users = np.asarray(user_ids, dtype=np.int64)
+        themes = np.asarray(theme_ids, dtype=np.int64)
+        self.last_log_id = max(self.last_log_id, last_log_id)
+        if not len(users):
+            return 0
+
+        # Telegram user ids are mapped to consecutive rows of V
+        unique_users, inverse = np.unique(users, return_inverse=True)
+        known = self._users
+        user_rows = np.fromiter(
+            (known.setdefault(user_id, len(known)) for user_id in unique_users.tolist()),
+            dtype=np.int64, count=len(unique_users)
+        )[inverse]
+
+        shape = (len(known), max(self.views.shape[1], int(themes.max()) + 1))
+        views = self.views
+        views.resize(shape)
+
+        new = sp.csr_matrix((np.ones(len(users), dtype=np.float32), (user_rows, themes)), shape=shape)
+        new.data[:] = 1  # Repeated pairs are summed by the constructor
+        delta = (new - new.multiply(views)).tocsr()
+        delta.eliminate_zeros()
+        if not delta.nnz:
+            return 0
+
+        counts = self.counts.copy()
+        counts.resize((shape[1], shape[1]))
+        cross = delta.T @ views
+        counts = (counts + cross + cross.T + delta.T @ delta).tocsr()
+
+        self.views = (views + delta).tocsr()
+        diagonal = counts.diagonal()
+        inv_sqrt = np.zeros(len(diagonal), dtype=np.float32)
+        np.divide(1.0, np.sqrt(diagonal), out=inv_sqrt, where=diagonal > 0)
+        # Readers take counts and _inv_sqrt together; both are replaced, never modified in place
+        self.counts, self._inv_sqrt = counts, inv_sqrt
+        return delta.nnz
+
+    def scores(self, histories: Sequence[Sequence[int]], theme_ids: np.ndarray) -> np.ndarray:
+        """
+        Co-occurrence score of every theme in theme_ids for every history of viewed themes:
+        the mean over the history's themes h of C[h, t] / sqrt(C[h, h] * C[t, t]), in [0, 1].
+        Returns a len(histories) x len(theme_ids) matrix.
+        """
+        counts, inv_sqrt = self.counts, self._inv_sqrt
+        size = counts.shape[0]
+        result = np.zeros((len(histories), len(theme_ids)), dtype=np.float32)
+        if not size:
+            return result
+
+        rows, cols, weights = [], [], []
+        for row, history in enumerate(histories):
+            history = np.unique(np.asarray(history, dtype=np.int64))
+            if not len(history):
+                continue
+            known = history[history < size]
+            rows.extend([row] * len(known))
+            cols.extend(known.tolist())
+            weights.extend((inv_sqrt[known] / len(history)).tolist())
+
+        weighted = sp.csr_matrix((np.asarray(weights, dtype=np.float32), (rows, cols)), shape=(len(histories), size))
+        theme_ids = np.asarray(theme_ids, dtype=np.int64)
+        columns = np.flatnonzero(theme_ids < size)
+        targets = theme_ids[columns]
+        product = (weighted @ counts).tocsc()[:, targets]
+        result[:, columns] = product.toarray() * inv_sqrt[targets]
+        return result
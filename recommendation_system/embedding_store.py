@@ -0,0 +1,122 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+from contextlib import contextmanager
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves of several processes are not serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+STORE_FORMAT = 2
+
+
+def text_hash(text: str) -> str:
+    """Stable key of a theme text in the store."""
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    On-disk cache of theme embeddings.
+
+    Each model gets an index `<model>.json` with the text hash of every row and the name of its matrix,
+    a float32 `<model>.<generation>.npy`. Every save writes a matrix under a new generation and then
+    replaces the index, so a reader always gets a matrix together with the hashes written with it.
+    Saves are serialized across processes with `<model>.lock` (workers refresh on the same NOTIFY),
+    so the matrices a save removes are never ones another process is writing or has just published.
+    The matrix is opened with mmap_mode, so loading is instant and worker processes share pages.
+    """
+
+    def __init__(self, directory: str, model_name: str):
+        self.directory = directory
+        self.model_name = model_name
+        self.slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.index_path = os.path.join(directory, f"{self.slug}.json")
+        # The index is replaced by every save, a lock on it would not be shared: a separate file is locked
+        self.lock_path = os.path.join(directory, f"{self.slug}.lock")
+
+    def load(self) -> Tuple[Optional[np.ndarray], List[str]]:
+        """Memory-map stored embeddings. Returns (None, []) if the store is missing or unusable."""
+        # A concurrent save may delete the matrix named by the index just read: the index is read again
+        for attempt in range(2):
+            try:
+                with open(self.index_path, encoding='utf-8') as f:
+                    index = json.load(f)
+                if index['format'] != STORE_FORMAT or index['model'] != self.model_name:
+                    return None, []
+
+                hashes = index['hashes']
+                matrix = np.load(os.path.join(self.directory, os.path.basename(index['matrix'])), mmap_mode='r')
+                if matrix.ndim != 2 or matrix.shape[0] != len(hashes):
+                    return None, []
+
+                return matrix, hashes
+
+            except FileNotFoundError:
+                continue
+            except (OSError, ValueError, KeyError, TypeError) as exc:
+                logger.warning(f"Ignoring unreadable embedding store {self.index_path}: {exc}")
+                return None, []
+        return None, []
+
+    def save(self, hashes: Sequence[str], matrix: np.ndarray) -> np.ndarray:
+        """
+        Atomically replace the store and return a memory-mapped view of the written matrix.
+        Falls back to the in-memory matrix if the directory is not writable.
+        """
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            matrix_name = f"{self.slug}.{uuid.uuid4().hex}.npy"
+            matrix_path = os.path.join(self.directory, matrix_name)
+            index_tmp = f"{self.index_path}.{os.getpid()}.tmp"
+
+            with self._locked():
+                with open(matrix_path, 'wb') as f:
+                    np.save(f, matrix)
+                with open(index_tmp, 'w', encoding='utf-8') as f:
+                    json.dump({
+                        'format': STORE_FORMAT,
+                        'model': self.model_name,
+                        'dim': int(matrix.shape[1]),
+                        'matrix': matrix_name,
+                        'hashes': list(hashes)
+                    }, f)
+
+                # The only publishing step: readers switch from the old matrix and hashes to the new ones together
+                os.replace(index_tmp, self.index_path)
+                self._remove_old_matrices(matrix_name)
+
+            return np.load(matrix_path, mmap_mode='r')
+
+        except OSError as exc:
+            logger.warning(f"Could not persist embeddings to {self.directory}: {exc}")
+            return matrix
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock of this model's store, shared by all processes; closing the file releases it."""
+        with open(self.lock_path, 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _remove_old_matrices(self, current: str) -> None:
+        """Matrices of previous generations; processes that mapped them keep their pages until they unmap."""
+        # <model>.npy is the matrix of the previous store format
+        own = re.compile(rf"{re.escape(self.slug)}(\.[0-9a-f]{{32}})?\.npy")
+        for name in os.listdir(self.directory):
+            if name != current and own.fullmatch(name):
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    pass
@@ -0,0 +1,175 @@
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List
+
+import numpy as np
+from decouple import config
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_BACKEND = config('INFERENCE_BACKEND', default='thread')  # thread or process
+INFERENCE_THREADS = config('INFERENCE_THREADS', default=2, cast=int)  # torch intra-op threads for inference
+INFERENCE_QUANTIZE = config('INFERENCE_QUANTIZE', default=False, cast=bool)  # int8 dynamic quantization
+BATCH_SIZE = 16
+
+
+def load_model(model_name: str, threads: int, quantize: bool = False):
+    """
+    Load the SentenceTransformer model. torch and sentence_transformers are imported here:
+    the imports alone take several seconds and must not delay the bot start.
+
+    :param quantize: Replace the transformer's Linear layers with dynamically quantized int8 ones.
+        Weights become 4x smaller and CPU matmuls faster; embeddings differ slightly from fp32
+    """
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    torch.set_num_threads(threads)
+    model = SentenceTransformer(model_name, device='cpu')
+    if quantize:
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def store_key(model_name: str, quantize: bool) -> str:
+    """Name of the embedding store: fp32 and int8 embeddings of the same model are not interchangeable."""
+    return f"{model_name}-int8" if quantize else model_name
+
+
+def encode(model, texts: List[str]) -> np.ndarray:
+    """Generate BERT embeddings for a list of texts."""
+    import torch
+
+    all_embeddings = []
+    with torch.no_grad():
+        for i in range(0, len(texts), BATCH_SIZE):
+            batch_texts = texts[i:i + BATCH_SIZE]
+            embeddings = model.encode(batch_texts, show_progress_bar=False)
+            all_embeddings.append(embeddings)
+    return np.vstack(all_embeddings).astype(np.float32, copy=False)
+
+
+class ThreadBackend:
+    """
+    Model in the bot process, inference on a single dedicated thread.
+
+    Embedding requests queue on that thread instead of occupying the default executor, and
+    torch is limited to `threads` intra-op threads so it leaves a core to the event loop.
+    The model is loaded on that thread by the first call.
+    """
+
+    def __init__(self, model_name: str, threads: int = INFERENCE_THREADS, quantize: bool = False):
+        self.model_name = model_name
+        self.threads = threads
+        self.quantize = quantize
+        self.model = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+
+    @property
+    def ready(self) -> bool:
+        return self.model is not None
+
+    def _load(self):
+        if self.model is None:
+            self.model = load_model(self.model_name, self.threads, self.quantize)
+        return self.model
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    async def load(self) -> None:
+        await self._call(self._load)
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        return await self._call(lambda: encode(self._load(), texts))
+
+    async def dimension(self) -> int:
+        return await self._call(lambda: self._load().get_sentence_embedding_dimension())
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+# Model of the worker process, loaded by _init_worker
+_worker_model = None
+
+
+def _init_worker(model_name: str, threads: int, quantize: bool) -> None:
+    global _worker_model
+    _worker_model = load_model(model_name, threads, quantize)
+
+
+def _worker_encode(texts: List[str]) -> np.ndarray:
+    return encode(_worker_model, texts)
+
+
+def _worker_dimension() -> int:
+    return _worker_model.get_sentence_embedding_dimension()
+
+
+class ProcessBackend:
+    """
+    Model in a separate worker process, so inference never holds the GIL of the event loop.
+
+    Texts and the resulting float32 matrix travel over the executor's pipe; one batch per call.
+    The worker is started with 'spawn' (forking a process with torch threads is unsafe) by the
+    first call and is restarted if it dies.
+    """
+
+    def __init__(self, model_name: str, threads: int = INFERENCE_THREADS, quantize: bool = False):
+        self.model_name = model_name
+        self.threads = threads
+        self.quantize = quantize
+        self.ready = False
+        self._executor = self._start()
+
+    def _start(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.model_name, self.threads, self.quantize)
+        )
+
+    async def _call(self, func, *args):
+        loop = asyncio.get_running_loop()
+        try:
+            result = await loop.run_in_executor(self._executor, func, *args)
+        except BrokenProcessPool:
+            logger.error("Inference worker process died, restarting it")
+            self.ready = False
+            self._executor = self._start()
+            raise
+
+        self.ready = True
+        return result
+
+    async def load(self) -> None:
+        await self._call(_worker_dimension)
+
+    async def encode(self, texts: List[str]) -> np.ndarray:
+        return await self._call(_worker_encode, texts)
+
+    async def dimension(self) -> int:
+        return await self._call(_worker_dimension)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def make_backend(kind: str, model_name: str, threads: int = INFERENCE_THREADS, quantize: bool = False):
+    """
+    Inference backend by name.
+
+    :param kind: 'thread' (model in this process, dedicated thread) or 'process' (worker process)
+    :param quantize: Run the int8 dynamically quantized model
+    """
+    if kind == 'thread':
+        return ThreadBackend(model_name, threads, quantize)
+    if kind == 'process':
+        return ProcessBackend(model_name, threads, quantize)
+    raise ValueError(f"Unknown inference backend: {kind}")
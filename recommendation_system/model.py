@@ -1,213 +1,673 @@
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from functools import partial
 import numpy as np
 import asyncio
-import torch
-from sentence_transformers import SentenceTransformer, util
+import logging
+import random
+import sys
+import time
+from decouple import config
+
+from db_handler import queries
+from recommendation_system.ann import build_index
+from recommendation_system.cooccurrence import CooccurrenceMatrix
+from recommendation_system.embedding_store import EmbeddingStore, text_hash
+from recommendation_system.result_cache import ResultCache
+from recommendation_system.timings import PhaseTimings
+from recommendation_system.inference import (INFERENCE_BACKEND, INFERENCE_QUANTIZE, INFERENCE_THREADS,
+                                             make_backend, store_key)
 
 ModelName = "distiluse-base-multilingual-cased-v1"  # Adequate for short labels
+EMBEDDINGS_DIR = config('EMBEDDINGS_DIR', default='recommendation_system/data')
+CANDIDATE_THEMES = 10  # Closest unseen themes whose books are sampled from
+ANN_INDEX = config('ANN_INDEX', default='auto')  # auto, hnsw, ivf or exact
+ANN_MIN_THEMES = config('ANN_MIN_THEMES', default=20000, cast=int)  # Smaller catalogs are searched exactly
+RESULT_CACHE_SIZE = config('RECOMMENDATION_CACHE_SIZE', default=10000, cast=int)  # Users with cached candidates
+RESULT_CACHE_TTL = config('RECOMMENDATION_CACHE_TTL', default=3600, cast=float)  # Seconds
+CF_WEIGHT = config('RECOMMENDATION_CF_WEIGHT', default=0.0, cast=float)  # Share of the co-occurrence score, 0 disables it
+CF_REFRESH_INTERVAL = config('RECOMMENDATION_CF_REFRESH', default=600, cast=float)  # Seconds between reads of new logs
+EMBEDDINGS_FLOAT16 = config('EMBEDDINGS_FLOAT16', default=False, cast=bool)  # Keep theme embeddings in float16
+SCORE_CHUNK_ROWS = 8192  # float16 rows converted to float32 at once while scoring
+POPULAR_THEMES = 20  # Most viewed themes whose books are offered to users without history
+POPULAR_HALF_LIFE_DAYS = config('POPULAR_HALF_LIFE_DAYS', default=7, cast=float)  # A view's weight halves in this time
+POPULAR_WINDOW_DAYS = config('POPULAR_WINDOW_DAYS', default=60, cast=float)  # Older views are not counted
+
+logger = logging.getLogger(__name__)
+
+
+class RecommendationsNotReady(Exception):
+    """The model is still loading and no stored theme embeddings are available yet."""
 
 
 class RecommendationSystem:
-    def __init__(self, db, model_name: str = ModelName):
+    def __init__(
+            self,
+            db,
+            model_name: str = ModelName,
+            embeddings_dir: str = EMBEDDINGS_DIR,
+            ann_index: str = ANN_INDEX,
+            ann_min_themes: int = ANN_MIN_THEMES,
+            inference_backend: str = INFERENCE_BACKEND,
+            inference_threads: int = INFERENCE_THREADS,
+            quantize: bool = INFERENCE_QUANTIZE,
+            cf_weight: float = CF_WEIGHT,
+            compact: bool = EMBEDDINGS_FLOAT16
+    ):
         self.db = db
         self.model_name = model_name
-        self.model = SentenceTransformer(model_name, device='cpu')
+        self.inference = make_backend(inference_backend, model_name, inference_threads, quantize)
+        # Similarity search and index builds; NumPy releases the GIL, two threads let a search run during a build
+        self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='recsys')
+        self.store = EmbeddingStore(embeddings_dir, store_key(model_name, quantize))
+        # Compact mode: float16 matrix in memory and no theme texts; the store stays float32
+        self.compact = compact
         self.theme_embeddings_cache: Optional[np.ndarray] = None
-        self.theme_id_to_index = {}
-        self.index_to_theme_id = {}
         self.specific_themes: List[str] = []
+        # Sorted theme_id of every matrix row; rows of ids are found with searchsorted
+        self.theme_ids: np.ndarray = np.empty(0, dtype=np.int32)
+        self._theme_norms: np.ndarray = np.empty(0, dtype=np.float32)
+        self._theme_hashes: List[str] = []
+        self.ann_kind = ann_index
+        self.ann_min_themes = ann_min_themes
+        self.ann_index = None  # None means exact search over all themes
+        # Catalog version the embeddings must match and the version they were built for
+        self.catalog_version = 0
+        self._loaded_version: Optional[int] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._warm_up_task: Optional[asyncio.Task] = None
+        self.result_cache = ResultCache(RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+        # Hybrid mode: the text similarity is blended with "users who viewed X also viewed Y"
+        self.cf_weight = cf_weight
+        self.cooccurrence = CooccurrenceMatrix()
+        self._cf_refreshed: Optional[float] = None
+        self._cf_task: Optional[asyncio.Task] = None
+        # Cold start: books of the most viewed themes, refreshed by a scheduled job
+        self.popular: Tuple[Dict[int, Tuple[str, str]], List[Tuple[int, Dict]]] = ({}, [])
+        self.timings = PhaseTimings()
+        self._profile_writes = set()
+
+    def invalidate(self, version: Optional[int] = None) -> None:
+        """Mark theme embeddings stale after a catalog change; they are refreshed on the next request."""
+        if version is None:
+            self.catalog_version += 1
+        elif version > self.catalog_version:
+            self.catalog_version = version
+
+    @property
+    def warming_up(self) -> bool:
+        return self._warm_up_task is not None and not self._warm_up_task.done()
+
+    def start_warm_up(self) -> None:
+        """Load the model and theme embeddings in a background task, without delaying the caller."""
+        if self._warm_up_task is None:
+            self._warm_up_task = asyncio.create_task(self.warm_up())
+
+    async def warm_up(self) -> None:
+        """
+        Load the model, then the theme embeddings. Until the model is ready, requests are served
+        from the embeddings in the store; themes missing from it are added once the model has loaded.
+        """
+        started = time.perf_counter()
+        try:
+            await self.inference.load()
+            logger.info(f"Model {self.model_name} loaded in {time.perf_counter() - started:.1f} s")
+
+            self._loaded_version = None
+            await self._load_theme_embeddings()
+            if self.cf_weight:
+                await self.refresh_cooccurrence()
+            logger.info(f"Recommendation system ready in {time.perf_counter() - started:.1f} s")
+        except Exception as exc:
+            logger.error(f"Recommendation system warm-up failed: {exc}")
+
+    def close(self) -> None:
+        """Stop the inference backend and worker threads."""
+        self.inference.close()
+        self._executor.shutdown(wait=False)
+
+    def refresh_cooccurrence(self) -> asyncio.Task:
+        """Add activity logged since the previous refresh to the co-occurrence matrix; one refresh runs at a time."""
+        if self._cf_task is None or self._cf_task.done():
+            self._cf_refreshed = time.monotonic()
+            self._cf_task = asyncio.create_task(self._refresh_cooccurrence())
+        return self._cf_task
+
+    async def _refresh_cooccurrence(self) -> None:
+        started = time.perf_counter()
+        try:
+            last_log_id = await self.db.fetchval(queries.GET_LAST_LOG_ID)
+            views = await self.db.fetchrow(queries.GET_THEME_VIEWS_SINCE, self.cooccurrence.last_log_id, last_log_id)
+            loop = asyncio.get_running_loop()
+            added = await loop.run_in_executor(
+                self._executor, self.cooccurrence.update, views['user_ids'], views['theme_ids'], last_log_id
+            )
+            logger.info(f"Co-occurrence matrix updated with {added} views in {time.perf_counter() - started:.2f} s, "
+                        f"{self.cooccurrence.nnz} non-zero pairs")
+        except Exception as exc:
+            logger.error(f"Co-occurrence refresh failed: {exc}")
 
-    def _embed_texts_sync(self, texts: List[str]) -> np.ndarray:
-        """Generate BERT embeddings for a list of texts."""
-        all_embeddings = []
-        batch_size = 16
-        with torch.no_grad():
-            for i in range(0, len(texts), batch_size):
-                batch_texts = texts[i:i+batch_size]
-                embeddings = self.model.encode(batch_texts, show_progress_bar=False)
-                all_embeddings.append(embeddings)
-        return np.vstack(all_embeddings)
-    
     async def _embed_texts(self, texts: List[str]) -> np.ndarray:
-        """Asynchronous wrapper for generating BERT embeddings."""
-        loop = asyncio.get_running_loop()
-        return await loop.run_in_executor(
-            None,                      
-            partial(self._embed_texts_sync, texts),
-        )
-    
+        """Generate BERT embeddings on the inference backend."""
+        return await self.inference.encode(texts)
+
+    @staticmethod
+    def _cos_sim_sync(
+            query: np.ndarray,
+            embeddings: np.ndarray,
+            norms: np.ndarray,
+            index=None,
+            k: int = CANDIDATE_THEMES
+    ) -> Tuple[Optional[np.ndarray], np.ndarray]:
+        """
+        Cosine similarity of one vector to the theme rows, using precomputed row norms.
+        Without an ANN index every row is scored and rows is None; otherwise only the rows
+        returned by the index for the k nearest themes are scored.
+        """
+        query = query.reshape(-1) / max(float(np.linalg.norm(query)), 1e-12)
+        if index is None:
+            return None, RecommendationSystem._dot(embeddings, query) / norms
+
+        rows = np.sort(index.search(query, k))
+        return rows, RecommendationSystem._dot(embeddings[rows], query) / norms[rows]
+
+    @staticmethod
+    def _dot(embeddings: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """
+        embeddings @ query in float32, for one query vector or a dim x users matrix of them.
+        A float16 matrix is converted in chunks: converting it whole would allocate
+        the float32 copy that compact mode saves.
+        """
+        if embeddings.dtype != np.float16 or len(embeddings) <= SCORE_CHUNK_ROWS:
+            return embeddings @ query
+
+        scores = np.empty((len(embeddings),) + query.shape[1:], dtype=np.float32)
+        for start in range(0, len(embeddings), SCORE_CHUNK_ROWS):
+            chunk = embeddings[start:start + SCORE_CHUNK_ROWS].astype(np.float32)
+            scores[start:start + SCORE_CHUNK_ROWS] = chunk @ query
+        return scores
+
+    @staticmethod
+    def _row_norms(embeddings: np.ndarray) -> np.ndarray:
+        return np.maximum(np.linalg.norm(embeddings, axis=1), 1e-12).astype(np.float32)
+
     @staticmethod
-    async def _cos_sim(a: torch.Tensor, b: torch.Tensor) -> np.ndarray:
+    def _rows_of(catalog_ids: np.ndarray, theme_ids) -> np.ndarray:
+        """Matrix rows of the given theme ids, in order; ids missing from the catalog are skipped."""
+        theme_ids = np.asarray(theme_ids, dtype=np.int64)
+        if not len(catalog_ids) or not len(theme_ids):
+            return np.empty(0, dtype=np.intp)
+
+        rows = np.minimum(np.searchsorted(catalog_ids, theme_ids), len(catalog_ids) - 1)
+        return rows[catalog_ids[rows] == theme_ids]
+
+    async def _cos_sim(
+            self,
+            query: np.ndarray,
+            embeddings: np.ndarray,
+            norms: np.ndarray,
+            index=None,
+            k: int = CANDIDATE_THEMES
+    ) -> Tuple[Optional[np.ndarray], np.ndarray]:
         """Asynchronous wrapper for comparing cosine distances."""
         loop = asyncio.get_running_loop()
-        similarities = await loop.run_in_executor(None, util.cos_sim, a, b)
-        return similarities[0].numpy()
+        return await loop.run_in_executor(self._executor, self._cos_sim_sync, query, embeddings, norms, index, k)
 
-    async def _load_theme_embeddings(self):
-        """Load all specific_theme texts and compute embeddings, cache them."""
-        if self.theme_embeddings_cache is not None:
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+        """Indices of the k highest finite scores, best first, without sorting the whole array."""
+        k = min(k, len(scores))
+        if k == 0:
+            return np.empty(0, dtype=np.intp)
+
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return top[np.isfinite(scores[top])]
+
+    async def _load_theme_embeddings(self, db=None):
+        """
+        Load all specific_theme texts and their embeddings, refreshing them after a catalog change.
+        Only new texts are encoded; rows of removed themes are dropped from the matrix.
+        During warm-up, themes that would need the model are left out until it is loaded.
+
+        :param db: connection of the caller's session, see recommend()
+        """
+        if self._loaded_version == self.catalog_version:
             return
 
-        await self.db.connect()
-        rows = await self.db.fetch("SELECT theme_id, specific_theme FROM themes ORDER BY theme_id")
-        await self.db.close()
+        if self._lock is None:
+            self._lock = asyncio.Lock()
 
-        self.theme_id_to_index = {}
-        self.index_to_theme_id = {}
-        self.specific_themes = []
+        # While a refresh re-encodes texts or rebuilds the ANN index, requests are served from the previous catalog
+        if self._lock.locked() and self.theme_embeddings_cache is not None:
+            return
 
-        for idx, row in enumerate(rows):
-            self.theme_id_to_index[row['theme_id']] = idx
-            self.index_to_theme_id[idx] = row['theme_id']
-            self.specific_themes.append(row['specific_theme'])
+        async with self._lock:
+            version = self.catalog_version
+            if self._loaded_version == version:
+                return
 
-        self.theme_embeddings_cache = await self._embed_texts(self.specific_themes)
+            rows = await (db or self.db).fetch(queries.GET_THEME_TEXTS)
+            texts = [row['specific_theme'] for row in rows]
+            hashes = [text_hash(text) for text in texts]
 
-    async def get_user_history_embedding(self, user_id: int) -> Optional[np.ndarray]:
-        """Aggregate embeddings of specific_themes from the last 12 user interactions."""
-        await self._load_theme_embeddings()
-        await self.db.connect()
-        rows = await self.db.fetch(
-            """
-            SELECT t.specific_theme FROM user_activity_logs ual
-            JOIN themes t ON ual.theme_id = t.theme_id
-            WHERE ual.user_id = $1 AND ual.theme_id IS NOT NULL
-            ORDER BY ual.request_time DESC
-            LIMIT 12
-            """,
-            user_id
-        )
-        await self.db.close()
+            source, source_hashes = None, []
+            if self.theme_embeddings_cache is None or self.compact:
+                # The compact matrix is rounded to float16: reused rows are taken from the float32 store
+                source, source_hashes = self.store.load()
+            if source is None and self.theme_embeddings_cache is not None:
+                source, source_hashes = self.theme_embeddings_cache, self._theme_hashes
 
-        if not rows:
-            return None
+            complete = True
+            if (source is None or source_hashes != hashes) and self.warming_up and not self.inference.ready:
+                stored = set(source_hashes)
+                keep = [idx for idx, h in enumerate(hashes) if h in stored]
+                if not keep:
+                    raise RecommendationsNotReady()
 
-        # Map specific_theme texts to indices in cached embeddings
-        indices = []
-        for row in rows:
-            try:
-                idx = self.specific_themes.index(row['specific_theme'])
-                indices.append(idx)
-            except ValueError:
-                continue
+                complete = len(keep) == len(rows)
+                rows = [rows[idx] for idx in keep]
+                texts = [texts[idx] for idx in keep]
+                hashes = [hashes[idx] for idx in keep]
+
+            if source is None or source_hashes != hashes:
+                embeddings = await self._resolve_embeddings(texts, hashes, source, source_hashes)
+            else:
+                embeddings = source
+
+            # A partial catalog is refreshed again by the next request
+            loaded_version = version if complete else None
+
+            theme_ids = np.fromiter((row['theme_id'] for row in rows), dtype=np.int32, count=len(rows))
+            if (self.theme_embeddings_cache is not None and hashes == self._theme_hashes
+                    and np.array_equal(theme_ids, self.theme_ids)):
+                # Themes did not change (e.g. only books were edited), the index is still valid
+                self._loaded_version = loaded_version
+                return
+
+            loop = asyncio.get_running_loop()
+            norms = await loop.run_in_executor(self._executor, self._row_norms, embeddings)
+            ann_index = await loop.run_in_executor(
+                self._executor,
+                partial(build_index, self.ann_kind, embeddings, norms, self.ann_min_themes, self.ann_index)
+            )
+            if self.compact:
+                embeddings = await loop.run_in_executor(self._executor, partial(np.asarray, embeddings, np.float16))
+                texts = []
+
+            # New objects are swapped in together, so a running recommend() keeps a consistent view
+            self.specific_themes = texts
+            self.theme_ids = theme_ids
+            self._theme_norms = norms
+            self._theme_hashes = hashes
+            self.ann_index = ann_index
+            self.theme_embeddings_cache = embeddings
+            # If the catalog changed again during the refresh, the next request refreshes once more
+            self._loaded_version = loaded_version
+
+            usage = self.memory_usage()
+            logger.info(f"Theme embeddings loaded: {len(theme_ids)} themes, "
+                        + ", ".join(f"{name} {size / 2 ** 20:.1f} MB" for name, size in usage.items()))
+
+    def memory_usage(self) -> Dict[str, int]:
+        """Approximate bytes held by each component of the recommendation state."""
+        embeddings = self.theme_embeddings_cache
+        cooccurrence = self.cooccurrence
+        return {
+            'embeddings': 0 if embeddings is None else embeddings.nbytes,
+            'norms': self._theme_norms.nbytes,
+            'theme_ids': self.theme_ids.nbytes,
+            'texts': sum(sys.getsizeof(text) for text in self.specific_themes),
+            'hashes': sum(sys.getsizeof(h) for h in self._theme_hashes),
+            'ann_index': 0 if self.ann_index is None else self.ann_index.nbytes,
+            'cooccurrence': sum(
+                m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+                for m in (cooccurrence.counts, cooccurrence.views)
+            ),
+        }
+
+    async def _resolve_embeddings(
+            self,
+            texts: List[str],
+            hashes: List[str],
+            source: Optional[np.ndarray],
+            source_hashes: List[str]
+    ) -> np.ndarray:
+        """
+        Embeddings for texts in order. Rows of `source` with a matching text hash are reused,
+        only texts missing from it are encoded. The result is persisted to the store.
+        """
+        known = {h: row for row, h in enumerate(source_hashes)}
+        missing = list(dict.fromkeys(text for text, h in zip(texts, hashes) if h not in known))
+        fresh_rows = {text_hash(text): row for row, text in enumerate(missing)}
+        fresh = await self._embed_texts(missing) if missing else None
+
+        if fresh is not None:
+            dim = fresh.shape[1]
+        elif source is not None:
+            dim = source.shape[1]
+        else:
+            dim = await self.inference.dimension()
+
+        reused = [(row, known[h]) for row, h in enumerate(hashes) if h in known]
+        encoded = [(row, fresh_rows[h]) for row, h in enumerate(hashes) if h not in known]
+
+        def assemble_and_save() -> np.ndarray:
+            matrix = np.empty((len(texts), dim), dtype=np.float32)
+            if reused:
+                target, origin = zip(*reused)
+                matrix[list(target)] = source[list(origin)]
+            if encoded:
+                target, origin = zip(*encoded)
+                matrix[list(target)] = fresh[list(origin)]
+            return self.store.save(hashes, matrix)
+
+        # Copying rows out of the mapped store and writing the new one take seconds on a large catalog:
+        # they run in a worker thread, not on the event loop serving other updates
+        return await asyncio.get_running_loop().run_in_executor(self._executor, assemble_and_save)
+
+    def _history_embedding(self, user_id: int, context) -> Optional[np.ndarray]:
+        """
+        Mean embedding of the specific_themes from the last 12 user interactions.
+
+        The ids of those themes are kept in user_profiles by every logged view, together with the
+        float16 vector computed from them. The vector is recomputed from the in-memory embeddings only
+        when the ids, the model or the catalog changed since it was stored; it is written back
+        in the background, off the request path.
+        """
+        embeddings, catalog_ids = self.theme_embeddings_cache, self.theme_ids
+        vector_key = f"{self.store.model_name}@{self.catalog_version}"
 
-        if not indices:
+        if context['theme_ids'] is None:
+            # History logged before profiles existed
+            theme_ids = list(context['history_theme_ids'])
+        elif (context['vector'] is not None and context['vector_key'] == vector_key
+              and context['vector_theme_ids'] == context['theme_ids']):
+            return np.frombuffer(context['vector'], dtype=np.float16).astype(np.float32)[None, :]
+        else:
+            theme_ids = list(context['theme_ids'])
+
+        # Themes deleted since the interaction are skipped
+        indices = self._rows_of(catalog_ids, theme_ids)
+        if not len(indices):
             return None
 
-        user_embeddings = self.theme_embeddings_cache[indices]
-        aggregated_embedding = np.mean(user_embeddings, axis=0, keepdims=True)
-        return aggregated_embedding
+        vector = np.mean(embeddings[indices], axis=0, keepdims=True, dtype=np.float32)
+        stored = vector[0].astype(np.float16).tobytes()
+        if context['theme_ids'] is None:
+            write = self.db.execute(queries.CREATE_USER_PROFILE, user_id, theme_ids, stored, vector_key)
+        else:
+            write = self.db.execute(queries.SAVE_PROFILE_VECTOR, user_id, stored, theme_ids, vector_key)
+        task = asyncio.ensure_future(self._save_profile(write))
+        self._profile_writes.add(task)
+        task.add_done_callback(self._profile_writes.discard)
 
-    async def recommend(self, user_id: int, top_k: int = 5) -> List[Dict]:
-        """Recommend books based on user history across specific_themes and experts."""
-        import random
-        await self._load_theme_embeddings()
-        user_embedding = await self.get_user_history_embedding(user_id)
-        if user_embedding is None:
-            return []
+        return vector
 
-        # Compute cosine similarity between user embedding and all theme embeddings
-        similarities = await self._cos_sim(
-            torch.tensor(user_embedding), torch.tensor(self.theme_embeddings_cache)
-        )
+    @staticmethod
+    async def _save_profile(write) -> None:
+        try:
+            await write
+        except Exception as exc:
+            logger.error(f"Could not save the user profile vector: {exc}")
 
-        # Exclude themes user already interacted with
-        await self.db.connect()
-        user_theme_rows = await self.db.fetch(
-            """
-            SELECT theme_id FROM user_activity_logs
-            WHERE user_id = $1 AND theme_id IS NOT NULL
-            """,
-            user_id
-        )
+    async def recommend(self, user_id: int, top_k: int = 5, db=None) -> Optional[List[Dict]]:
+        """
+        Recommend books based on user history across specific_themes and experts.
+        Users who have not viewed any theme get None, see recommend_popular. When every theme close
+        to the history is seen, popular themes the user has not viewed are recommended instead.
 
-        user_theme_ids = {row['theme_id'] for row in user_theme_rows}
+        :param db: session of the handler (db_utils.db). A handler already holds its session connection,
+            a second one taken from the pool could wait forever once every connection is held by handlers
+        """
+        db = db or self.db
+        with self.timings.measure('total'):
+            with self.timings.measure('context'):
+                context = await db.fetchrow(queries.GET_RECOMMENDATION_CONTEXT, user_id)
+            if context['last_log_id'] is None:
+                return None
 
-        # Prepare list of (theme_id, similarity) excluding already seen
-        candidates = [
-            (self.index_to_theme_id[idx], sim)
-            for idx, sim in enumerate(similarities)
-            if self.index_to_theme_id[idx] not in user_theme_ids
-        ]
+            with self.timings.measure('embeddings'):
+                await self._load_theme_embeddings(db)
 
-        # Sort by similarity descending
-        candidates.sort(key=lambda x: x[1], reverse=True)
+            # Candidates depend only on viewed themes and the catalog: while neither changes they are reused
+            key = (context['last_log_id'], self.catalog_version)
+            candidates = self.result_cache.get(user_id, key)
+            if candidates is None:
+                candidates = await self._candidates(user_id, context, db)
+                self.result_cache.put(user_id, key, candidates)
 
-        # Fetch expert recommendations for top 10 themes
-        top_candidates = candidates[:10]
-        if not top_candidates:
-            return []
+            if not candidates[1]:
+                return self.recommend_popular(top_k, exclude=context['seen_theme_ids'])
+            return self._sample(candidates, top_k)
 
-        theme_ids = [c[0] for c in top_candidates]
+    def recommend_popular(self, top_k: int = 5, exclude: Iterable[int] = ()) -> List[Dict]:
+        """
+        Books of the themes most viewed recently, for users without history. Needs neither the model nor the DB.
+
+        :param exclude: ids of themes the user has already seen
+        """
+        themes, books = self.popular
+        exclude = set(exclude)
+        if exclude:
+            books = [(theme_id, book) for theme_id, book in books if theme_id not in exclude]
+        return self._sample((themes, books), top_k)
+
+    async def refresh_popular(self) -> int:
+        """Rank themes by time-decayed views of their collections and keep their books in memory."""
         rows = await self.db.fetch(
-            """
-            SELECT
-                t.theme_id,
-                t.theme_name,
-                t.specific_theme,
-                e.expert_name,
-                e.expert_position,
-                b.book_name,
-                er.description
-            FROM themes t
-            JOIN experts_recommendations er ON t.theme_id = er.theme_id
-            JOIN experts e ON er.expert_id = e.expert_id
-            JOIN books b ON er.book_id = b.book_id
-            WHERE t.theme_id = ANY($1::int[])
-            ORDER BY t.theme_id
-            """,
-            theme_ids
+            queries.GET_POPULAR_THEMES, POPULAR_HALF_LIFE_DAYS * 86400, POPULAR_WINDOW_DAYS, POPULAR_THEMES
         )
-        await self.db.close()
+        self.popular = await self._details([row['theme_id'] for row in rows])
+        return len(self.popular[0])
 
-        # Organize recommendations by theme
-        recommendations = {}
-        for row in rows:
-            theme_id = row['theme_id']
-            if theme_id not in recommendations:
-                recommendations[theme_id] = {
-                    'theme_name': row['theme_name'],
-                    'specific_theme': row['specific_theme'],
+    @staticmethod
+    def _sample(
+            candidates: Tuple[Dict[int, Tuple[str, str]], List[Tuple[int, Dict]]],
+            top_k: int
+    ) -> List[Dict]:
+        """Random top_k books of the candidates, grouped by theme."""
+        themes, books = candidates
+
+        # Randomly select top_k books from the candidate themes
+        selected = random.sample(books, min(top_k, len(books)))
+
+        # Group selected recommendations by theme for output
+        output = {}
+        for theme_id, book in selected:
+            if theme_id not in output:
+                theme_name, specific_theme = themes[theme_id]
+                output[theme_id] = {
+                    'theme_name': theme_name,
+                    'specific_theme': specific_theme,
                     'experts': []
                 }
-            recommendations[theme_id]['experts'].append({
+            output[theme_id]['experts'].append(book)
+
+        return list(output.values())
+
+    async def _candidates(
+            self,
+            user_id: int,
+            context,
+            db=None
+    ) -> Tuple[Dict[int, Tuple[str, str]], List[Tuple[int, Dict]]]:
+        """
+        Books of the themes closest to the user's history that they have not seen yet.
+        Returns theme_id -> (theme_name, specific_theme) and a list of (theme_id, book).
+
+        Themes from the nightly batch are used while the user has viewed nothing since it ran
+        and the catalog is unchanged; otherwise they are computed on demand.
+        """
+        if (context['precomputed_theme_ids'] is not None
+                and context['precomputed_log_id'] == context['last_log_id']
+                and context['precomputed_version'] == self.catalog_version):
+            candidate_ids = list(context['precomputed_theme_ids'])
+        else:
+            with self.timings.measure('search'):
+                candidate_ids = await self._candidate_theme_ids(user_id, context, db)
+
+        with self.timings.measure('details'):
+            return await self._details(candidate_ids, db)
+
+    async def _details(
+            self,
+            candidate_ids: List[int],
+            db=None
+    ) -> Tuple[Dict[int, Tuple[str, str]], List[Tuple[int, Dict]]]:
+        """Names and books of the candidate themes."""
+        if not candidate_ids:
+            return {}, []
+
+        rows = await (db or self.db).fetch(queries.GET_RECOMMENDATION_DETAILS, candidate_ids)
+
+        # Every book is kept together with its theme, so selected books are grouped without searching
+        themes = {}
+        books = []
+        for row in rows:
+            themes.setdefault(row['theme_id'], (row['theme_name'], row['specific_theme']))
+            books.append((row['theme_id'], {
                 'expert_name': row['expert_name'],
                 'expert_position': row['expert_position'],
                 'book_name': row['book_name'],
                 'description': row['description']
-            })
+            }))
 
-        # Randomly select 5 books from the top 10 recommendations
-        all_recommendations = []
-        for data in recommendations.values():
-            all_recommendations.extend(data['experts'])
+        return themes, books
 
-        selected_recommendations = random.sample(all_recommendations, min(top_k, len(all_recommendations)))
+    async def _candidate_theme_ids(self, user_id: int, context=None, db=None) -> List[int]:
+        """Ids of the unseen themes closest to the user's history, best first."""
+        db = db or self.db
+        if context is None:
+            context = await db.fetchrow(queries.GET_RECOMMENDATION_CONTEXT, user_id)
+        await self._load_theme_embeddings(db)
 
-        # Group selected recommendations by theme for output
-        output = []
-        theme_map = {}
-        for rec in selected_recommendations:
-            theme_id = None
-            for tid, data in recommendations.items():
-                if rec in data['experts']:
-                    theme_id = tid
-                    break
-            if theme_id is not None:
-                if theme_id not in theme_map:
-                    theme_map[theme_id] = {
-                        'theme_name': recommendations[theme_id]['theme_name'],
-                        'specific_theme': recommendations[theme_id]['specific_theme'],
-                        'experts': []
-                    }
-                theme_map[theme_id]['experts'].append(rec)
-
-        for theme_id, data in theme_map.items():
-            output.append({
-                'theme_name': data['theme_name'],
-                'specific_theme': data['specific_theme'],
-                'experts': data['experts']
-            })
-
-        return output
+        # A catalog refresh may swap the embeddings during the awaits below
+        embeddings, norms, theme_ids = self.theme_embeddings_cache, self._theme_norms, self.theme_ids
+        ann_index = self.ann_index
+
+        user_embedding = self._history_embedding(user_id, context)
+        if user_embedding is None:
+            return []
+
+        seen = np.asarray(context['seen_theme_ids'], dtype=np.int64)
+
+        # The ANN index is asked for enough neighbours to be left with candidates after seen themes are removed
+        candidate_rows, similarities = await self._cos_sim(
+            user_embedding, embeddings, norms, ann_index, CANDIDATE_THEMES + len(seen)
+        )
+        candidate_ids = theme_ids if candidate_rows is None else theme_ids[candidate_rows]
+
+        # With an ANN index only the text neighbours are rescored by co-occurrence
+        if self.cf_weight:
+            if self._cf_refreshed is None or time.monotonic() - self._cf_refreshed > CF_REFRESH_INTERVAL:
+                self.refresh_cooccurrence()
+            cf_scores = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self.cooccurrence.scores, [seen], candidate_ids
+            )
+            similarities = (1 - self.cf_weight) * similarities + self.cf_weight * cf_scores[0]
+
+        # Exclude themes user already interacted with
+        similarities[np.isin(candidate_ids, seen)] = -np.inf
+
+        top_indices = self._top_k(similarities, CANDIDATE_THEMES)
+        return candidate_ids[top_indices].tolist()
+
+    @staticmethod
+    def _batch_top_k_sync(
+            users: np.ndarray,
+            embeddings: np.ndarray,
+            norms: np.ndarray,
+            seen_rows: np.ndarray,
+            seen_cols: np.ndarray,
+            k: int,
+            cf_scores: Optional[np.ndarray] = None,
+            cf_weight: float = 0.0
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact top-k themes for a chunk of users with one users x themes matrix product.
+        Returns the theme rows of every user, best first, and a mask of those that are valid
+        (not seen by the user).
+        """
+        users = users / np.maximum(np.linalg.norm(users, axis=1, keepdims=True), 1e-12)
+        scores = RecommendationSystem._dot(embeddings, users.T).T / norms
+        if cf_scores is not None:
+            scores = (1 - cf_weight) * scores + cf_weight * cf_scores
+        scores[seen_rows, seen_cols] = -np.inf
+
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind='stable')
+        top = np.take_along_axis(top, order, axis=1)
+        return top, np.isfinite(np.take_along_axis(top_scores, order, axis=1))
+
+    async def precompute(self, chunk_size: int = 128) -> int:
+        """
+        Compute candidate themes of all active users with a profile and store them in
+        precomputed_recommendations. Users are processed in chunks of `chunk_size`, which bounds
+        the score matrix to chunk_size x themes. Returns the number of users written.
+        """
+        started = time.perf_counter()
+        await self._load_theme_embeddings()
+        if self.cf_weight:
+            await self.refresh_cooccurrence()
+        version = self._loaded_version
+        if version is None:
+            logger.warning("Skipping recommendation precompute: theme embeddings are incomplete")
+            return 0
+
+        embeddings, norms, theme_ids = self.theme_embeddings_cache, self._theme_norms, self.theme_ids
+        k = min(CANDIDATE_THEMES, len(theme_ids))
+        if k == 0:
+            return 0
+
+        loop = asyncio.get_running_loop()
+        written = 0
+        last_user_id = 0
+        while True:
+            profiles = await self.db.fetch(queries.GET_ACTIVE_PROFILES_CHUNK, last_user_id, chunk_size)
+            if not profiles:
+                break
+            last_user_id = profiles[-1]['user_id']
+
+            # Mean embedding of every user's profile themes as one reduceat over the concatenated rows
+            users, flat, starts, seen_rows, seen_cols, histories = [], [], [], [], [], []
+            for profile in profiles:
+                indices = self._rows_of(theme_ids, profile['theme_ids'])
+                if not len(indices):
+                    continue
+                seen = self._rows_of(theme_ids, profile['seen_theme_ids'])
+                seen_rows.extend([len(users)] * len(seen))
+                seen_cols.extend(seen.tolist())
+                histories.append(profile['seen_theme_ids'])
+                starts.append(len(flat))
+                flat.extend(indices.tolist())
+                users.append(profile)
+
+            if users:
+                counts = np.diff(np.append(starts, len(flat)))
+                vectors = np.add.reduceat(embeddings[flat].astype(np.float32), starts, axis=0) / counts[:, None]
+                cf_scores = None
+                if self.cf_weight:
+                    cf_scores = await loop.run_in_executor(
+                        self._executor, self.cooccurrence.scores, histories, theme_ids
+                    )
+                top, valid = await loop.run_in_executor(
+                    self._executor, self._batch_top_k_sync, vectors, embeddings, norms,
+                    np.asarray(seen_rows, dtype=np.intp), np.asarray(seen_cols, dtype=np.intp), k,
+                    cf_scores, self.cf_weight
+                )
+
+                records = [
+                    (profile['user_id'], theme_ids[top[row][valid[row]]].tolist(), profile['last_log_id'], version)
+                    for row, profile in enumerate(users)
+                ]
+                async with self.db.acquire() as conn:
+                    await conn.executemany(queries.SAVE_PRECOMPUTED_RECOMMENDATIONS, records)
+                written += len(records)
+
+            if len(profiles) < chunk_size:
+                break
+
+        logger.info(f"Precomputed recommendations for {written} users in {time.perf_counter() - started:.1f} s")
+        return written
@@ -0,0 +1,46 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional, Tuple
+
+
+class ResultCache:
+    """
+    Per-user LRU of recommendation candidates with a TTL.
+
+    An entry is valid only for the key it was computed with (the user's latest viewed-theme log_id and
+    the catalog version), so a new view or a catalog change makes the next lookup a miss.
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[int, Tuple[Hashable, float, Any]]" = OrderedDict()
+
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, user_id: int, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(user_id)
+        if entry is not None:
+            entry_key, expires, value = entry
+            if entry_key == key and expires > time.monotonic():
+                self.hits += 1
+                self._entries.move_to_end(user_id)
+                return value
+            del self._entries[user_id]
+
+        self.misses += 1
+        return None
+
+    def put(self, user_id: int, key: Hashable, value: Any) -> None:
+        self._entries[user_id] = (key, time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
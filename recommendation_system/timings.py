@@ -0,0 +1,40 @@
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterator
+
+import numpy as np
+
+
+class PhaseTimings:
+    """
+    Durations of the phases of recent recommendation requests, for monitoring.
+
+    Every phase keeps its last `window` samples; summary() reports their count and percentiles.
+    """
+
+    def __init__(self, window: int = 1000):
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.window))
+
+    def record(self, phase: str, seconds: float) -> None:
+        self._samples[phase].append(seconds)
+
+    @contextmanager
+    def measure(self, phase: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(phase, time.perf_counter() - started)
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Per phase: number of samples and p50/p95/p99 in milliseconds."""
+        result = {}
+        for phase, samples in list(self._samples.items()):
+            values = np.fromiter(samples, dtype=np.float64, count=len(samples)) * 1e3
+            if not len(values):
+                continue
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            result[phase] = {'count': len(values), 'p50': float(p50), 'p95': float(p95), 'p99': float(p99)}
+        return result
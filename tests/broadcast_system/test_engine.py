@@ -0,0 +1,335 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+
+from broadcast_system.engine import BroadcastEngine
+from broadcast_system.token_bucket import TokenBucket
+from db_handler import queries
+
+
+class TestTokenBucket(unittest.IsolatedAsyncioTestCase):
+    async def test_rate(self):
+        bucket = TokenBucket(rate=100)
+        started = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(11)))
+        # Первый токен есть сразу, остальные 10 приходят по одному за 10 мс
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+    async def test_pause_and_recovery(self):
+        bucket = TokenBucket(rate=100, min_rate=10)
+        bucket.pause(0.05)
+        bucket.slow_down()
+        self.assertEqual(bucket.rate, 50)
+
+        started = time.monotonic()
+        await bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+
+        for _ in range(5):
+            bucket.slow_down()
+        self.assertEqual(bucket.rate, 10)
+        bucket.speed_up(1000)
+        self.assertEqual(bucket.rate, 100)
+
+
+class FakeDB:
+    """Таблицы broadcast_jobs и broadcast_recipients в памяти"""
+
+    def __init__(self):
+        self.jobs = {}
+        self.recipients = {}  # job_id -> {user_id: status}
+        self.claimed_at = {}  # (job_id, user_id) -> time.monotonic() взятия
+        self.blocked = set()
+
+    def claimed(self, job_id):
+        if self.jobs[job_id]['status'] != 'running':
+            return []
+        return [user_id for user_id, status in self.recipients[job_id].items() if status == 'sending']
+
+    async def fetchval(self, query, *args):
+        if query == queries.GET_CLAIMED_BROADCAST_COUNT:
+            return len(self.claimed(args[0]))
+        assert query == queries.CREATE_BROADCAST_JOB
+        job_id = len(self.jobs) + 1
+        self.jobs[job_id] = {'job_id': job_id, 'admin_id': args[0], 'content_type': args[1], 'content': args[2],
+                             'status': 'running', 'status_message_id': None}
+        self.recipients[job_id] = dict.fromkeys(args[3], 'pending')
+        return job_id
+
+    async def fetchrow(self, query, job_id):
+        assert query == queries.GET_BROADCAST_JOB
+        return self.jobs[job_id]
+
+    async def fetch(self, query, *args):
+        if query == queries.CLAIM_BROADCAST_RECIPIENTS:
+            job_id, limit = args
+            recipients = self.recipients[job_id]
+            if self.jobs[job_id]['status'] != 'running':
+                return []
+            claimed = sorted(user_id for user_id, status in recipients.items() if status == 'pending')[:limit]
+            recipients.update(dict.fromkeys(claimed, 'sending'))
+            self.claimed_at.update(dict.fromkeys(((job_id, user_id) for user_id in claimed), time.monotonic()))
+            return [{'user_id': user_id} for user_id in claimed]
+        if query == queries.GET_BROADCAST_COUNTS:
+            statuses = list(self.recipients[args[0]].values())
+            return [{'status': status, 'count': statuses.count(status)} for status in set(statuses)]
+        if query == queries.GET_RUNNING_BROADCAST_JOBS:
+            return [{'job_id': job_id} for job_id, job in self.jobs.items() if job['status'] == 'running']
+        raise ValueError(query)
+
+    async def execute(self, query, *args):
+        if query == queries.SAVE_BROADCAST_RESULTS:
+            job_id, user_ids, statuses = args
+            self.recipients[job_id].update(zip(user_ids, statuses))
+            self.blocked.update(user_id for user_id, status in zip(user_ids, statuses) if status == 'blocked')
+        elif query == queries.FINISH_BROADCAST_JOB:
+            job = self.jobs.get(args[0])
+            if job is None or job['status'] != 'running':
+                return 'UPDATE 0'
+            job['status'] = args[1]
+            return 'UPDATE 1'
+        elif query == queries.SET_BROADCAST_STATUS_MESSAGE:
+            self.jobs[args[0]]['status_message_id'] = args[1]
+        elif query == queries.RELEASE_BROADCAST_CLAIMS:
+            lease, = args
+            for job_id, recipients in self.recipients.items():
+                for user_id in self.claimed(job_id):
+                    # Строки без отметки взяты давно остановленным процессом
+                    if time.monotonic() - self.claimed_at.get((job_id, user_id), float('-inf')) > lease:
+                        recipients[user_id] = 'pending'
+        else:
+            raise ValueError(query)
+
+
+class TestBroadcastEngine(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.bot = MagicMock()
+        self.bot.send_message = AsyncMock()
+        self.bot.send_photo = AsyncMock()
+        self.db = FakeDB()
+        self.engine = BroadcastEngine(self.bot, self.db, rate=1000, concurrency=4, max_retries=2, batch_size=3,
+                                      progress_interval=0.01, claim_lease=60)
+
+    async def broadcast(self, chat_ids, content_type='text', content_data=None):
+        job_id = await self.engine.create_job(1, chat_ids, content_type, content_data or {'text': 'Привет'})
+        return await self.engine.run(job_id)
+
+    async def test_sends_to_everyone_with_bounded_concurrency(self):
+        in_flight, peak = 0, 0
+
+        async def send_message(chat_id, text):
+            nonlocal in_flight, peak
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+
+        self.bot.send_message.side_effect = send_message
+        report = await self.broadcast(range(20))
+
+        self.assertEqual((report.total, report.sent, report.failed, report.sent_in_run), (20, 20, 0, 20))
+        self.assertEqual(sorted(call.kwargs['chat_id'] for call in self.bot.send_message.call_args_list), list(range(20)))
+        self.assertEqual(peak, 4)
+        self.assertEqual(self.db.jobs[1]['status'], 'done')
+
+    async def test_photo(self):
+        await self.broadcast([1], 'photo', {'photo_id': 'file', 'caption': ''})
+        self.bot.send_photo.assert_awaited_once_with(chat_id=1, photo='file', caption=None)
+
+    async def test_flood_wait_pauses_and_retries(self):
+        method = MagicMock()
+        self.bot.send_message.side_effect = [TelegramRetryAfter(method, 'Flood control', 0), None, None]
+
+        report = await self.broadcast([1, 2])
+
+        self.assertEqual((report.sent, report.failed, report.flood_waits, report.retries), (2, 0, 1, 1))
+        self.assertLess(self.engine.bucket.rate, 1000)
+
+    async def test_failures(self):
+        method = MagicMock()
+        errors = {
+            1: [TelegramForbiddenError(method, 'bot was blocked by the user')],
+            2: [TelegramNetworkError(method, 'timeout')] * 3,  # Попытки исчерпаны
+            3: [TelegramNetworkError(method, 'timeout'), None],
+            5: [TelegramBadRequest(method, 'chat not found')],
+        }
+
+        async def send_message(chat_id, text):
+            if errors.get(chat_id):
+                error = errors[chat_id].pop(0)
+                if error is not None:
+                    raise error
+
+        self.bot.send_message.side_effect = send_message
+        original_sleep = asyncio.sleep
+        with patch('broadcast_system.engine.asyncio.sleep', lambda delay: original_sleep(0)):
+            report = await self.broadcast([1, 2, 3, 4, 5])
+
+        self.assertEqual((report.sent, report.failed, report.blocked), (2, 2, 1))
+        self.assertEqual(self.db.recipients[1], {1: 'blocked', 2: 'failed', 3: 'sent', 4: 'sent', 5: 'failed'})
+        self.assertEqual(self.db.blocked, {1})
+        self.assertEqual(self.bot.send_message.await_count, 1 + 3 + 2 + 1 + 1)
+
+    async def test_worker_failure_stops_other_workers(self):
+        job_id = await self.engine.create_job(1, range(30), 'text', {'text': 'Привет'})
+        claim = self.db.fetch
+        claims = 0
+
+        async def fetch(query, *args):
+            nonlocal claims
+            if query == queries.CLAIM_BROADCAST_RECIPIENTS:
+                claims += 1
+                if claims == 5:
+                    raise ConnectionError('connection was closed')
+            return await claim(query, *args)
+
+        async def send_message(chat_id, text):
+            await asyncio.sleep(0.01)
+
+        self.db.fetch = fetch
+        self.bot.send_message.side_effect = send_message
+        with self.assertRaises(ConnectionError):
+            await self.engine.run(job_id)
+
+        # Остальные воркеры остановлены, их порции сохранены: ничего не висит взятым
+        self.assertEqual(asyncio.all_tasks(), {asyncio.current_task()})
+        sent_count = self.bot.send_message.await_count
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.bot.send_message.await_count, sent_count)
+        self.assertNotIn('sending', self.db.recipients[job_id].values())
+        # Прерванные на середине отправки сообщения остаются в ожидании
+        sent = list(self.db.recipients[job_id].values()).count('sent')
+        self.assertTrue(sent_count - 4 <= sent <= sent_count)
+        self.assertEqual(self.db.jobs[job_id]['status'], 'running')
+
+    async def test_resume_sends_only_unsent(self):
+        job_id = await self.engine.create_job(7, range(6), 'text', {'text': 'Привет'})
+        # Процесс остановился: часть отправлена, порция взята воркером и не сохранена
+        self.db.recipients[job_id].update({0: 'sent', 1: 'sent', 2: 'sending'})
+
+        on_done = AsyncMock()
+        self.assertEqual(await self.engine.resume(on_done=on_done), 1)
+        await asyncio.gather(*self.engine._tasks)
+
+        self.assertEqual(sorted(call.kwargs['chat_id'] for call in self.bot.send_message.call_args_list), [2, 3, 4, 5])
+        report = on_done.await_args.args[0]
+        self.assertEqual((report.job_id, report.admin_id, report.total, report.sent, report.sent_in_run), (1, 7, 6, 6, 4))
+        self.assertFalse(self.engine._tasks)
+        self.assertEqual(await self.engine.resume(), 0)
+
+    async def test_two_processes_share_job(self):
+        job_id = await self.engine.create_job(7, range(9), 'text', {'text': 'Привет'})
+        other = BroadcastEngine(self.bot, self.db, rate=1000, concurrency=1, batch_size=3, progress_interval=0.01,
+                                claim_lease=60)
+        release = asyncio.Event()
+
+        async def send_message(chat_id, text):
+            if chat_id == 0:
+                await release.wait()
+
+        self.bot.send_message.side_effect = send_message
+        other_run = asyncio.create_task(other.run(job_id))
+        while not self.db.claimed(job_id):
+            await asyncio.sleep(0)
+
+        # Второй процесс запускается, пока первый отправляет свою порцию: её он не забирает
+        self.assertEqual(await self.engine.resume(), 1)
+        await asyncio.sleep(0.05)
+        self.assertEqual(sorted(self.db.claimed(job_id)), [0, 1, 2])
+        self.assertEqual(self.db.jobs[job_id]['status'], 'running')  # Задание ждёт порцию первого процесса
+
+        release.set()
+        await asyncio.gather(other_run, *self.engine._tasks)
+        self.assertEqual(sorted(call.kwargs['chat_id'] for call in self.bot.send_message.call_args_list), list(range(9)))
+        self.assertEqual(set(self.db.recipients[job_id].values()), {'sent'})
+        self.assertEqual(self.db.jobs[job_id]['status'], 'done')
+
+    async def test_expired_claims_are_sent_again(self):
+        job_id = await self.engine.create_job(7, range(6), 'text', {'text': 'Привет'})
+        self.db.recipients[job_id].update({0: 'sending', 1: 'sending'})
+        # Получателя 0 взял давно остановленный процесс, 1 — только что остановившийся: его ждут до конца аренды
+        self.db.claimed_at.update({(job_id, 0): time.monotonic() - 0.05, (job_id, 1): time.monotonic() + 0.05})
+        self.engine.claim_lease = 0.04
+
+        report = await self.engine.run(job_id)
+
+        self.assertEqual(report.sent, 6)
+        self.assertEqual(sorted(call.kwargs['chat_id'] for call in self.bot.send_message.call_args_list), list(range(6)))
+
+    async def test_progress_is_throttled(self):
+        async def send_message(chat_id, text):
+            await asyncio.sleep(0.005)
+
+        self.bot.send_message.side_effect = send_message
+        job_id = await self.engine.create_job(1, range(40), 'text', {'text': 'Привет'})
+        await self.engine.set_status_message(job_id, 55)
+
+        snapshots = []
+
+        async def on_progress(report):
+            snapshots.append((report.status_message_id, report.total, report.pending))
+
+        await self.engine.run(job_id, on_progress=on_progress)
+
+        # 40 сообщений по 4 одновременно идут около 50 мс: обновлений несколько, а не по одному на сообщение
+        self.assertTrue(1 <= len(snapshots) < 15)
+        self.assertEqual(snapshots[0][:2], (55, 40))
+        self.assertEqual([pending for *_, pending in snapshots], sorted((p for *_, p in snapshots), reverse=True))
+
+    async def test_progress_errors_do_not_stop_broadcast(self):
+        async def send_message(chat_id, text):
+            await asyncio.sleep(0.005)
+
+        self.bot.send_message.side_effect = send_message
+        on_progress = AsyncMock(side_effect=RuntimeError('message is not modified'))
+
+        job_id = await self.engine.create_job(1, range(20), 'text', {'text': 'Привет'})
+        report = await self.engine.run(job_id, on_progress=on_progress)
+
+        self.assertEqual(report.sent, 20)
+        on_progress.assert_awaited()
+
+    async def test_cancel(self):
+        job_id = await self.engine.create_job(1, range(30), 'text', {'text': 'Привет'})
+
+        async def send_message(chat_id, text):
+            if chat_id == 4:
+                self.assertTrue(await self.engine.cancel(job_id))
+
+        self.bot.send_message.side_effect = send_message
+        report = await self.engine.run(job_id)
+
+        self.assertTrue(report.cancelled)
+        self.assertEqual(self.db.jobs[job_id]['status'], 'cancelled')
+        self.assertLess(report.sent, 30)
+        self.assertEqual(report.pending, 30 - report.sent)
+        self.assertNotIn('sending', self.db.recipients[job_id].values())  # Взятые, но не отправленные снова ждут
+        self.assertFalse(self.engine._cancelled)
+
+        # Остановленная рассылка не продолжается после перезапуска и не отменяется повторно
+        self.assertEqual(await self.engine.resume(), 0)
+        self.assertFalse(await self.engine.cancel(job_id))
+
+    async def test_cancel_from_another_process(self):
+        job_id = await self.engine.create_job(1, range(30), 'text', {'text': 'Привет'})
+        other = BroadcastEngine(self.bot, self.db)
+
+        async def send_message(chat_id, text):
+            if chat_id == 4:
+                self.assertTrue(await other.cancel(job_id))
+
+        self.bot.send_message.side_effect = send_message
+        report = await self.engine.run(job_id)
+
+        # Воркеры досылают уже взятые порции и больше не получают получателей
+        self.assertTrue(report.cancelled)
+        self.assertLessEqual(self.bot.send_message.await_count, 4 * 3 + 3)
+        self.assertEqual(self.db.jobs[job_id]['status'], 'cancelled')
+        self.assertEqual(report.pending, 30 - report.sent)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock
+
+from db_handler import queries
+from db_handler.cache_listener import CacheListener
+
+
+class TestCacheListener(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.conn = MagicMock()
+        self.conn.fetch = AsyncMock(return_value=[{'name': 'catalog', 'version': 3}])
+        self.conn.add_listener = AsyncMock()
+        self.conn.remove_listener = AsyncMock()
+        self.conn.is_closed.return_value = False
+
+        self.db = MagicMock()
+
+        @asynccontextmanager
+        async def acquire():
+            yield self.conn
+
+        self.db.pool.acquire = acquire
+        self.listener = CacheListener(self.db, reconnect_delay=0.01, heartbeat=10)
+
+    async def test_notify_invokes_subscribers_once_per_version(self):
+        catalog = MagicMock()
+        reload_admins = AsyncMock()
+        self.listener.subscribe('catalog', catalog.invalidate)
+        self.listener.subscribe('roles', reload_admins)
+
+        self.listener._on_notify(self.conn, 1, queries.CACHE_CHANNEL, 'catalog:7')
+        self.listener._on_notify(self.conn, 1, queries.CACHE_CHANNEL, 'catalog:7')
+        self.listener._on_notify(self.conn, 1, queries.CACHE_CHANNEL, 'roles:2')
+        self.listener._on_notify(self.conn, 1, queries.CACHE_CHANNEL, 'garbage')
+        await asyncio.sleep(0)
+
+        catalog.invalidate.assert_called_once_with(7)
+        reload_admins.assert_awaited_once_with(2)
+
+    async def test_listen_syncs_versions_and_stops(self):
+        catalog = MagicMock()
+        self.listener.subscribe('catalog', catalog.invalidate)
+
+        self.listener.start()
+        await asyncio.sleep(0.01)
+
+        self.conn.add_listener.assert_awaited_once_with(queries.CACHE_CHANNEL, self.listener._on_notify)
+        catalog.invalidate.assert_called_once_with(3)  # Версия, пропущенная до подключения
+
+        await self.listener.stop()
+        self.conn.remove_listener.assert_awaited_once_with(queries.CACHE_CHANNEL, self.listener._on_notify)
+
+    async def test_reconnects_after_termination(self):
+        self.conn.add_termination_listener.side_effect = lambda callback: callback(self.conn)
+
+        self.listener.start()
+        await asyncio.sleep(0.05)
+        await self.listener.stop()
+
+        self.assertGreater(self.conn.add_listener.await_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock
+
+from db_handler import queries
+from db_handler.catalog import CatalogCache
+from db_handler.db_utils import DBUtils
+
+THEME_ROWS = [
+    {'theme_id': 2, 'theme_name': 'Математика', 'specific_theme': 'Алгебра'},
+    {'theme_id': 1, 'theme_name': 'Математика', 'specific_theme': 'Геометрия'},
+    {'theme_id': 3, 'theme_name': 'Физика', 'specific_theme': 'Оптика'},
+]
+
+RECOMMENDATION_ROWS = [
+    {'specific_theme': 'Алгебра', 'expert_id': 7, 'expert_name': 'Иванов',
+     'expert_position': 'Профессор', 'book_name': 'Книга 1', 'description': 'Описание 1'},
+    {'specific_theme': 'Алгебра', 'expert_id': 7, 'expert_name': 'Иванов',
+     'expert_position': 'Профессор', 'book_name': 'Книга 2', 'description': 'Описание 2'},
+    {'specific_theme': 'Оптика', 'expert_id': 8, 'expert_name': 'Петров',
+     'expert_position': 'Доцент', 'book_name': 'Книга 3', 'description': 'Описание 3'},
+]
+
+
+EXPERT_ROWS = [
+    {'expert_id': 7, 'expert_name': 'Иванов', 'expert_position': 'Профессор'},
+    {'expert_id': 8, 'expert_name': 'Петров', 'expert_position': 'Доцент'},
+]
+
+LOADED = {
+    queries.GET_CATALOG_THEMES: THEME_ROWS,
+    queries.GET_CATALOG_RECOMMENDATIONS: RECOMMENDATION_ROWS,
+    queries.GET_CATALOG_EXPERTS: EXPERT_ROWS,
+}
+
+
+class TestCatalogCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.conn = MagicMock()
+
+        async def fetch(query, *args):
+            await asyncio.sleep(0)
+            return LOADED[query]
+
+        self.conn.fetch = AsyncMock(side_effect=fetch)
+        self.db = MagicMock()
+
+        @asynccontextmanager
+        async def acquire():
+            yield self.conn
+
+        self.db.acquire = acquire
+        self.catalog = CatalogCache()
+        self.db_utils = DBUtils(db=self.db, bot=MagicMock(), catalog=self.catalog)
+
+    async def test_browsing_served_from_memory(self):
+        self.assertEqual(await self.db_utils.get_available_themes(), ['Математика', 'Физика'])
+        self.assertEqual(await self.db_utils.get_subthemes('Математика'), ['Алгебра', 'Геометрия'])
+        self.assertEqual(await self.db_utils.get_subthemes('Химия'), [])
+        self.assertEqual(await self.db_utils.get_theme_id('Физика', 'Оптика'), 3)
+        self.assertIsNone(await self.db_utils.get_theme_id('Физика', 'Алгебра'))
+        self.assertEqual(await self.db_utils.get_expert_recommendations('Алгебра'), {
+            7: {
+                'name': 'Иванов',
+                'position': 'Профессор',
+                'books': [('Книга 1', 'Описание 1'), ('Книга 2', 'Описание 2')]
+            }
+        })
+        self.assertIsNone(await self.db_utils.get_expert_recommendations('Геометрия'))
+
+        snapshot = await self.db_utils.get_catalog()
+        self.assertEqual(snapshot.theme_by_id[1], ('Математика', 'Геометрия'))
+        self.assertEqual(snapshot.theme_keys, {'Математика': 2, 'Физика': 3})
+        self.assertEqual(snapshot.experts, [7, 8])
+
+        # Весь каталог загружен тремя запросами
+        self.assertEqual(self.conn.fetch.await_count, 3)
+
+    async def test_concurrent_miss_loads_once(self):
+        snapshots = await asyncio.gather(*(self.catalog.get(self.db) for _ in range(10)))
+        self.assertEqual(self.conn.fetch.await_count, 3)
+        self.assertTrue(all(snapshot is snapshots[0] for snapshot in snapshots))
+
+    async def test_invalidate_reloads(self):
+        first = await self.catalog.get(self.db)
+        self.catalog.invalidate()
+        second = await self.catalog.get(self.db)
+
+        self.assertIsNot(first, second)
+        self.assertEqual((first.version, second.version), (0, 1))
+        self.assertEqual(self.conn.fetch.await_count, 6)
+
+    async def test_invalidate_during_load_not_cached(self):
+        async def fetch(query, *args):
+            self.catalog.invalidate()  # Администратор изменил каталог, пока он загружался
+            return []
+
+        self.conn.fetch = AsyncMock(side_effect=fetch)
+        await self.catalog.get(self.db)
+        self.assertIsNone(self.catalog._snapshot)
+
+    async def test_delete_invalidates_after_commit(self):
+        await self.catalog.get(self.db)
+        self.conn.transaction = MagicMock()
+        self.conn.transaction.return_value.__aenter__ = AsyncMock()
+        self.conn.transaction.return_value.__aexit__ = AsyncMock(return_value=False)
+        self.conn.execute = AsyncMock(return_value="DELETE 1")
+        self.conn.fetchval = AsyncMock(return_value=5)  # Новая версия каталога из cache_versions
+
+        self.assertTrue(await self.db_utils.delete_selection('Физика', 'Оптика'))
+        self.conn.fetchval.assert_awaited_once_with(queries.BUMP_CACHE_VERSION, 'catalog')
+        self.assertEqual(self.catalog.version, 5)
+        self.assertIsNone(self.catalog._snapshot)
+
+    async def test_known_version_ignored(self):
+        self.catalog.invalidate(3)
+        snapshot = await self.catalog.get(self.db)
+
+        self.catalog.invalidate(3)  # Собственное уведомление процесса после локального сброса
+        self.assertIs(await self.catalog.get(self.db), snapshot)
+
+        self.catalog.invalidate(4)
+        self.assertIsNot(await self.catalog.get(self.db), snapshot)
+
+    async def test_failed_delete_keeps_cache(self):
+        snapshot = await self.catalog.get(self.db)
+        self.conn.transaction = MagicMock(side_effect=Exception("connection lost"))
+
+        self.assertFalse(await self.db_utils.delete_expert('Иванов', 'Профессор'))
+        self.assertIs(await self.catalog.get(self.db), snapshot)
+
+
+if __name__ == "__main__":
+    unittest.main()
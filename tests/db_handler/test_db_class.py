@@ -1,6 +1,11 @@
+import asyncio
 import unittest
 from unittest.mock import AsyncMock, patch, MagicMock
-from db_handler.db_class import Database
+import asyncpg
+from asyncpg import connect_utils
+from asyncpg.connection import Connection
+from db_handler.db_class import Database, prepare_statements
+from db_handler.queries import PREPARED_STATEMENTS
 
 
 class TestDatabase(unittest.IsolatedAsyncioTestCase):
@@ -9,7 +14,7 @@ class TestDatabase(unittest.IsolatedAsyncioTestCase):
         self.mock_pool = MagicMock()
         self.mock_conn = AsyncMock()
         self.patcher = patch('asyncpg.create_pool', new_callable=AsyncMock, return_value=self.mock_pool)
-        self.patcher.start()
+        self.mock_create_pool = self.patcher.start()
 
     def tearDown(self):
         self.patcher.stop()
@@ -18,6 +23,83 @@ class TestDatabase(unittest.IsolatedAsyncioTestCase):
         await self.db.connect()
         self.assertEqual(self.db.pool, self.mock_pool)
 
+        # Подготовленные запросы не вытесняются из кэша ни по сроку, ни по размеру
+        kwargs = self.mock_create_pool.await_args.kwargs
+        self.assertEqual(kwargs['max_cached_statement_lifetime'], 0)
+        self.assertGreater(kwargs['statement_cache_size'], len(PREPARED_STATEMENTS))
+
+    async def test_connect_idempotent(self):
+        await self.db.connect()
+        await self.db.connect()
+        self.mock_create_pool.assert_awaited_once()
+        self.assertEqual(self.db.pool, self.mock_pool)
+
+    async def test_close_keeps_shared_pool(self):
+        self.mock_pool.close = AsyncMock()
+        await self.db.connect()
+        await self.db.connect()
+
+        await self.db.close()
+        self.mock_pool.close.assert_not_awaited()
+
+        await self.db.close()
+        self.mock_pool.close.assert_awaited_once()
+        self.assertIsNone(self.db.pool)
+
+        with self.assertRaisesRegex(RuntimeError, "не подключена"):
+            self.db.acquire()
+
+        await self.db.connect()  # Пул создаётся заново
+        self.assertEqual(self.mock_create_pool.await_count, 2)
+
+    async def test_session_uses_single_connection(self):
+        self.db.pool = MagicMock()
+        self.db.pool.acquire = AsyncMock(return_value=self.mock_conn)
+        self.db.pool.release = AsyncMock()
+        self.mock_conn.fetchval.return_value = 1
+
+        async with self.db.session() as session:
+            await session.fetchval("SELECT 1")
+            await session.execute("SELECT 2")
+            await session.close()  # Сессия не должна закрывать общий пул
+
+        self.db.pool.acquire.assert_awaited_once()
+        self.db.pool.release.assert_awaited_once_with(self.mock_conn)
+        self.db.pool.close.assert_not_called()
+        self.assertIsNotNone(session.acquire_wait)
+        self.mock_conn.fetchval.assert_called_once_with("SELECT 1")
+        self.mock_conn.execute.assert_called_once_with("SELECT 2")
+
+    async def test_session_without_queries_skips_pool(self):
+        self.db.pool = MagicMock()
+        self.db.pool.acquire = AsyncMock()
+        self.db.pool.release = AsyncMock()
+
+        async with self.db.session() as session:
+            pass
+
+        self.db.pool.acquire.assert_not_called()
+        self.db.pool.release.assert_not_called()
+        self.assertIsNone(session.acquire_wait)
+
+    async def test_session_not_connected(self):
+        with self.assertRaises(RuntimeError):
+            async with self.db.session():
+                pass
+
+    async def test_connect_registers_prepare_hook(self):
+        await self.db.connect()
+        _, kwargs = self.mock_create_pool.call_args
+        self.assertIs(kwargs['init'], prepare_statements)
+        self.assertGreater(kwargs['statement_cache_size'], len(PREPARED_STATEMENTS))
+
+    async def test_prepare_statements(self):
+        conn = MagicMock()
+        conn._get_statement = AsyncMock(side_effect=[asyncpg.PostgresError("missing table")] +
+                                        [None] * (len(PREPARED_STATEMENTS) - 1))
+        await prepare_statements(conn)  # Ошибка подготовки одного запроса не ломает соединение
+        self.assertEqual(conn._get_statement.await_count, len(PREPARED_STATEMENTS))
+
     async def test_execute_success(self):
         self.db.pool = MagicMock()
         self.db.pool.acquire.return_value.__aenter__.return_value = self.mock_conn
@@ -97,15 +179,58 @@ class TestDatabase(unittest.IsolatedAsyncioTestCase):
         self.mock_conn.fetchrow.assert_called_once_with("SELECT * FROM test_table WHERE id = $1", 1)
 
     async def test_close_connected(self):
-        self.db.pool = MagicMock()
-        self.db.pool.close = AsyncMock()
+        pool = self.db.pool = MagicMock()
+        pool.close = AsyncMock()
         await self.db.close()
-        self.db.pool.close.assert_called_once()
+        pool.close.assert_called_once()
+        self.assertIsNone(self.db.pool)
 
     async def test_close_not_connected(self):
         self.db.pool = None
         await self.db.close()  # Не должно вызывать ошибок
 
 
+class TestPreparedStatementCache(unittest.IsolatedAsyncioTestCase):
+    """
+    prepare_statements заполняет кэш через приватный Connection._get_statement: публичный prepare()
+    в кэш fetch() не попадает. Тест проходит настоящий код asyncpg с протоколом-заглушкой
+    и упадёт, если после обновления asyncpg fetch() перестанет находить подготовленный запрос.
+    """
+
+    async def asyncSetUp(self):
+        self.protocol = MagicMock()
+        self.protocol.get_settings.return_value = MagicMock(server_version='16.0')
+        self.protocol.get_record_class.return_value = asyncpg.Record
+        self.protocol.is_closed.return_value = False
+
+        def prepare(name, query, timeout, **kwargs):
+            statement = MagicMock(closed=False)
+            statement.name = name
+            statement._init_types.return_value = []
+            return statement
+
+        self.protocol.prepare = AsyncMock(side_effect=prepare)
+        self.protocol.bind_execute = AsyncMock(return_value=([], b'', False))
+
+        config = connect_utils._ClientConfiguration(
+            command_timeout=None,
+            statement_cache_size=len(PREPARED_STATEMENTS) + 100,
+            max_cached_statement_lifetime=300,
+            max_cacheable_statement_size=15 * 1024
+        )
+        self.conn = Connection(self.protocol, MagicMock(), asyncio.get_running_loop(), None, config, MagicMock())
+
+    async def test_fetch_uses_warmed_statement(self):
+        await prepare_statements(self.conn)
+        self.assertEqual(self.protocol.prepare.await_count, len(PREPARED_STATEMENTS))
+
+        for query in PREPARED_STATEMENTS:
+            await self.conn.fetch(query)
+        self.assertEqual(self.protocol.prepare.await_count, len(PREPARED_STATEMENTS))
+
+        await self.conn.fetch("SELECT 1")  # Запрос вне реестра готовится при первом вызове
+        self.assertEqual(self.protocol.prepare.await_count, len(PREPARED_STATEMENTS) + 1)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,69 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from aiogram.exceptions import TelegramBadRequest
+
+from broadcast_system.engine import BroadcastReport
+from handlers.admin_panel import broadcast
+from keyboards.callback_data import AdminCancelBroadcastCallback
+
+
+@pytest.fixture
+def mock_bot():
+    with patch.object(broadcast, 'bot') as bot:
+        bot.edit_message_text = AsyncMock()
+        bot.send_message = AsyncMock()
+        yield bot
+
+
+def report(**kwargs):
+    return BroadcastReport(job_id=3, admin_id=1, status_message_id=55, total=100, sent=40, failed=5, blocked=5,
+                           elapsed=20, sent_in_run=40, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_progress_edits_status_message(mock_bot):
+    await broadcast.show_broadcast_progress(report())
+
+    kwargs = mock_bot.edit_message_text.call_args.kwargs
+    assert (kwargs['chat_id'], kwargs['message_id']) == (1, 55)
+    assert "50 из 100" in kwargs['text']
+    assert "Осталось: 25 с" in kwargs['text']  # 50 получателей при 2 сообщ./с
+    button = kwargs['reply_markup'].inline_keyboard[0][0]
+    assert button.callback_data == AdminCancelBroadcastCallback(job_id=3).pack()
+
+
+@pytest.mark.asyncio
+async def test_report_replaces_status_message(mock_bot):
+    await broadcast.send_broadcast_report(report(cancelled=True))
+
+    text = mock_bot.edit_message_text.call_args.kwargs['text']
+    assert text.startswith("📬Рассылка остановлена")
+    assert "Не отправлено после остановки: 50" in text
+    mock_bot.send_message.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_report_sent_when_status_message_deleted(mock_bot):
+    mock_bot.edit_message_text.side_effect = TelegramBadRequest(MagicMock(), 'message to edit not found')
+
+    await broadcast.send_broadcast_report(report())
+
+    assert mock_bot.send_message.call_args.kwargs['text'].startswith("📬Рассылка завершена")
+
+
+@pytest.mark.asyncio
+async def test_cancel_button():
+    callback = AsyncMock()
+    callback.message = AsyncMock()
+
+    with patch.object(broadcast, 'broadcaster') as broadcaster:
+        broadcaster.cancel = AsyncMock(return_value=True)
+        await broadcast.cancel_running_broadcast(callback, AdminCancelBroadcastCallback(job_id=3))
+        broadcaster.cancel.assert_awaited_once_with(3)
+        callback.answer.assert_awaited_once_with("Рассылка останавливается")
+
+        # Рассылка уже закончилась: кнопка убирается
+        broadcaster.cancel = AsyncMock(return_value=False)
+        await broadcast.cancel_running_broadcast(callback, AdminCancelBroadcastCallback(job_id=3))
+        callback.message.edit_reply_markup.assert_awaited_once_with(reply_markup=None)
@@ -0,0 +1,129 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from db_handler.catalog import CatalogSnapshot
+from keyboards.callback_data import ThemesPageCallback, ThemeCallback, ExpertCallback
+from handlers.main_panel.callbacks import process_callback_expert_rec, router
+
+THEME_ROWS = [
+    {'theme_id': 2, 'theme_name': 'Математика', 'specific_theme': 'Алгебра'},
+    {'theme_id': 1, 'theme_name': 'Математика', 'specific_theme': 'Геометрия'},
+    {'theme_id': 3, 'theme_name': 'Физика', 'specific_theme': 'Оптика'},
+]
+
+RECOMMENDATION_ROWS = [
+    {'specific_theme': 'Алгебра', 'expert_id': 7, 'expert_name': 'Иванов',
+     'expert_position': 'Профессор', 'book_name': 'Книга 1', 'description': 'Описание 1'},
+    {'specific_theme': 'Алгебра', 'expert_id': 9, 'expert_name': 'Сидоров',
+     'expert_position': 'Доцент', 'book_name': 'Книга 2', 'description': 'Описание 2'},
+]
+
+
+@pytest.fixture
+def mock_db_utils():
+    mock = AsyncMock()
+    mock.get_catalog = AsyncMock(return_value=CatalogSnapshot(1, THEME_ROWS, RECOMMENDATION_ROWS))
+    mock.log_user_activity = AsyncMock()
+    return mock
+
+
+@pytest.fixture
+def mock_callback():
+    callback = AsyncMock()
+    callback.from_user = MagicMock(id=123)
+    callback.message = AsyncMock()
+    return callback
+
+
+def buttons(callback):
+    keyboard = callback.message.edit_text.call_args.kwargs['reply_markup']
+    return [button.callback_data for row in keyboard.inline_keyboard for button in row]
+
+
+@pytest.mark.asyncio
+async def test_themes_keyed_by_theme_id(mock_callback, mock_db_utils):
+    mock_callback.data = ThemesPageCallback(page=0).pack()
+    await process_callback_expert_rec(mock_callback, mock_db_utils)
+
+    data = buttons(mock_callback)
+    assert ThemeCallback(theme_id=2).pack() in data  # Математика представлена своей первой подтемой
+    assert ThemeCallback(theme_id=3).pack() in data
+
+
+@pytest.mark.asyncio
+async def test_subthemes_by_any_theme_id(mock_callback, mock_db_utils):
+    mock_callback.data = ThemeCallback(theme_id=1).pack()
+    await process_callback_expert_rec(mock_callback, mock_db_utils)
+
+    data = buttons(mock_callback)
+    assert ExpertCallback(theme_id=2).pack() in data
+    assert ExpertCallback(theme_id=1).pack() in data
+
+
+@pytest.mark.asyncio
+async def test_expert_navigation_by_expert_id(mock_callback, mock_db_utils):
+    mock_callback.data = ExpertCallback(theme_id=2, expert_id=9).pack()
+    await process_callback_expert_rec(mock_callback, mock_db_utils)
+
+    text = mock_callback.message.edit_text.call_args.args[0]
+    assert 'Сидоров' in text
+    assert ExpertCallback(theme_id=2, expert_id=7).pack() in buttons(mock_callback)
+    mock_db_utils.log_user_activity.assert_awaited_once_with(
+        user_id=123, activity_type='get_expert_recommendation', theme_id=2
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data", [
+    ExpertCallback(theme_id=404).pack(),  # Подборка удалена, пока сообщение было открыто
+    "theme_0",                           # Кнопка старого формата
+    "e2:not-a-number:0:0:0",
+    ExpertCallback(theme_id=2).pack().replace("e2:", "e1:", 1),  # Кнопка прошлой версии формата
+    "t1:0",
+])
+async def test_stale_callback_shows_current_themes(mock_callback, mock_db_utils, data):
+    mock_callback.data = data
+    await process_callback_expert_rec(mock_callback, mock_db_utils)
+
+    mock_callback.answer.assert_awaited()
+    assert "Выберите тему" in mock_callback.message.edit_text.call_args.args[0]
+    mock_db_utils.log_user_activity.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_back_button_returns_to_subthemes_page(mock_callback, mock_db_utils):
+    mock_callback.data = ThemeCallback(theme_id=1, page=0).pack()
+    await process_callback_expert_rec(mock_callback, mock_db_utils)
+    assert ExpertCallback(theme_id=2, subthemes_page=0).pack() in buttons(mock_callback)
+
+    mock_callback.data = ExpertCallback(theme_id=2, expert_id=9, subthemes_page=3).pack()
+    await process_callback_expert_rec(mock_callback, mock_db_utils)
+
+    data = buttons(mock_callback)
+    assert ExpertCallback(theme_id=2, expert_id=7, subthemes_page=3).pack() in data
+    assert ThemeCallback(theme_id=2, page=3).pack() in data
+
+
+@pytest.mark.asyncio
+async def test_stale_callback_with_empty_catalog_answered_once(mock_callback, mock_db_utils):
+    mock_db_utils.get_catalog.return_value = CatalogSnapshot(2, [], [])
+    mock_callback.data = ExpertCallback(theme_id=404).pack()
+
+    await process_callback_expert_rec(mock_callback, mock_db_utils)
+
+    mock_callback.answer.assert_awaited_once_with("⚠️Каталог обновился, выберите тему заново.")
+    assert "Темы отсутствуют" in mock_callback.message.answer.call_args.args[0]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data, handled", [
+    ("t1:0", True),                # Кнопка прошлой версии формата должна получить ответ
+    ("e1:2:0:0", True),
+    (ThemesPageCallback(page=0).pack(), True),
+    ("theme_0", True),
+    ("confirm_broadcast", False),  # Кнопки админ-панели обрабатывает её роутер
+])
+async def test_router_filter(data, handled):
+    (handler,) = router.callback_query.handlers
+    matched, _ = await handler.check(MagicMock(data=data))
+    assert matched is handled
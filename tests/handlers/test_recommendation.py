@@ -0,0 +1,44 @@
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from handlers.main_panel import recommendation
+from recommendation_system.model import RecommendationsNotReady
+
+POPULAR = [{'theme_name': 'Математика', 'specific_theme': 'Алгебра',
+            'experts': [{'expert_name': 'Иванов', 'expert_position': 'Профессор',
+                         'book_name': 'Книга 1', 'description': 'Описание 1'}]}]
+
+
+@pytest.fixture
+def mock_message():
+    message = AsyncMock()
+    message.from_user = MagicMock(id=123)
+    return message
+
+
+@pytest.fixture
+def mock_rec_sys():
+    with patch.object(recommendation, 'rec_sys') as rec_sys, patch.object(recommendation, 'main_kb'):
+        rec_sys.recommend = AsyncMock(side_effect=RecommendationsNotReady)
+        yield rec_sys
+
+
+@pytest.mark.asyncio
+async def test_popular_served_during_warm_up(mock_message, mock_rec_sys):
+    mock_rec_sys.recommend_popular.return_value = POPULAR
+
+    await recommendation.handle_recommendation(mock_message, AsyncMock())
+
+    text = mock_message.answer.call_args.args[0]
+    assert text.startswith("**⏳Персональные рекомендации ещё готовятся")
+    assert "Книга 1" in text
+
+
+@pytest.mark.asyncio
+async def test_loading_message_without_popular(mock_message, mock_rec_sys):
+    mock_rec_sys.recommend_popular.return_value = []
+
+    await recommendation.handle_recommendation(mock_message, AsyncMock())
+
+    mock_message.answer.assert_awaited_once()
+    assert "ещё загружается" in mock_message.answer.call_args.args[0]
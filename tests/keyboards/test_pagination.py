@@ -0,0 +1,80 @@
+import unittest
+
+from aiogram.types import InlineKeyboardButton
+
+from db_handler.catalog import CatalogSnapshot
+from keyboards.callback_data import NoopCallback
+from keyboards.pagination import build_page, cached_page, total_pages, PageCache
+
+
+def item_button(item):
+    return InlineKeyboardButton(text=item, callback_data=f"item_{item}")
+
+
+def page_callback(number):
+    return f"page_{number}"
+
+
+FOOTER = [[InlineKeyboardButton(text="◄ Назад", callback_data="back")]]
+
+
+class TestPagination(unittest.TestCase):
+    def setUp(self):
+        self.items = [f"item{i}" for i in range(12)]
+
+    def rows(self, page):
+        keyboard = build_page(self.items, page, item_button, page_callback, FOOTER)
+        return [[button.callback_data for button in row] for row in keyboard.inline_keyboard]
+
+    def test_total_pages(self):
+        self.assertEqual(total_pages(0), 0)
+        self.assertEqual(total_pages(5), 1)
+        self.assertEqual(total_pages(12), 3)
+
+    def test_first_page(self):
+        self.assertEqual(self.rows(0), [
+            ["item_item0"], ["item_item1"], ["item_item2"], ["item_item3"], ["item_item4"],
+            ["page_1"],
+            [NoopCallback().pack()],
+            ["back"]
+        ])
+
+    def test_middle_and_last_page(self):
+        self.assertEqual(self.rows(1)[5], ["page_0", "page_2"])
+        self.assertEqual(self.rows(2)[:3], [["item_item10"], ["item_item11"], ["page_1"]])
+
+    def test_missing_page(self):
+        self.assertIsNone(build_page(self.items, 3, item_button, page_callback, FOOTER))
+        self.assertIsNone(build_page(self.items, -1, item_button, page_callback, FOOTER))
+        self.assertIsNone(build_page([], 0, item_button, page_callback, FOOTER))
+
+    def test_page_cache_lru(self):
+        cache = PageCache(maxsize=2)
+        calls = []
+
+        def build(key):
+            calls.append(key)
+            return key
+
+        for key in ("a", "b", "a", "c", "b"):
+            cache.get(key, lambda key=key: build(key))
+
+        self.assertEqual(calls, ["a", "b", "c", "b"])  # "b" вытеснен после добавления "c"
+        self.assertEqual((cache.hits, cache.misses), (1, 4))
+
+    def test_cached_page_per_snapshot(self):
+        old, new = CatalogSnapshot(1, [], []), CatalogSnapshot(2, [], [])
+        builds = []
+
+        def build():
+            builds.append(1)
+            return build_page(self.items, 0, item_button, page_callback, FOOTER)
+
+        first = cached_page(old, ("items", 0), build)
+        self.assertIs(cached_page(old, ("items", 0), build), first)
+        self.assertIsNot(cached_page(new, ("items", 0), build), first)
+        self.assertEqual(len(builds), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+import asyncio
+import unittest
+from contextlib import asynccontextmanager
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from db_handler.db_class import Database
+from db_handler.db_utils import DBUtils
+from middlewares.db_session import DBSessionMiddleware
+
+
+class TestDBSessionMiddleware(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.session = MagicMock()
+        self.session.acquire_wait = 0.002
+        self.catalog = MagicMock()
+        self.db = MagicMock()
+        self.bot = MagicMock()
+
+        @asynccontextmanager
+        async def session():
+            yield self.session
+
+        self.db.session = session
+        self.middleware = DBSessionMiddleware(db=self.db, bot=self.bot, catalog=self.catalog)
+
+    async def test_injects_session_bound_db_utils(self):
+        handler = AsyncMock(return_value="handled")
+        data = {}
+
+        result = await self.middleware(handler, MagicMock(), data)
+
+        self.assertEqual(result, "handled")
+        handler.assert_awaited_once()
+        self.assertIsInstance(data['db_utils'], DBUtils)
+        self.assertIs(data['db_utils'].db, self.session)
+        self.assertIs(data['db_utils'].bot, self.bot)
+        self.assertIs(data['db_utils'].catalog, self.catalog)
+
+    async def test_acquire_wait_stats(self):
+        handler = AsyncMock()
+        await self.middleware(handler, MagicMock(), {})
+        await self.middleware(handler, MagicMock(), {})
+
+        self.session.acquire_wait = None  # Апдейт обслужен из кэша, соединение не бралось
+        await self.middleware(handler, MagicMock(), {})
+
+        stats = self.middleware.stats()
+        self.assertEqual(stats['updates'], 2)
+        self.assertEqual(stats['acquire_wait_max_ms'], 2.0)
+        self.assertEqual(stats['acquire_wait_avg_ms'], 2.0)
+
+
+class FakeConnection:
+    """Соединение, каждый запрос которого занимает время: все апдейты успевают взять по соединению"""
+
+    def __init__(self):
+        self.queries = []
+
+    async def run(self, query, result):
+        await asyncio.sleep(0.01)
+        self.queries.append(query)
+        return result
+
+    async def execute(self, query, *args):
+        return await self.run(query, 'OK')
+
+    async def fetch(self, query, *args):
+        return await self.run(query, [])
+
+    async def fetchrow(self, query, *args):
+        # Пользователь без истории просмотров
+        return await self.run(query, {'last_log_id': None})
+
+    async def fetchval(self, query, *args):
+        return await self.run(query, 1)
+
+
+class FakePool:
+    """Пул asyncpg из size соединений: acquire ждёт, пока соединение не вернут"""
+
+    def __init__(self, size: int):
+        self.free = asyncio.Queue()
+        for _ in range(size):
+            self.free.put_nowait(FakeConnection())
+
+    def acquire(self):
+        return FakeAcquire(self)
+
+    async def release(self, conn):
+        self.free.put_nowait(conn)
+
+
+class FakeAcquire:
+    def __init__(self, pool: FakePool):
+        self.pool = pool
+
+    def __await__(self):
+        return self.pool.free.get().__await__()
+
+    async def __aenter__(self):
+        self.conn = await self.pool.free.get()
+        return self.conn
+
+    async def __aexit__(self, *exc):
+        await self.pool.release(self.conn)
+
+
+class TestPoolExhaustion(unittest.IsolatedAsyncioTestCase):
+    """Обработчики, которым кроме соединения апдейта нужна БД, не берут второе соединение из пула"""
+
+    POOL_SIZE = 3
+
+    def setUp(self):
+        self.db = Database()
+        self.db.pool = FakePool(self.POOL_SIZE)
+        self.middleware = DBSessionMiddleware(db=self.db, bot=MagicMock())
+
+    async def updates(self, handler, make_event, data=lambda: {}):
+        # На одно обновление больше, чем соединений: взявшие соединение должны закончить без второго
+        await asyncio.wait_for(asyncio.gather(*(
+            self.middleware(handler, make_event(), data()) for _ in range(self.POOL_SIZE + 1)
+        )), timeout=5)
+        self.assertEqual(self.db.pool.free.qsize(), self.POOL_SIZE)
+
+    async def test_recommendation(self):
+        from handlers.main_panel import recommendation
+
+        def message():
+            event = AsyncMock()
+            event.from_user.id = 123
+            return event
+
+        async def handler(event, data):
+            await recommendation.handle_recommendation(event, data['db_utils'])
+            event.answer.assert_awaited()
+
+        with patch.object(recommendation.rec_sys, 'db', self.db), patch.object(recommendation, 'main_kb'):
+            await self.updates(handler, message)
+
+    async def test_broadcast_confirmation(self):
+        from handlers.admin_panel import broadcast
+        from broadcast_system.engine import BroadcastEngine
+
+        def callback():
+            event = AsyncMock()
+            event.data = "confirm_broadcast"
+            event.from_user.id = 1
+            return event
+
+        def state():
+            fsm = AsyncMock()
+            fsm.get_data.return_value = {'content_type': 'text', 'content_data': {'text': 'Привет'}}
+            return {'state': fsm}
+
+        async def handler(event, data):
+            await broadcast.handle_broadcast_confirmation(event, data['state'], data['db_utils'])
+
+        engine = BroadcastEngine(MagicMock(), self.db)
+        engine.start = MagicMock()
+        with patch.object(broadcast, 'broadcaster', engine), patch.object(broadcast, 'broadcast_progress_keyboard'):
+            await self.updates(handler, callback, state)
+
+        self.assertEqual(engine.start.call_count, self.POOL_SIZE + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+
+from recommendation_system import ann
+
+
+def clustered(n: int, dim: int = 32, clusters: int = 50, seed: int = 0) -> np.ndarray:
+    """Эмбеддинги, сгруппированные вокруг случайных центров, как у похожих подтем"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    points = centers[rng.integers(clusters, size=n)] + 0.3 * rng.standard_normal((n, dim)).astype(np.float32)
+    return points.astype(np.float32)
+
+
+def exact_top(embeddings: np.ndarray, query: np.ndarray, k: int) -> set:
+    scores = embeddings @ query / np.linalg.norm(embeddings, axis=1)
+    return set(np.argsort(-scores)[:k].tolist())
+
+
+class TestIVFIndex(unittest.TestCase):
+    def setUp(self):
+        self.embeddings = clustered(5000)
+        self.norms = np.linalg.norm(self.embeddings, axis=1)
+
+    def test_every_row_in_exactly_one_list(self):
+        index = ann.IVFIndex.build(self.embeddings, self.norms, nlist=64)
+        self.assertEqual(sorted(index.order.tolist()), list(range(len(self.embeddings))))
+        self.assertEqual(index.offsets[-1], len(self.embeddings))
+
+    def test_recall(self):
+        index = ann.IVFIndex.build(self.embeddings, self.norms, nlist=64, nprobe=8)
+        rng = np.random.default_rng(1)
+        recalls = []
+        for row in rng.choice(len(self.embeddings), size=50, replace=False):
+            query = self.embeddings[row] / self.norms[row]
+            found = set(index.search(query, 10).tolist())
+            recalls.append(len(exact_top(self.embeddings, query, 10) & found) / 10)
+        self.assertGreaterEqual(np.mean(recalls), 0.95)
+
+    def test_previous_centroids_reused(self):
+        first = ann.IVFIndex.build(self.embeddings, self.norms, nlist=64)
+        second = ann.build_index('ivf', self.embeddings[:4000], self.norms[:4000], min_rows=1, previous=first)
+        self.assertIs(second.centroids, first.centroids)
+        self.assertEqual(second.offsets[-1], 4000)
+
+
+class TestBuildIndex(unittest.TestCase):
+    def setUp(self):
+        self.embeddings = clustered(2000)
+        self.norms = np.linalg.norm(self.embeddings, axis=1)
+
+    def test_small_catalog_exact(self):
+        self.assertIsNone(ann.build_index('auto', self.embeddings, self.norms, min_rows=5000))
+
+    def test_exact_mode(self):
+        self.assertIsNone(ann.build_index('exact', self.embeddings, self.norms, min_rows=0))
+
+    def test_hnsw_without_library_falls_back_to_ivf(self):
+        hnswlib, ann.hnswlib = ann.hnswlib, None
+        try:
+            index = ann.build_index('hnsw', self.embeddings, self.norms, min_rows=0)
+        finally:
+            ann.hnswlib = hnswlib
+        self.assertEqual(index.kind, 'ivf')
+
+    @unittest.skipIf(ann.hnswlib is None, "hnswlib не установлен")
+    def test_hnsw(self):
+        index = ann.build_index('hnsw', self.embeddings, self.norms, min_rows=0)
+        query = self.embeddings[0] / self.norms[0]
+        self.assertEqual(index.kind, 'hnsw')
+        self.assertGreaterEqual(len(exact_top(self.embeddings, query, 10) & set(index.search(query, 10).tolist())), 9)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+from recommendation_system.cooccurrence import CooccurrenceMatrix
+
+
+def dense_counts(users: np.ndarray, themes: np.ndarray, size: int) -> np.ndarray:
+    """Эталон: C = V.T @ V по плотной бинарной матрице просмотров"""
+    views = np.zeros((users.max() + 1, size), dtype=np.float32)
+    views[users, themes] = 1
+    return views.T @ views
+
+
+class TestCooccurrenceMatrix(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.users = rng.integers(10 ** 9, 10 ** 9 + 300, size=5000)  # Telegram user_id
+        self.themes = rng.integers(1, 200, size=5000)
+
+    def test_incremental_equals_full_build(self):
+        full = CooccurrenceMatrix()
+        full.update(self.users, self.themes, 100)
+
+        incremental = CooccurrenceMatrix()
+        # Части пересекаются: уже учтённые просмотры не считаются повторно
+        self.assertEqual(incremental.update(self.users[:3000], self.themes[:3000], 60), len(
+            set(zip(self.users[:3000].tolist(), self.themes[:3000].tolist()))
+        ))
+        incremental.update(self.users[2000:], self.themes[2000:], 100)
+
+        expected = dense_counts(self.users - 10 ** 9, self.themes, full.counts.shape[0])
+        np.testing.assert_array_equal(full.counts.toarray(), expected)
+        np.testing.assert_array_equal(incremental.counts.toarray(), expected)
+        self.assertEqual(incremental.last_log_id, 100)
+
+    def test_repeated_views_counted_once(self):
+        matrix = CooccurrenceMatrix()
+        matrix.update([1, 1, 2], [5, 6, 5], 3)
+        self.assertEqual(matrix.update([1, 2], [5, 5], 4), 0)
+
+        self.assertEqual(matrix.counts[5, 5], 2)
+        self.assertEqual(matrix.counts[5, 6], 1)
+
+    def test_scores(self):
+        matrix = CooccurrenceMatrix()
+        matrix.update(self.users, self.themes, 100)
+        counts = dense_counts(self.users - 10 ** 9, self.themes, matrix.counts.shape[0])
+
+        history = [1, 2, 2, 3]
+        scores = matrix.scores([history, []], np.array([4, 7, 1000]))
+
+        expected = [np.mean([counts[h, t] / np.sqrt(counts[h, h] * counts[t, t]) for h in (1, 2, 3)]) for t in (4, 7)]
+        np.testing.assert_allclose(scores[0, :2], expected, rtol=1e-5)
+        self.assertEqual(scores[0, 2], 0)  # Подтема без просмотров
+        self.assertFalse(scores[1].any())
+
+    def test_empty(self):
+        matrix = CooccurrenceMatrix()
+        self.assertEqual(matrix.update([], [], 0), 0)
+        self.assertFalse(matrix.scores([[1]], np.array([1, 2])).any())
+
+
+if __name__ == "__main__":
+    unittest.main()
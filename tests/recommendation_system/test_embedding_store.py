@@ -0,0 +1,149 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+
+from recommendation_system.embedding_store import EmbeddingStore, text_hash
+
+
+def fake_embed(texts):
+    """Детерминированный эмбеддинг: длина текста и его первый символ"""
+    return np.array([[len(text), ord(text[0])] for text in texts], dtype=np.float32)
+
+
+class TestEmbeddingStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.store = EmbeddingStore(self.dir.name, "org/model-v1")
+
+    def test_missing_store(self):
+        matrix, hashes = self.store.load()
+        self.assertIsNone(matrix)
+        self.assertEqual(hashes, [])
+
+    def test_roundtrip_memory_mapped(self):
+        hashes = [text_hash("a"), text_hash("bb")]
+        saved = self.store.save(hashes, fake_embed(["a", "bb"]))
+        matrix, loaded_hashes = self.store.load()
+
+        self.assertIsInstance(matrix, np.memmap)
+        self.assertIsInstance(saved, np.memmap)
+        self.assertEqual(loaded_hashes, hashes)
+        np.testing.assert_array_equal(matrix, fake_embed(["a", "bb"]))
+
+    def test_other_model_not_reused(self):
+        self.store.save([text_hash("a")], fake_embed(["a"]))
+        matrix, _ = EmbeddingStore(self.dir.name, "org/model-v2").load()
+        self.assertIsNone(matrix)
+
+    def test_same_size_rewrite_keeps_rows_and_hashes_paired(self):
+        self.store.save([text_hash("a"), text_hash("b")], fake_embed(["a", "b"]))
+        self.store.save([text_hash("cc"), text_hash("d")], fake_embed(["cc", "d"]))
+
+        matrix, hashes = EmbeddingStore(self.dir.name, "org/model-v1").load()
+        self.assertEqual(hashes, [text_hash("cc"), text_hash("d")])
+        np.testing.assert_array_equal(matrix, fake_embed(["cc", "d"]))
+        # Матрица прошлой записи удалена
+        self.assertEqual(len([name for name in os.listdir(self.dir.name) if name.endswith('.npy')]), 1)
+
+    def test_interrupted_save_keeps_previous_store(self):
+        self.store.save([text_hash("a")], fake_embed(["a"]))
+        # Запись прервалась после новой матрицы, до замены индекса
+        np.save(os.path.join(self.dir.name, f"{self.store.slug}.{'0' * 32}.npy"), fake_embed(["bb"]))
+
+        matrix, hashes = self.store.load()
+        self.assertEqual(hashes, [text_hash("a")])
+        np.testing.assert_array_equal(matrix, fake_embed(["a"]))
+
+    def test_other_model_files_kept(self):
+        other = EmbeddingStore(self.dir.name, "org/model-v1.1")
+        other.save([text_hash("a")], fake_embed(["a"]))
+        self.store.save([text_hash("b")], fake_embed(["b"]))
+        self.store.save([text_hash("c")], fake_embed(["c"]))
+
+        self.assertEqual(other.load()[1], [text_hash("a")])
+
+    def test_concurrent_saves_keep_published_matrix(self):
+        # Два воркера обновляют эмбеддинги по одному NOTIFY: запись второго начинается посреди записи первого
+        first_writing, second_started = threading.Event(), threading.Event()
+        original_save = np.save
+
+        def save(f, matrix):
+            if threading.current_thread().name == 'first':
+                first_writing.set()
+                second_started.wait(5)
+            original_save(f, matrix)
+
+        def second():
+            first_writing.wait(5)
+            second_started.set()
+            EmbeddingStore(self.dir.name, "org/model-v1").save([text_hash("b")], fake_embed(["b"]))
+
+        with patch('recommendation_system.embedding_store.np.save', side_effect=save):
+            threads = [
+                threading.Thread(target=self.store.save, args=([text_hash("a")], fake_embed(["a"])), name='first'),
+                threading.Thread(target=second, name='second'),
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+
+        # Индекс ссылается на существующую матрицу: при перезапуске каталог не кодируется заново
+        matrix, hashes = EmbeddingStore(self.dir.name, "org/model-v1").load()
+        self.assertEqual(hashes, [text_hash("b")])
+        np.testing.assert_array_equal(matrix, fake_embed(["b"]))
+        self.assertEqual(len([name for name in os.listdir(self.dir.name) if name.endswith('.npy')]), 1)
+
+    def test_corrupt_index_ignored(self):
+        self.store.save([text_hash("a")], fake_embed(["a"]))
+        with open(self.store.index_path, "w") as f:
+            f.write("{")
+        self.assertIsNone(self.store.load()[0])
+
+
+class TestRecommendationSystemStore(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        patcher = patch('recommendation_system.inference.load_model')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        from recommendation_system.model import RecommendationSystem
+        self.db = MagicMock()
+        self.make = lambda: RecommendationSystem(db=self.db, embeddings_dir=self.dir.name)
+
+    async def load(self, texts):
+        rec_sys = self.make()
+        rec_sys._embed_texts = AsyncMock(side_effect=fake_embed)
+        self.db.fetch = AsyncMock(return_value=[
+            {'theme_id': i + 1, 'specific_theme': text} for i, text in enumerate(texts)
+        ])
+        await rec_sys._load_theme_embeddings()
+        return rec_sys
+
+    async def test_restart_does_not_reencode(self):
+        first = await self.load(["Алгебра", "Оптика"])
+        first._embed_texts.assert_awaited_once_with(["Алгебра", "Оптика"])
+
+        second = await self.load(["Алгебра", "Оптика"])
+        second._embed_texts.assert_not_called()
+        np.testing.assert_array_equal(second.theme_embeddings_cache, fake_embed(["Алгебра", "Оптика"]))
+
+    async def test_only_new_texts_encoded(self):
+        await self.load(["Алгебра", "Оптика"])
+        rec_sys = await self.load(["Оптика", "Механика", "Механика"])
+
+        rec_sys._embed_texts.assert_awaited_once_with(["Механика"])
+        np.testing.assert_array_equal(rec_sys.theme_embeddings_cache,
+                                      fake_embed(["Оптика", "Механика", "Механика"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import threading
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+
+from recommendation_system import inference
+
+
+class TestThreadBackend(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        patcher = patch('recommendation_system.inference.load_model')
+        self.model_cls = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.threads = []
+
+        def encode(texts, show_progress_bar):
+            self.threads.append(threading.current_thread().name)
+            return np.ones((len(texts), 4), dtype=np.float64)
+
+        self.model_cls.return_value.encode.side_effect = encode
+        self.backend = inference.make_backend('thread', 'model', threads=1)
+        self.addCleanup(self.backend.close)
+
+    async def test_encode_on_dedicated_thread_in_batches(self):
+        embeddings = await self.backend.encode([f"Тема {i}" for i in range(40)])
+
+        self.assertEqual(embeddings.shape, (40, 4))
+        self.assertEqual(embeddings.dtype, np.float32)
+        self.assertEqual(len(self.threads), 3)  # Пакеты по 16 текстов
+        self.assertTrue(all(name.startswith('inference') for name in self.threads))
+
+    async def test_dimension(self):
+        self.model_cls.return_value.get_sentence_embedding_dimension.return_value = 512
+        self.assertEqual(await self.backend.dimension(), 512)
+
+
+class TestMakeBackend(unittest.TestCase):
+    def test_process_backend_worker_settings(self):
+        with patch('recommendation_system.inference.ProcessPoolExecutor') as executor:
+            backend = inference.make_backend('process', 'model', threads=3)
+
+        self.assertIsInstance(backend, inference.ProcessBackend)
+        self.assertEqual(executor.call_args.kwargs['initargs'], ('model', 3, False))
+        self.assertEqual(executor.call_args.kwargs['max_workers'], 1)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            inference.make_backend('gpu', 'model')
+
+
+class TestQuantization(unittest.TestCase):
+    def test_linear_layers_quantized(self):
+        import torch
+
+        with patch('sentence_transformers.SentenceTransformer', return_value=torch.nn.Sequential(torch.nn.Linear(8, 4))):
+            model = inference.load_model('model', threads=1, quantize=True)
+
+        self.assertIsInstance(model[0], torch.ao.nn.quantized.dynamic.Linear)
+        self.assertEqual(model(torch.ones(2, 8)).shape, (2, 4))
+
+    def test_separate_store(self):
+        self.assertEqual(inference.store_key('org/model', quantize=False), 'org/model')
+        self.assertNotEqual(inference.store_key('org/model', quantize=True), 'org/model')
+
+
+if __name__ == "__main__":
+    unittest.main()
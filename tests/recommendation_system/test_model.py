@@ -0,0 +1,455 @@
+import asyncio
+import tempfile
+import threading
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import numpy as np
+
+
+def fake_embed(texts):
+    """Детерминированный эмбеддинг: длина текста и его первый символ"""
+    return np.array([[len(text), ord(text[0])] for text in texts], dtype=np.float32)
+
+
+def theme_rows(*themes):
+    return [{'theme_id': theme_id, 'specific_theme': text} for theme_id, text in themes]
+
+
+def context(**fields):
+    """Строка GET_RECOMMENDATION_CONTEXT: подтемы 1 и 3 просмотрены, профиля и ночного пересчёта ещё нет"""
+    row = {
+        'last_log_id': 10, 'seen_theme_ids': [1, 3], 'history_theme_ids': [1, 999],
+        'theme_ids': None, 'vector': None, 'vector_theme_ids': None, 'vector_key': None,
+        'precomputed_theme_ids': None, 'precomputed_log_id': None, 'precomputed_version': None
+    }
+    row.update(fields)
+    return row
+
+
+class TestIncrementalRefresh(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        patcher = patch('recommendation_system.inference.load_model')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        from recommendation_system.model import RecommendationSystem
+        self.db = MagicMock()
+        self.db.fetch = AsyncMock(return_value=theme_rows((1, "Алгебра"), (2, "Оптика"), (3, "Механика")))
+        self.rec_sys = RecommendationSystem(db=self.db, embeddings_dir=self.dir.name)
+        self.rec_sys._embed_texts = AsyncMock(side_effect=fake_embed)
+
+    async def test_loaded_once_until_invalidated(self):
+        await self.rec_sys._load_theme_embeddings()
+        await self.rec_sys._load_theme_embeddings()
+
+        self.db.fetch.assert_awaited_once()
+        self.rec_sys._embed_texts.assert_awaited_once()
+
+    async def test_refresh_embeds_new_and_drops_removed(self):
+        await self.rec_sys._load_theme_embeddings()
+        self.rec_sys._embed_texts.reset_mock()
+
+        self.db.fetch.return_value = theme_rows((1, "Алгебра"), (3, "Механика"), (4, "Топология"))
+        self.rec_sys.invalidate(5)
+        await self.rec_sys._load_theme_embeddings()
+
+        self.rec_sys._embed_texts.assert_awaited_once_with(["Топология"])
+        self.assertEqual(self.rec_sys.theme_ids.tolist(), [1, 3, 4])
+        self.assertEqual(self.rec_sys._rows_of(self.rec_sys.theme_ids, [4, 2, 1, 4]).tolist(), [2, 0, 2])
+        np.testing.assert_array_equal(self.rec_sys.theme_embeddings_cache,
+                                      fake_embed(["Алгебра", "Механика", "Топология"]))
+
+    async def test_store_written_off_event_loop(self):
+        save = self.rec_sys.store.save
+        threads = []
+
+        def record_thread(hashes, matrix):
+            threads.append(threading.current_thread())
+            return save(hashes, matrix)
+
+        with patch.object(self.rec_sys.store, 'save', side_effect=record_thread):
+            await self.rec_sys._load_theme_embeddings()
+
+        # Запись матрицы на сотни мегабайт не останавливает обработку других апдейтов
+        self.assertEqual(len(threads), 1)
+        self.assertIsNot(threads[0], threading.current_thread())
+        self.assertEqual(self.rec_sys.theme_ids.tolist(), [1, 2, 3])
+
+    async def test_refresh_without_new_themes_does_not_encode(self):
+        await self.rec_sys._load_theme_embeddings()
+        self.rec_sys._embed_texts.reset_mock()
+
+        self.db.fetch.return_value = theme_rows((2, "Оптика"))
+        self.rec_sys.invalidate()
+        await self.rec_sys._load_theme_embeddings()
+
+        self.rec_sys._embed_texts.assert_not_called()
+        self.assertEqual(self.rec_sys.theme_ids.tolist(), [2])
+        np.testing.assert_array_equal(self.rec_sys.theme_embeddings_cache, fake_embed(["Оптика"]))
+
+    async def test_compact_matrix_refreshed_from_store(self):
+        self.rec_sys.compact = True
+        await self.rec_sys._load_theme_embeddings()
+        self.assertEqual(self.rec_sys.theme_embeddings_cache.dtype, np.float16)
+        self.assertEqual(self.rec_sys.theme_ids.dtype, np.int32)
+        self.assertEqual(self.rec_sys.specific_themes, [])
+
+        self.db.fetch.return_value = theme_rows((1, "Алгебра"), (4, "Топология"))
+        self.rec_sys.invalidate()
+        await self.rec_sys._load_theme_embeddings()
+
+        # Строки float32-хранилища переиспользуются без округления до float16
+        stored, _ = self.rec_sys.store.load()
+        np.testing.assert_array_equal(stored, fake_embed(["Алгебра", "Топология"]))
+        self.assertEqual(self.rec_sys.memory_usage()['embeddings'], 2 * 2 * 2)
+
+    async def test_previous_catalog_served_during_refresh(self):
+        await self.rec_sys._load_theme_embeddings()
+        self.rec_sys.invalidate()
+
+        async with self.rec_sys._lock:
+            await self.rec_sys._load_theme_embeddings()
+
+        self.db.fetch.assert_awaited_once()
+        self.assertEqual(len(self.rec_sys.theme_ids), 3)
+
+    async def test_known_version_ignored(self):
+        self.rec_sys.invalidate(5)
+        await self.rec_sys._load_theme_embeddings()
+        self.rec_sys.invalidate(3)
+        await self.rec_sys._load_theme_embeddings()
+
+        self.db.fetch.assert_awaited_once()
+
+
+class TestWarmUp(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        from recommendation_system import model
+        self.model = model
+        self.db = MagicMock()
+        self.db.fetch = AsyncMock(return_value=theme_rows((1, "Алгебра"), (2, "Оптика")))
+        self.db.fetchrow = AsyncMock(return_value=context())  # У пользователя есть история
+
+    def make(self):
+        rec_sys = self.model.RecommendationSystem(db=self.db, embeddings_dir=self.dir.name)
+        self.addCleanup(rec_sys.close)
+        rec_sys._embed_texts = AsyncMock(side_effect=fake_embed)
+
+        # Модель «загружается», пока тест не разрешит
+        self.loaded = asyncio.Event()
+        rec_sys.inference = MagicMock(ready=False)
+
+        async def load():
+            await self.loaded.wait()
+            rec_sys.inference.ready = True
+
+        rec_sys.inference.load = load
+        return rec_sys
+
+    async def test_stored_themes_served_until_model_loaded(self):
+        await self.make()._load_theme_embeddings()  # Предыдущий запуск сохранил эмбеддинги двух тем
+
+        self.db.fetch.return_value = theme_rows((1, "Алгебра"), (2, "Оптика"), (3, "Механика"))
+        rec_sys = self.make()
+        rec_sys.start_warm_up()
+        await rec_sys._load_theme_embeddings()
+
+        rec_sys._embed_texts.assert_not_called()
+        self.assertEqual(rec_sys.theme_ids.tolist(), [1, 2])
+
+        self.loaded.set()
+        await rec_sys._warm_up_task
+
+        rec_sys._embed_texts.assert_awaited_once_with(["Механика"])
+        self.assertEqual(rec_sys.theme_ids.tolist(), [1, 2, 3])
+
+    async def test_not_ready_without_store(self):
+        rec_sys = self.make()
+        rec_sys.start_warm_up()
+
+        with self.assertRaises(self.model.RecommendationsNotReady):
+            await rec_sys.recommend(123)
+
+        self.loaded.set()
+        await rec_sys._warm_up_task
+        self.assertEqual(rec_sys.theme_ids.tolist(), [1, 2])
+
+
+class CatalogCase(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+        patcher = patch('recommendation_system.inference.load_model')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        from recommendation_system import model
+        self.model = model
+
+        # Темы 1..20 на полуокружности: чем ближе номер, тем ближе эмбеддинги
+        angles = np.linspace(0, np.pi, 20, dtype=np.float32)
+        vectors = np.stack([np.cos(angles), np.sin(angles)], axis=1)
+        self.responses = {
+            model.queries.GET_THEME_TEXTS: theme_rows(*((i + 1, f"Тема {i + 1}") for i in range(20))),
+        }
+
+        async def fetch(query, *args):
+            if query == model.queries.GET_RECOMMENDATION_DETAILS:
+                self.detail_ids = args[0]
+                return [
+                    {'theme_id': theme_id, 'theme_name': 'Тема', 'specific_theme': f"Тема {theme_id}",
+                     'expert_name': 'Эксперт', 'expert_position': 'Доцент',
+                     'book_name': f"Книга {theme_id}.{n}", 'description': ''}
+                    for theme_id in sorted(args[0]) for n in range(2)
+                ]
+            return self.responses[query]
+
+        self.db = MagicMock()
+        self.db.fetch = AsyncMock(side_effect=fetch)
+        self.context = context()
+        self.rows = {model.queries.GET_RECOMMENDATION_CONTEXT: self.context}
+        self.db.fetchrow = AsyncMock(side_effect=lambda query, *args: self.rows.get(query))
+        self.db.fetchval = AsyncMock(return_value=10)  # Последний log_id в логах
+        self.db.execute = AsyncMock()
+        self.rec_sys = model.RecommendationSystem(db=self.db, embeddings_dir=self.dir.name)
+        self.rec_sys._embed_texts = AsyncMock(return_value=vectors)
+
+
+class TestRecommend(CatalogCase):
+    async def test_nearest_unseen_themes(self):
+        result = await self.rec_sys.recommend(123, top_k=100)
+
+        self.assertEqual(self.detail_ids, [2, 4, 5, 6, 7, 8, 9, 10, 11, 12])
+        self.assertEqual(sum(len(theme['experts']) for theme in result), 20)
+        for theme in result:
+            theme_id = int(theme['specific_theme'].split()[1])
+            self.assertTrue(all(book['book_name'].startswith(f"Книга {theme_id}.") for book in theme['experts']))
+
+    async def test_compact_mode_same_candidates(self):
+        self.rec_sys.compact = True
+        with patch.object(self.model, 'SCORE_CHUNK_ROWS', 7):  # float16 строки переводятся порциями
+            await self.rec_sys.recommend(123)
+
+        self.assertEqual(self.detail_ids, [2, 4, 5, 6, 7, 8, 9, 10, 11, 12])
+
+    async def test_ann_index_narrows_candidates(self):
+        await self.rec_sys._load_theme_embeddings()
+        self.rec_sys.ann_index = MagicMock()
+        self.rec_sys.ann_index.search.return_value = np.array([5, 0, 1, 2])  # Строки тем 6, 1, 2, 3
+
+        await self.rec_sys.recommend(123)
+
+        self.assertEqual(self.rec_sys.ann_index.search.call_args.args[1], 12)  # 10 кандидатов + 2 просмотренные
+        self.assertEqual(self.detail_ids, [2, 6])
+
+    async def test_top_k_books(self):
+        result = await self.rec_sys.recommend(123)
+        self.assertEqual(sum(len(theme['experts']) for theme in result), 5)
+
+    async def test_everything_seen(self):
+        self.context['seen_theme_ids'] = list(range(1, 21))
+        self.assertEqual(await self.rec_sys.recommend(123), [])
+
+    async def test_no_history(self):
+        self.context['history_theme_ids'] = [999]
+        self.assertEqual(await self.rec_sys.recommend(123), [])
+
+    async def test_never_viewed_skips_queries(self):
+        self.context['last_log_id'] = None
+        self.assertIsNone(await self.rec_sys.recommend(123))
+        self.db.fetch.assert_not_awaited()  # Даже эмбеддинги тем не загружаются
+
+    def detail_queries(self):
+        return [call for call in self.db.fetch.await_args_list
+                if call.args[0] == self.model.queries.GET_RECOMMENDATION_DETAILS]
+
+    async def test_candidates_cached_until_new_view(self):
+        await self.rec_sys.recommend(123)
+        await self.rec_sys.recommend(123)
+        self.assertEqual(len(self.detail_queries()), 1)
+        self.assertEqual((self.rec_sys.result_cache.hits, self.rec_sys.result_cache.misses), (1, 1))
+
+        self.context['last_log_id'] = 11
+        await self.rec_sys.recommend(123)
+        self.assertEqual(len(self.detail_queries()), 2)
+
+    async def test_single_query_before_search(self):
+        await self.rec_sys.recommend(123)
+
+        self.assertEqual([call.args[0] for call in self.db.fetchrow.await_args_list],
+                         [self.model.queries.GET_RECOMMENDATION_CONTEXT])
+        self.assertEqual([call.args[0] for call in self.db.fetch.await_args_list],
+                         [self.model.queries.GET_THEME_TEXTS, self.model.queries.GET_RECOMMENDATION_DETAILS])
+        self.assertEqual(set(self.rec_sys.timings.summary()), {'total', 'context', 'embeddings', 'search', 'details'})
+
+    async def test_catalog_change_invalidates_candidates(self):
+        await self.rec_sys.recommend(123)
+        self.rec_sys.invalidate(7)
+        await self.rec_sys.recommend(123)
+        self.assertEqual(len(self.detail_queries()), 2)
+
+
+class TestPopular(CatalogCase):
+    async def test_popular_books_for_user_without_history(self):
+        self.responses[self.model.queries.GET_POPULAR_THEMES] = [{'theme_id': 7}, {'theme_id': 3}]
+        self.assertEqual(self.rec_sys.recommend_popular(), [])
+
+        self.assertEqual(await self.rec_sys.refresh_popular(), 2)
+        query, half_life, window, limit = self.db.fetch.await_args_list[0].args
+        self.assertEqual((half_life, limit), (self.model.POPULAR_HALF_LIFE_DAYS * 86400, self.model.POPULAR_THEMES))
+
+        result = self.rec_sys.recommend_popular(top_k=100)
+        self.assertEqual(sorted(theme['specific_theme'] for theme in result), ["Тема 3", "Тема 7"])
+        self.assertEqual(sum(len(theme['experts']) for theme in result), 4)
+
+    async def test_served_during_warm_up(self):
+        self.responses[self.model.queries.GET_POPULAR_THEMES] = [{'theme_id': 7}]
+        await self.rec_sys.refresh_popular()
+        # Эмбеддинги и модель не нужны: загрузка тем упала бы с RecommendationsNotReady
+        self.rec_sys._load_theme_embeddings = AsyncMock(side_effect=self.model.RecommendationsNotReady)
+        self.context['last_log_id'] = None
+
+        self.assertIsNone(await self.rec_sys.recommend(123))
+        self.assertEqual(len(self.rec_sys.recommend_popular(top_k=1)), 1)
+
+    async def test_seen_themes_excluded(self):
+        self.responses[self.model.queries.GET_POPULAR_THEMES] = [{'theme_id': 7}, {'theme_id': 3}]
+        await self.rec_sys.refresh_popular()
+
+        result = self.rec_sys.recommend_popular(top_k=100, exclude=[3])
+        self.assertEqual([theme['specific_theme'] for theme in result], ["Тема 7"])
+
+    async def test_user_who_saw_all_candidates(self):
+        self.responses[self.model.queries.GET_POPULAR_THEMES] = [{'theme_id': 7}, {'theme_id': 3}]
+        await self.rec_sys.refresh_popular()
+        # Все темы, близкие к истории, просмотрены: популярные, кроме просмотренной темы 3
+        self.rec_sys._candidate_theme_ids = AsyncMock(return_value=[])
+
+        result = await self.rec_sys.recommend(123, top_k=100)
+        self.assertEqual([theme['specific_theme'] for theme in result], ["Тема 7"])
+
+
+class TestHybrid(CatalogCase):
+    def setUp(self):
+        super().setUp()
+        self.rec_sys.cf_weight = 0.9
+        # Смотревшие подтему 1 смотрели и подтему 20, далёкую по тексту
+        self.rows[self.model.queries.GET_THEME_VIEWS_SINCE] = {
+            'user_ids': [1, 1, 2, 2, 3, 3, 123, 123], 'theme_ids': [1, 20, 1, 20, 3, 4, 1, 3]
+        }
+
+    async def test_co_viewed_theme_ranked_first(self):
+        await self.rec_sys.refresh_cooccurrence()
+        self.assertEqual(self.rec_sys.cooccurrence.last_log_id, 10)
+
+        self.assertEqual(await self.rec_sys._candidate_theme_ids(123), [4, 20, 2, 5, 6, 7, 8, 9, 10, 11])
+
+    async def test_stale_matrix_refreshed_in_background(self):
+        await self.rec_sys._candidate_theme_ids(123)
+        await self.rec_sys._cf_task
+
+        self.db.fetchrow.assert_any_await(self.model.queries.GET_THEME_VIEWS_SINCE, 0, 10)
+        self.assertEqual(self.rec_sys.cooccurrence.counts[1, 20], 2)
+
+
+class TestUserProfile(CatalogCase):
+    def set_profile(self, vector_key):
+        vector = self.vectors[0].astype(np.float16).tobytes()
+        self.context.update(theme_ids=[1], vector=vector, vector_theme_ids=[1], vector_key=vector_key,
+                            history_theme_ids=None)
+
+    async def asyncSetUp(self):
+        self.vectors = self.rec_sys._embed_texts.return_value
+        await self.rec_sys._load_theme_embeddings()
+        self.key = f"{self.rec_sys.store.model_name}@{self.rec_sys.catalog_version}"
+
+    async def recommend(self):
+        await self.rec_sys.recommend(123)
+        await asyncio.gather(*self.rec_sys._profile_writes)  # Профиль сохраняется в фоне
+
+    async def test_stored_vector_used(self):
+        self.set_profile(self.key)
+
+        await self.recommend()
+
+        self.db.execute.assert_not_called()
+        self.assertEqual(self.detail_ids, [2, 4, 5, 6, 7, 8, 9, 10, 11, 12])
+
+    async def test_vector_recomputed_after_catalog_change(self):
+        self.set_profile("old@0")
+
+        await self.recommend()
+
+        query, user_id, vector, theme_ids, key = self.db.execute.await_args.args
+        self.assertEqual((query, user_id, theme_ids, key), (self.model.queries.SAVE_PROFILE_VECTOR, 123, [1], self.key))
+        np.testing.assert_allclose(np.frombuffer(vector, dtype=np.float16), self.vectors[0], atol=1e-3)
+
+    async def test_profile_created_from_history(self):
+        await self.recommend()
+
+        query, user_id, theme_ids, vector, key = self.db.execute.await_args.args
+        self.assertEqual((query, user_id, theme_ids, key), (self.model.queries.CREATE_USER_PROFILE, 123, [1, 999], self.key))
+
+
+class TestPrecompute(CatalogCase):
+    def setUp(self):
+        super().setUp()
+        self.saved = []
+        conn = MagicMock()
+        conn.executemany = AsyncMock(side_effect=lambda query, records: self.saved.extend(records))
+        self.db.acquire.return_value.__aenter__ = AsyncMock(return_value=conn)
+        self.db.acquire.return_value.__aexit__ = AsyncMock(return_value=False)
+
+        self.responses[self.model.queries.GET_ACTIVE_PROFILES_CHUNK] = [
+            {'user_id': 123, 'theme_ids': [1, 999], 'last_log_id': 10, 'seen_theme_ids': [1, 3]},
+            {'user_id': 124, 'theme_ids': [20], 'last_log_id': 15, 'seen_theme_ids': [20]},
+            {'user_id': 125, 'theme_ids': [999], 'last_log_id': 16, 'seen_theme_ids': [999]},
+        ]
+
+    async def test_batch_matches_on_demand(self):
+        self.assertEqual(await self.rec_sys.precompute(chunk_size=10), 2)
+
+        self.assertEqual(self.saved, [
+            (123, [2, 4, 5, 6, 7, 8, 9, 10, 11, 12], 10, 0),
+            (124, [19, 18, 17, 16, 15, 14, 13, 12, 11, 10], 15, 0),
+        ])
+        self.assertEqual(await self.rec_sys._candidate_theme_ids(123), self.saved[0][1])
+
+    async def test_batch_blends_co_occurrence(self):
+        self.rec_sys.cf_weight = 0.9
+        self.rows[self.model.queries.GET_THEME_VIEWS_SINCE] = {
+            'user_ids': [1, 1, 2, 2, 3, 3], 'theme_ids': [1, 20, 1, 20, 3, 4]
+        }
+
+        await self.rec_sys.precompute(chunk_size=10)
+
+        self.assertEqual(self.saved[0][1][:3], [4, 20, 2])
+        self.assertEqual(await self.rec_sys._candidate_theme_ids(123), self.saved[0][1])
+
+    async def test_fresh_batch_served_without_search(self):
+        self.context.update(precomputed_theme_ids=[7, 8], precomputed_log_id=10, precomputed_version=0)
+        self.rec_sys._cos_sim = AsyncMock()
+
+        await self.rec_sys.recommend(123)
+
+        self.rec_sys._cos_sim.assert_not_called()
+        self.assertEqual(self.detail_ids, [7, 8])
+
+    async def test_user_active_since_batch_computed_on_demand(self):
+        self.context.update(precomputed_theme_ids=[7, 8], precomputed_log_id=9, precomputed_version=0)
+
+        await self.rec_sys.recommend(123)
+
+        self.assertEqual(self.detail_ids, [2, 4, 5, 6, 7, 8, 9, 10, 11, 12])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+import unittest
+from unittest.mock import patch
+
+from recommendation_system.result_cache import ResultCache
+
+
+class TestResultCache(unittest.TestCase):
+    def test_hit_only_for_same_key(self):
+        cache = ResultCache()
+        cache.put(1, (10, 3), 'candidates')
+
+        self.assertEqual(cache.get(1, (10, 3)), 'candidates')
+        self.assertIsNone(cache.get(1, (11, 3)))  # Новый просмотр
+        self.assertIsNone(cache.get(1, (10, 3)))  # Устаревшая запись удалена
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        self.assertAlmostEqual(cache.hit_rate, 1 / 3)
+
+    def test_ttl(self):
+        cache = ResultCache(ttl=60)
+        with patch('recommendation_system.result_cache.time.monotonic', return_value=100.0):
+            cache.put(1, 'key', 'candidates')
+        with patch('recommendation_system.result_cache.time.monotonic', return_value=159.0):
+            self.assertEqual(cache.get(1, 'key'), 'candidates')
+        with patch('recommendation_system.result_cache.time.monotonic', return_value=161.0):
+            self.assertIsNone(cache.get(1, 'key'))
+
+    def test_least_recently_used_evicted(self):
+        cache = ResultCache(maxsize=2)
+        cache.put(1, 'key', 'a')
+        cache.put(2, 'key', 'b')
+        cache.get(1, 'key')
+        cache.put(3, 'key', 'c')
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get(2, 'key'))
+        self.assertEqual(cache.get(1, 'key'), 'a')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import unittest
+from unittest.mock import patch
+
+from recommendation_system.timings import PhaseTimings
+
+
+class TestPhaseTimings(unittest.TestCase):
+    def test_summary_in_milliseconds(self):
+        timings = PhaseTimings()
+        for ms in range(1, 101):
+            timings.record('search', ms / 1000)
+
+        summary = timings.summary()['search']
+        self.assertEqual(summary['count'], 100)
+        self.assertAlmostEqual(summary['p50'], 50.5)
+        self.assertAlmostEqual(summary['p99'], 99.01)
+
+    def test_window_keeps_recent_samples(self):
+        timings = PhaseTimings(window=2)
+        for seconds in (1.0, 0.002, 0.004):
+            timings.record('details', seconds)
+        self.assertAlmostEqual(timings.summary()['details']['p50'], 3.0)
+
+    def test_measure_records_on_error(self):
+        timings = PhaseTimings()
+        with patch('recommendation_system.timings.time.perf_counter', side_effect=[10.0, 10.25]):
+            with self.assertRaises(ValueError):
+                with timings.measure('context'):
+                    raise ValueError()
+        self.assertAlmostEqual(timings.summary()['context']['p50'], 250.0)
+
+
+if __name__ == "__main__":
+    unittest.main()